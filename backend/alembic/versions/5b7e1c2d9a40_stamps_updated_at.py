@@ -0,0 +1,27 @@
+"""stamps updated_at
+
+Revision ID: 5b7e1c2d9a40
+Revises: 2c299a8d9649
+Create Date: 2026-10-18 14:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e1c2d9a40'
+down_revision: Union[str, None] = '2c299a8d9649'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Существующие марки получают время применения миграции
+    op.add_column('stamps', sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('stamps', 'updated_at')
@@ -0,0 +1,44 @@
+"""leaderboard totals
+
+Revision ID: 8d3f6a1b2c57
+Revises: 5b7e1c2d9a40
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f6a1b2c57'
+down_revision: Union[str, None] = '5b7e1c2d9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('collections', sa.Column('total_cost', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('collectors', sa.Column('total_value', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_collections_total_cost'), 'collections', ['total_cost'], unique=False)
+    op.create_index(op.f('ix_collectors_total_value'), 'collectors', ['total_value'], unique=False)
+    op.create_index(op.f('ix_stamps_cost'), 'stamps', ['cost'], unique=False)
+
+    # Бэкфилл сумм (то же делает python -m scripts.rebuild_leaderboards)
+    op.execute(
+        "UPDATE collections SET total_cost = "
+        "(SELECT COALESCE(SUM(stamps.cost), 0) FROM stamps WHERE stamps.collection_id = collections.id)"
+    )
+    op.execute(
+        "UPDATE collectors SET total_value = "
+        "(SELECT COALESCE(SUM(collections.total_cost), 0) FROM collections WHERE collections.collector_id = collectors.user_id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stamps_cost'), table_name='stamps')
+    op.drop_index(op.f('ix_collectors_total_value'), table_name='collectors')
+    op.drop_index(op.f('ix_collections_total_cost'), table_name='collections')
+    op.drop_column('collectors', 'total_value')
+    op.drop_column('collections', 'total_cost')
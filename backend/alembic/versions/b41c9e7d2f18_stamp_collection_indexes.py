@@ -0,0 +1,49 @@
+"""stamp and collection indexes
+
+Revision ID: b41c9e7d2f18
+Revises: 8d3f6a1b2c57
+Create Date: 2026-10-18 15:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41c9e7d2f18'
+down_revision: Union[str, None] = '8d3f6a1b2c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Совпадает с RARE_STAMP_PREDICATE в app/models/stamp.py
+RARE_STAMP_PREDICATE = "cost > 1000"
+
+INDEXES = (
+    ('ix_stamps_collection_id_cost', 'stamps', ['collection_id', 'cost'], {}),
+    ('ix_stamps_year', 'stamps', ['year'], {}),
+    ('ix_stamps_country', 'stamps', ['country'], {}),
+    ('ix_stamps_topic', 'stamps', ['topic'], {}),
+    ('ix_collections_collector_id', 'collections', ['collector_id'], {}),
+    ('ix_stamps_rare', 'stamps', ['collection_id'], {
+        'postgresql_where': sa.text(RARE_STAMP_PREDICATE),
+        'sqlite_where': sa.text(RARE_STAMP_PREDICATE),
+    }),
+)
+
+
+def upgrade() -> None:
+    # На Postgres индексы строятся CONCURRENTLY, чтобы не блокировать запись в таблицы;
+    # такой CREATE INDEX нельзя выполнять внутри транзакции
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=concurrently, **options)
+
+
+def downgrade() -> None:
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=concurrently)
@@ -0,0 +1,51 @@
+"""search indexes
+
+Revision ID: c7a2e5f90d31
+Revises: b41c9e7d2f18
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a2e5f90d31'
+down_revision: Union[str, None] = 'b41c9e7d2f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Совпадает с STAMP_SEARCH_COLUMNS / COLLECTION_SEARCH_COLUMNS в моделях
+STAMPS_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(serial_number, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(topic, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(country, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(features, '')), 'C')"
+)
+COLLECTIONS_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'B')"
+)
+
+
+def upgrade() -> None:
+    # Поиск на SQLite (тесты) строится из моделей через FTS5, миграция нужна только для Postgres
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, vector in (('stamps', STAMPS_VECTOR), ('collections', COLLECTIONS_VECTOR)):
+        op.execute(f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED")
+        op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)")
+        op.execute(f"CREATE INDEX ix_{table}_name_trgm ON {table} USING gin (name gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('collections', 'stamps'):
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_name_trgm")
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_search_vector")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,34 @@
+"""media blobs
+
+Revision ID: e5b8d1f4a6c3
+Revises: c7a2e5f90d31
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b8d1f4a6c3'
+down_revision: Union[str, None] = 'c7a2e5f90d31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Уже загруженные файлы остаются на прежних путях; сюда попадают только новые загрузки
+    op.create_table(
+        'media_blobs',
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('extension', sa.String(length=10), nullable=False),
+        sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('digest'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('media_blobs')
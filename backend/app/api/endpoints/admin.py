@@ -1,19 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Header
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, db_endpoint, get_engines_pool_stats
 from app.models.user import User
 from app.models.collector import Collector
-from jose import JWTError, jwt
-
-SECRET_KEY = "АФК ЛЕГЕНДА ДОТЫ"
-ALGORITHM = "HS256"
+from app.schemas.media import media_url
+from app.core.security import decode_access_token
+from jose import JWTError
 
 router = APIRouter()
 
 def get_payload_from_access_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        # Токен уже проверен middleware, поэтому claims берутся из кэша
+        return decode_access_token(token)
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
@@ -26,7 +25,8 @@ def verify_admin(db: Session, token: str):
     return user
 
 @router.get("/users")
-async def get_users_list(authorization: str = Header(...), db: Session = Depends(get_db)):
+@db_endpoint
+def get_users_list(authorization: str = Header(...), db: Session = Depends(get_db)):
     token = authorization.split(" ")[1] if authorization else ""
     verify_admin(db, token)
     users = db.query(User).all()
@@ -41,7 +41,8 @@ async def get_users_list(authorization: str = Header(...), db: Session = Depends
     return result
 
 @router.get("/collectors")
-async def get_collectors_list(authorization: str = Header(...), db: Session = Depends(get_db)):
+@db_endpoint
+def get_collectors_list(authorization: str = Header(...), db: Session = Depends(get_db)):
     token = authorization.split(" ")[1] if authorization else ""
     verify_admin(db, token)
     collectors = db.query(Collector).all()
@@ -50,7 +51,7 @@ async def get_collectors_list(authorization: str = Header(...), db: Session = De
         result.append({
             "id": collector.user_id,
             "username": collector.user.username,
-            "avatar_url": f"http://localhost:8000{collector.avatar_url}",
+            "avatar_url": media_url(collector.avatar_url),
             "country": collector.country,
             "phone_number": collector.phone_number,
             "first_name": collector.first_name,
@@ -59,3 +60,11 @@ async def get_collectors_list(authorization: str = Header(...), db: Session = De
             "email": collector.user.email
         })
     return result
+
+@router.get("/pool")
+@db_endpoint
+def get_pool_stats(authorization: str = Header(...), db: Session = Depends(get_db)):
+    # Статистика пулов соединений: занятые соединения, overflow и время ожидания
+    token = authorization.split(" ")[1] if authorization else ""
+    verify_admin(db, token)
+    return get_engines_pool_stats()
@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Depends, Response, Request
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, db_endpoint
 from app.models.user import User
+from app.models.media import media_garbage
 
 router = APIRouter()
 
 @router.delete("/delete")
-async def delete(response: Response, request: Request, db: Session = Depends(get_db)):
-    return User.delete(db, response, request)
+@db_endpoint
+def delete(
+    response: Response,
+    request: Request,
+    garbage: list = Depends(media_garbage),
+    db: Session = Depends(get_db),
+):
+    return User.delete(db, response, request, garbage)
     
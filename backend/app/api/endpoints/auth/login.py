@@ -8,5 +8,6 @@ router = APIRouter()
 
 @router.post("/login")
 async def login(response: Response, user: UserLoginWithPasswordValidation, db: Session = Depends(get_db)):
-    return User.login(db, response, user)
+    # Не db_endpoint: Argon2 считается в своём пуле между обращениями к БД
+    return await User.login(db, response, user)
     
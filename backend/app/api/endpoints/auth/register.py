@@ -8,4 +8,5 @@ router = APIRouter()
 
 @router.post("/register")
 async def register(response: Response, user: UserCreateWithPasswordValidation, db: Session = Depends(get_db)):
-    return User.register(db, response, user)
\ No newline at end of file
+    # Не db_endpoint: Argon2 считается в своём пуле между обращениями к БД
+    return await User.register(db, response, user)
\ No newline at end of file
@@ -1,60 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Form
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from sqlalchemy import func, distinct
+from app.core.database import get_db, db_endpoint
 from app.models.collector import Collector
 from app.models.collection import Collection
+from app.models.stamp import Stamp, rarity_label
 from app.core.security import get_payload_from_refresh_token
-import os
-import shutil
+from app.core.cache import invalidate_tags, STAMPS, COLLECTIONS
+from app.core.uploads import DEFAULT_IMAGE_URL, StagedUpload, image_upload
+from app.models.media import MediaBlob, media_garbage
+from app.schemas.collection import CollectionOut, CollectionWithCost, CollectionList
+from app.schemas.collector import CollectorCollections
+from app.schemas.media import media_url, large_url, thumbnail_url
 
 router = APIRouter()
-AVATAR_UPLOAD_DIR = "static/collections"
 
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.core.database import get_db
-from app.models.collector import Collector
-from app.models.collection import Collection
-from app.models.stamp import Stamp
-from app.core.security import get_payload_from_refresh_token
-import os
-import shutil
-
-router = APIRouter()
-AVATAR_UPLOAD_DIR = "static/collections"
-
-@router.get("/top_expensive")
-async def get_top_expensive_collections(db: Session = Depends(get_db)):
-    collections = (
-        db.query(
-            Collection,
-            func.coalesce(func.sum(func.coalesce(Stamp.cost, 0)), 0).label("total_cost")
-        )
-        .outerjoin(Stamp, Stamp.collection_id == Collection.id)
-        .group_by(Collection.id)
-        .order_by(func.coalesce(func.sum(func.coalesce(Stamp.cost, 0)), 0).desc())
-        .limit(2)
-        .all()
-    )
-    result = []
-    for collection, total_cost in collections:
-        result.append({
-            "id": collection.id,
-            "collector_id": collection.collector_id,
-            "name": collection.name,
-            "description": collection.description,
-            "photo_url": f"http://localhost:8000{collection.photo_url}",
-            "total_cost": total_cost
-        })
-    return result
+@router.get("/top_expensive", response_model=list[CollectionWithCost])
+@db_endpoint
+def get_top_expensive_collections(db: Session = Depends(get_db)):
+    # Стоимость хранится в collections.total_cost: чтение по индексу вместо SUM по всем маркам
+    collections = db.query(Collection).order_by(Collection.total_cost.desc()).limit(2).all()
+    return [CollectionWithCost.model_validate(collection) for collection in collections]
 
 @router.post("/create")
-async def create_collection(
+@db_endpoint
+def create_collection(
     request: Request,
     name: str = Form(...),
     description: str = Form(...),
-    image: UploadFile = File(None),
+    image: StagedUpload = Depends(image_upload(required=False)),
     db: Session = Depends(get_db)
 ):
     payload = get_payload_from_refresh_token(request)
@@ -65,94 +39,60 @@ async def create_collection(
         collector_id=collector.user_id,
         name=name,
         description=description,
-        photo_url="/static/avatars/default_avatar.png"
+        photo_url=DEFAULT_IMAGE_URL
     )
 
     db.add(new_collection)
+    db.flush()
+    if image:
+        new_collection.photo_url = MediaBlob.acquire(db, image)
     db.commit()
+    invalidate_tags(COLLECTIONS)
     db.refresh(new_collection)
 
-    if image:
-        if not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file type. Only images are allowed.")
-
-        file_extension = os.path.splitext(image.filename)[1]
-        filename = f"{new_collection.id}{file_extension}"
-        file_path = os.path.join(AVATAR_UPLOAD_DIR, filename)
-
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(image.file, buffer)
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save avatar file.")
-
-        new_collection.photo_url = f"/{AVATAR_UPLOAD_DIR}/{filename}"
-        db.commit()
-
     return {
         "id": new_collection.id,
         "collector_id": new_collection.collector_id,
         "name": new_collection.name,
         "description": new_collection.description,
-        "photo_url": f"http://localhost:8000{new_collection.photo_url}",
+        "photo_url": media_url(new_collection.photo_url),
     }
 
-@router.get("")
-async def get_collections(db: Session = Depends(get_db)):
+@router.get("", response_model=list[CollectionOut])
+@db_endpoint
+def get_collections(db: Session = Depends(get_db)):
     collections = db.query(Collection).all()
-
-    serialized_collections = []
-    for collection in collections:
-        serialized_collections.append({
-            "id": collection.id,
-            "collector_id": collection.collector_id,    
-            "name": collection.name,
-            "description": collection.description,
-            "photo_url": f"http://localhost:8000{collection.photo_url}"
-        })
-
-    return serialized_collections
-
-@router.get("/grouped")
-async def get_collections_grouped(db: Session = Depends(get_db)):
-    collectors = db.query(Collector).all()
-
-    result = []
-    for collector in collectors:
-        if not collector.collections or len(collector.collections) == 0:
-            continue
-        collections = [
-            {
-                "id": collection.id,
-                "name": collection.name,
-                "description": collection.description,
-                "photo_url": f"http://localhost:8000{collection.photo_url}"
-            }
-            for collection in collector.collections
-        ]
-        result.append({
-            "collector_id": collector.user_id,
-            "username": collector.user.username,
-            "avatar_url": f"http://localhost:8000{collector.avatar_url}",
-            "country": collector.country,
-            "first_name": collector.first_name,
-            "last_name": collector.last_name,
-            "middle_name": collector.middle_name,
-            "bio": collector.bio if hasattr(collector, 'bio') else '',
-            "location": collector.location if hasattr(collector, 'location') else '',
-            "memberSince": collector.member_since if hasattr(collector, 'member_since') else '',
-            "collectionCount": len(collector.collections) if hasattr(collector, 'collections') else 0,
-            "stampCount": sum(len(collection.stamps) for collection in collector.collections) if hasattr(collector, 'collections') else 0,
-            "specialties": collector.specialties if hasattr(collector, 'specialties') else [],
-            "following": 0,  # Placeholder, implement if needed
-            "followers": 0,  # Placeholder, implement if needed
-            "collections": collections
-        })
-
-    return result
+    return CollectionList.validate_python(collections)
+
+@router.get("/grouped", response_model=list[CollectorCollections])
+@db_endpoint
+def get_collections_grouped(db: Session = Depends(get_db)):
+    # Только коллекционеры, у которых есть хотя бы одна коллекция
+    summaries = (
+        Collector.get_summaries(db)
+        .having(func.count(distinct(Collection.id)) > 0)
+        .order_by(Collector.user_id)
+        .all()
+    )
+    if not summaries:
+        return []
+
+    collections_by_collector = {}
+    for collection in db.query(Collection).order_by(Collection.collector_id, Collection.id).all():
+        collections_by_collector.setdefault(collection.collector_id, []).append(collection)
+
+    return [
+        CollectorCollections.from_summary(
+            summary,
+            collector_id=summary.Collector.user_id,
+            collections=collections_by_collector[summary.Collector.user_id],
+        )
+        for summary in summaries
+    ]
 
 @router.get("/{collection_id}")
-async def get_collection_by_id(collection_id: str, db: Session = Depends(get_db)):
+@db_endpoint
+def get_collection_by_id(collection_id: str, db: Session = Depends(get_db)):
     collection = db.query(Collection).filter(Collection.id == collection_id).first()
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
@@ -162,7 +102,8 @@ async def get_collection_by_id(collection_id: str, db: Session = Depends(get_db)
         "collector_id": collection.collector_id,
         "name": collection.name,
         "description": collection.description,
-        "photo_url": f"http://localhost:8000{collection.photo_url}",
+        "photo_url": media_url(collection.photo_url),
+        "large_url": media_url(large_url(collection.photo_url)),
         "stamps": [
             {
                 "id": stamp.id,
@@ -175,15 +116,22 @@ async def get_collection_by_id(collection_id: str, db: Session = Depends(get_db)
                 "perforation": stamp.perforation,
                 "topic": stamp.topic,
                 "features": stamp.features,
-                "photo_url": f"http://localhost:8000{stamp.photo_url}",
-                "rarity": "Редкая" if stamp.cost > 1000 else "Обычная"
+                "photo_url": media_url(stamp.photo_url),
+                "thumbnail_url": media_url(thumbnail_url(stamp.photo_url)),
+                "rarity": rarity_label(stamp.cost)
             }
             for stamp in collection.stamps
         ]
     }
 
 @router.delete("/delete/{collection_id}", status_code=204)
-async def delete_collection(collection_id: str, request: Request, db: Session = Depends(get_db)):
+@db_endpoint
+def delete_collection(
+    collection_id: str,
+    request: Request,
+    garbage: list = Depends(media_garbage),
+    db: Session = Depends(get_db)
+):
     payload = get_payload_from_refresh_token(request)
     access_user_id = payload.get("sub")
     collection = db.query(Collection).filter(Collection.id == collection_id).first()
@@ -192,17 +140,25 @@ async def delete_collection(collection_id: str, request: Request, db: Session =
     if collection.collector_id != int(access_user_id):
         raise HTTPException(status_code=403, detail="Not authorized to delete this collection")
 
+    # Марки удаляются каскадом вместе с коллекцией, вместе с ними — ссылки на их фото
+    stamp_photos = [url for url, in db.query(Stamp.photo_url).filter(Stamp.collection_id == collection.id)]
+    garbage.extend(MediaBlob.release(db, [collection.photo_url, *stamp_photos]))
+    Collector.adjust_total_value(db, collection.collector_id, -collection.total_cost)
     db.delete(collection)
     db.commit()
+    # Вместе с коллекцией удалены её марки
+    invalidate_tags(COLLECTIONS, STAMPS)
     return
 
 @router.patch("/update/{collection_id}")
-async def update_collection(
+@db_endpoint
+def update_collection(
     collection_id: str,
     request: Request,
     name: str = Form(...),
     description: str = Form(...),
-    image: UploadFile = File(None),
+    image: StagedUpload = Depends(image_upload(required=False)),
+    garbage: list = Depends(media_garbage),
     db: Session = Depends(get_db)
 ):
     payload = get_payload_from_refresh_token(request)
@@ -217,28 +173,11 @@ async def update_collection(
     collection.description = description
 
     if image:
-        if not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file type. Only images are allowed.")
-
-        file_extension = os.path.splitext(image.filename)[1]
-        filename = f"{collection.id}{file_extension}"
-        file_path = os.path.join(AVATAR_UPLOAD_DIR, filename)
-
-        if collection.photo_url:
-            old_filename = os.path.basename(collection.photo_url)
-            old_path = os.path.join(AVATAR_UPLOAD_DIR, old_filename)
-            if os.path.exists(old_path) and old_path != file_path and old_path != "static/avatars\default_avatar.png":
-                os.remove(old_path)
-
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(image.file, buffer)
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save avatar file.")
-
-        collection.photo_url = f"/{AVATAR_UPLOAD_DIR}/{filename}"
+        garbage.extend(MediaBlob.release(db, [collection.photo_url]))
+        collection.photo_url = MediaBlob.acquire(db, image)
 
     db.commit()
+    invalidate_tags(COLLECTIONS)
     db.refresh(collection)
 
     return {
@@ -246,7 +185,7 @@ async def update_collection(
         "collector_id": collection.collector_id,
         "name": collection.name,
         "description": collection.description,
-        "photo_url": f"http://localhost:8000{collection.photo_url}",
+        "photo_url": media_url(collection.photo_url),
     }
 
 
@@ -0,0 +1,117 @@
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool
+from typing import Literal
+from app.core.database import get_db, open_db, run_db
+from app.api.endpoints.admin import verify_admin
+from app.models.user import User
+from app.models.collector import Collector
+from app.models.collection import Collection
+from app.models.stamp import Stamp
+from app.schemas.media import media_url
+import csv
+import io
+import json
+import os
+
+router = APIRouter()
+
+# Сколько строк читается из курсора БД за раз; память на выгрузку не зависит от размера таблицы
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Выгружаемые колонки; поля *_url отдаются полными адресами, как в API
+EXPORTS = {
+    "stamps": lambda: select(
+        Stamp.id, Stamp.name, Stamp.serial_number, Stamp.country, Stamp.year, Stamp.circulation,
+        Stamp.cost, Stamp.perforation, Stamp.topic, Stamp.features, Stamp.photo_url, Stamp.collection_id,
+    ).order_by(Stamp.id),
+    "collections": lambda: select(
+        Collection.id, Collection.collector_id, Collection.name, Collection.description,
+        Collection.photo_url, Collection.total_cost,
+    ).order_by(Collection.id),
+    "collectors": lambda: select(
+        Collector.user_id.label("id"), User.username, User.email, Collector.avatar_url, Collector.country,
+        Collector.phone_number, Collector.first_name, Collector.last_name, Collector.middle_name,
+        Collector.total_value,
+    ).join(User, User.id == Collector.user_id).order_by(Collector.user_id),
+}
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+def encode_ndjson(columns, rows):
+    return "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows).encode()
+
+def encode_csv(columns, rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+def prepare_rows(columns, partition):
+    url_indexes = [i for i, column in enumerate(columns) if column.endswith("_url")]
+    rows = []
+    for row in partition:
+        row = list(row)
+        for i in url_indexes:
+            row[i] = media_url(row[i]) if row[i] is not None else None
+        rows.append(row)
+    return rows
+
+def sync_partitions(db: Session, statement):
+    result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    yield list(result.keys())
+    yield from result.partitions()
+
+async def stream_partitions(db, statement):
+    """Первым элементом отдаёт имена колонок, затем пачки строк по EXPORT_BATCH_SIZE.
+
+    Строки читаются серверным курсором: AsyncSession.stream в async-режиме,
+    yield_per в пуле потоков в sync-режиме.
+    """
+    if isinstance(db, AsyncSession):
+        result = await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        yield list(result.keys())
+        async for partition in result.partitions():
+            yield partition
+        return
+
+    async for item in iterate_in_threadpool(sync_partitions(db, statement)):
+        yield item
+
+async def export_body(provider, entity: str, export_format: str):
+    # Своя сессия: зависимость get_db запроса к началу передачи тела уже может быть закрыта
+    async with open_db(provider) as db:
+        partitions = stream_partitions(db, EXPORTS[entity]())
+        columns = await partitions.__anext__()
+        if export_format == "csv":
+            # Заголовок уходит сразу, до первой пачки строк
+            yield encode_csv(columns, [], header=True)
+        async for partition in partitions:
+            rows = prepare_rows(columns, partition)
+            yield encode_ndjson(columns, rows) if export_format == "ndjson" else encode_csv(columns, rows)
+
+def check_admin(db: Session, token: str):
+    verify_admin(db, token)
+    # Соединение запроса возвращается в пул до начала долгой выгрузки
+    db.rollback()
+
+@router.get("/{entity}")
+async def export(
+    entity: Literal["stamps", "collections", "collectors"],
+    request: Request,
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    authorization: str = Header(...),
+    db: Session = Depends(get_db),
+):
+    token = authorization.split(" ")[1] if authorization else ""
+    await run_db(db, check_admin, token)
+    return StreamingResponse(
+        export_body(request.app.dependency_overrides.get(get_db, get_db), entity, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{export_format}"'},
+    )
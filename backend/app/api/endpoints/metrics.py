@@ -0,0 +1,23 @@
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from app.core.metrics import REGISTRY
+
+# Токен сборщика метрик (Prometheus: authorization / bearer_token). Пусто — /metrics выключен:
+# метрики включают состояние пулов БД, которое иначе доступно только администратору
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+router = APIRouter()
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {METRICS_TOKEN}".encode()
+    if authorization is None or not hmac.compare_digest(authorization.encode(), expected):
+        raise HTTPException(status_code=401, detail="Неверный токен метрик", headers={"WWW-Authenticate": "Bearer"})
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
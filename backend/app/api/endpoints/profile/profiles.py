@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, db_endpoint
 from app.models.collector import Collector
 from app.models.user import User
 from app.models.collection import Collection
+from app.models.stamp import Stamp, RARE_STAMP
+from app.core.cache import invalidate_tags, COLLECTORS
+from app.schemas.collector import CollectorSummary, CollectorValueSummary
+from app.schemas.media import media_url
 from pydantic import BaseModel, EmailStr, constr
 from typing import Optional
+from datetime import datetime, timedelta
 from sqlalchemy import func
 
 router = APIRouter()
@@ -22,73 +27,43 @@ class CollectorUpdateSchema(BaseModel):
     middle_name: Optional[constr(max_length=50)] = None
 
 
-@router.get("/list")
-async def get_collectors_list(db: Session = Depends(get_db)):
-    collectors = db.query(Collector).all()
-    result = []
-    for collector in collectors:
-        result.append({
-            "id": collector.user_id,
-            "username": collector.user.username,
-            "avatar_url": f"http://localhost:8000{collector.avatar_url}",
-            "country": collector.country,
-            "first_name": collector.first_name,
-            "last_name": collector.last_name,
-            "middle_name": collector.middle_name,
-            "bio": collector.bio if hasattr(collector, 'bio') else '',
-            "location": collector.location if hasattr(collector, 'location') else '',
-            "memberSince": collector.member_since if hasattr(collector, 'member_since') else '',
-            "collectionCount": len(collector.collections) if hasattr(collector, 'collections') else 0,
-            "stampCount": sum(len(collection.stamps) for collection in collector.collections) if hasattr(collector, 'collections') else 0,
-            "specialties": collector.specialties if hasattr(collector, 'specialties') else [],
-            "following": 0,  # Placeholder, implement if needed
-            "followers": 0,  # Placeholder, implement if needed
-            "featured": False  # Placeholder, implement if needed
-        })
-    return result
+def serialize_collector_summary(summary):
+    return CollectorSummary.from_summary(summary, id=summary.Collector.user_id)
+
+@router.get("/list", response_model=list[CollectorSummary])
+@db_endpoint
+def get_collectors_list(db: Session = Depends(get_db)):
+    summaries = Collector.get_summaries(db).order_by(Collector.user_id).all()
+    return [serialize_collector_summary(summary) for summary in summaries]
 
 @router.get("/most_expensive_stamp_collector")
-async def get_collector_with_most_expensive_stamp(db: Session = Depends(get_db)):
-    # Query to find the stamp with the highest cost
-    from app.models.stamp import Stamp
-    most_expensive_stamp = db.query(Stamp).order_by(Stamp.cost.desc()).first()
+@db_endpoint
+def get_collector_with_most_expensive_stamp(db: Session = Depends(get_db)):
+    # Самая дорогая марка сразу вместе с владельцем её коллекции
+    most_expensive_stamp = (
+        db.query(Stamp.id, Collection.collector_id)
+        .outerjoin(Collection, Collection.id == Stamp.collection_id)
+        .order_by(Stamp.cost.desc())
+        .first()
+    )
     if not most_expensive_stamp:
         return {"message": "No stamps found"}
-
-    # Get the collector who owns this stamp
-    collection = db.query(Collection).filter(Collection.id == most_expensive_stamp.collection_id).first()
-    if not collection:
+    if most_expensive_stamp.collector_id is None:
         return {"message": "Collection not found for the most expensive stamp"}
 
-    collector = db.query(Collector).filter(Collector.user_id == collection.collector_id).first()
-    if not collector:
+    summary = (
+        Collector.get_summaries(db)
+        .filter(Collector.user_id == most_expensive_stamp.collector_id)
+        .first()
+    )
+    if not summary:
         return {"message": "Collector not found for the most expensive stamp"}
 
-    return {
-        "id": collector.user_id,
-        "username": collector.user.username,
-        "avatar_url": f"http://localhost:8000{collector.avatar_url}",
-        "country": collector.country,
-        "first_name": collector.first_name,
-        "last_name": collector.last_name,
-        "middle_name": collector.middle_name,
-        "bio": collector.bio if hasattr(collector, 'bio') else '',
-        "location": collector.location if hasattr(collector, 'location') else '',
-        "memberSince": collector.member_since if hasattr(collector, 'member_since') else '',
-        "collectionCount": len(collector.collections) if hasattr(collector, 'collections') else 0,
-        "stampCount": sum(len(collection.stamps) for collection in collector.collections) if hasattr(collector, 'collections') else 0,
-        "specialties": collector.specialties if hasattr(collector, 'specialties') else [],
-        "following": 0,
-        "followers": 0,
-        "featured": False
-    }
+    return serialize_collector_summary(summary)
 
 @router.get("/max_rare_stamp_collector")
-async def get_collector_with_max_rare_stamps(db: Session = Depends(get_db)):
-    from app.models.stamp import Stamp
-
-    RARITY_THRESHOLD = 1000  # Define cost above this as rare
-
+@db_endpoint
+def get_collector_with_max_rare_stamps(db: Session = Depends(get_db)):
     # Subquery to count rare stamps per collector
     rare_stamps_subq = (
         db.query(
@@ -96,7 +71,7 @@ async def get_collector_with_max_rare_stamps(db: Session = Depends(get_db)):
             func.count(Stamp.id).label("rare_stamp_count")
         )
         .join(Stamp, Stamp.collection_id == Collection.id)
-        .filter(Stamp.cost > RARITY_THRESHOLD)
+        .filter(RARE_STAMP)
         .group_by(Collection.collector_id)
         .subquery()
     )
@@ -110,83 +85,39 @@ async def get_collector_with_max_rare_stamps(db: Session = Depends(get_db)):
     if not max_rare:
         return {"message": "No rare stamps found"}
 
-    collector = db.query(Collector).filter(Collector.user_id == max_rare.collector_id).first()
-    if not collector:
+    summary = Collector.get_summaries(db).filter(Collector.user_id == max_rare.collector_id).first()
+    if not summary:
         return {"message": "Collector not found for max rare stamps"}
 
-    return {
-        "id": collector.user_id,
-        "username": collector.user.username,
-        "avatar_url": f"http://localhost:8000{collector.avatar_url}",
-        "country": collector.country,
-        "first_name": collector.first_name,
-        "last_name": collector.last_name,
-        "middle_name": collector.middle_name,
-        "bio": collector.bio if hasattr(collector, 'bio') else '',
-        "location": collector.location if hasattr(collector, 'location') else '',
-        "memberSince": collector.member_since if hasattr(collector, 'member_since') else '',
-        "collectionCount": len(collector.collections) if hasattr(collector, 'collections') else 0,
-        "stampCount": sum(len(collection.stamps) for collection in collector.collections) if hasattr(collector, 'collections') else 0,
-        "specialties": collector.specialties if hasattr(collector, 'specialties') else [],
-        "following": 0,
-        "followers": 0,
-        "featured": False
-    }
-
-from fastapi import Query
+    return serialize_collector_summary(summary)
 
-@router.get("/sorted_by_collection_value")
-async def get_collectors_sorted_by_collection_value(
+@router.get("/sorted_by_collection_value", response_model=list[CollectorValueSummary])
+@db_endpoint
+def get_collectors_sorted_by_collection_value(
     limit: int = Query(None, description="Limit number of collectors returned"),
     db: Session = Depends(get_db)
 ):
-    from app.models.stamp import Stamp
-    from sqlalchemy import func
+    # Порядок берётся из индекса по collectors.total_value; агрегаты считаются только для попавших в выборку
+    top_ids = db.query(Collector.user_id).order_by(Collector.total_value.desc(), Collector.user_id)
+    if limit is not None:
+        top_ids = top_ids.limit(limit)
 
     query = (
-        db.query(
-            Collector,
-            func.coalesce(func.sum(Stamp.cost), 0).label("total_value")
-        )
-        .outerjoin(Collection, Collection.collector_id == Collector.user_id)
-        .outerjoin(Stamp, Stamp.collection_id == Collection.id)
-        .group_by(Collector.user_id)
-        .order_by(func.coalesce(func.sum(Stamp.cost), 0).desc())
+        Collector.get_summaries(db)
+        .filter(Collector.user_id.in_(top_ids.subquery().select()))
+        .order_by(Collector.total_value.desc(), Collector.user_id)
     )
 
-    if limit is not None:
-        query = query.limit(limit)
-
-    collectors_with_value = query.all()
-
-    result = []
-    for collector, total_value in collectors_with_value:
-        result.append({
-            "id": collector.user_id,
-            "username": collector.user.username,
-            "avatar_url": f"http://localhost:8000{collector.avatar_url}",
-            "country": collector.country,
-            "first_name": collector.first_name,
-            "last_name": collector.last_name,
-            "middle_name": collector.middle_name,
-            "bio": collector.bio if hasattr(collector, 'bio') else '',
-            "location": collector.location if hasattr(collector, 'location') else '',
-            "memberSince": collector.member_since if hasattr(collector, 'member_since') else '',
-            "collectionCount": len(collector.collections) if hasattr(collector, 'collections') else 0,
-            "stampCount": sum(len(collection.stamps) for collection in collector.collections) if hasattr(collector, 'collections') else 0,
-            "specialties": collector.specialties if hasattr(collector, 'specialties') else [],
-            "following": 0,
-            "followers": 0,
-            "featured": False,
-            "totalCollectionValue": total_value
-        })
-    return result
-
-@router.get("/collectors_with_old_stamps")
-async def get_collectors_with_old_stamps(db: Session = Depends(get_db)):
-    from app.models.stamp import Stamp
-    from datetime import datetime, timedelta
+    return [
+        CollectorValueSummary.from_summary(
+            summary, id=summary.Collector.user_id, totalCollectionValue=summary.Collector.total_value
+        )
+        for summary in query.all()
+    ]
 
+@router.get("/collectors_with_old_stamps", response_model=list[CollectorSummary])
+@db_endpoint
+def get_collectors_with_old_stamps(db: Session = Depends(get_db)):
     ten_years_ago = datetime.now() - timedelta(days=365*10)
     cutoff_year = ten_years_ago.year
 
@@ -196,39 +127,19 @@ async def get_collectors_with_old_stamps(db: Session = Depends(get_db)):
         .join(Stamp, Stamp.collection_id == Collection.id)
         .filter(Stamp.year < cutoff_year)
         .distinct()
-        .subquery()
     )
 
-    collectors = (
-        db.query(Collector)
+    summaries = (
+        Collector.get_summaries(db)
         .filter(Collector.user_id.in_(old_stamps_subq))
+        .order_by(Collector.user_id)
         .all()
     )
-
-    result = []
-    for collector in collectors:
-        result.append({
-            "id": collector.user_id,
-            "username": collector.user.username,
-            "avatar_url": f"http://localhost:8000{collector.avatar_url}",
-            "country": collector.country,
-            "first_name": collector.first_name,
-            "last_name": collector.last_name,
-            "middle_name": collector.middle_name,
-            "bio": collector.bio if hasattr(collector, 'bio') else '',
-            "location": collector.location if hasattr(collector, 'location') else '',
-            "memberSince": collector.member_since if hasattr(collector, 'member_since') else '',
-            "collectionCount": len(collector.collections) if hasattr(collector, 'collections') else 0,
-            "stampCount": sum(len(collection.stamps) for collection in collector.collections) if hasattr(collector, 'collections') else 0,
-            "specialties": collector.specialties if hasattr(collector, 'specialties') else [],
-            "following": 0,
-            "followers": 0,
-            "featured": False
-        })
-    return result
+    return [serialize_collector_summary(summary) for summary in summaries]
 
 @router.get("/{user_id}")
-async def get_profile(user_id: str, db: Session = Depends(get_db)):
+@db_endpoint
+def get_profile(user_id: str, db: Session = Depends(get_db)):
     user = User.get_user(db, user_id)
     collector = Collector.get_collector(db, user_id)
     collections = Collection.get_collections(db, user_id)
@@ -239,14 +150,14 @@ async def get_profile(user_id: str, db: Session = Depends(get_db)):
             "id": collection.id,
             "name": collection.name,
             "description": collection.description,
-            "photo_url": f"http://localhost:8000{collection.photo_url}",  # ✅ добавляем префикс
+            "photo_url": media_url(collection.photo_url),  # ✅ добавляем префикс
             "collector_id": collection.collector_id
         })
 
     return {
         "id": user_id,
         "username": user.username,
-        "avatar_url": f"http://localhost:8000{collector.avatar_url}",
+        "avatar_url": media_url(collector.avatar_url),
         "country": collector.country,
         "first_name": collector.first_name,
         "last_name": collector.last_name,
@@ -255,7 +166,8 @@ async def get_profile(user_id: str, db: Session = Depends(get_db)):
     }
 
 @router.patch("/users/{user_id}", status_code=200)
-async def update_user(user_id: int, user_update: UserUpdateSchema, db: Session = Depends(get_db)):
+@db_endpoint
+def update_user(user_id: int, user_update: UserUpdateSchema, db: Session = Depends(get_db)):
     user = User.get_user(db, user_id)
     updated = False
     if user_update.username is not None:
@@ -274,6 +186,7 @@ async def update_user(user_id: int, user_update: UserUpdateSchema, db: Session =
         updated = True
     if updated:
         db.commit()
+        invalidate_tags(COLLECTORS)
         db.refresh(user)
     return {
         "id": user.id,
@@ -282,7 +195,8 @@ async def update_user(user_id: int, user_update: UserUpdateSchema, db: Session =
     }
 
 @router.patch("/collectors/{user_id}", status_code=200)
-async def update_collector(user_id: int, collector_update: CollectorUpdateSchema, db: Session = Depends(get_db)):
+@db_endpoint
+def update_collector(user_id: int, collector_update: CollectorUpdateSchema, db: Session = Depends(get_db)):
     collector = Collector.get_collector(db, user_id)
     updated = False
     if collector_update.country is not None:
@@ -302,6 +216,7 @@ async def update_collector(user_id: int, collector_update: CollectorUpdateSchema
         updated = True
     if updated:
         db.commit()
+        invalidate_tags(COLLECTORS)
         db.refresh(collector)
     return {
         "user_id": collector.user_id,
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from app.core.database import get_db, db_endpoint
+from app.models.stamp import Stamp, rarity_label
+from app.models.collection import Collection
+from app.schemas.media import media_url
+
+router = APIRouter()
+
+MAX_SEARCH_PAGE_SIZE = 100
+
+def fetch_page(query, limit: int, offset: int):
+    """Страница результатов и признак того, что есть следующая (берётся на одну запись больше)."""
+    if query is None:
+        return [], False
+    rows = query.offset(offset).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+@router.get("/")
+@db_endpoint
+def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Поисковая строка"),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    # Ранжирование и отбор выполняются в БД по полнотекстовому индексу,
+    # поэтому клиенту не нужно загружать весь каталог
+    stamps, more_stamps = fetch_page(Stamp.search(db, q), limit, offset)
+    collections, more_collections = fetch_page(Collection.search(db, q), limit, offset)
+
+    return {
+        "stamps": [
+            {
+                "id": stamp.id,
+                "name": stamp.name,
+                "serial_number": stamp.serial_number,
+                "country": stamp.country,
+                "year": stamp.year,
+                "circulation": stamp.circulation,
+                "cost": stamp.cost,
+                "perforation": stamp.perforation,
+                "topic": stamp.topic,
+                "features": stamp.features,
+                "photo_url": media_url(stamp.photo_url),
+                "rarity": rarity_label(stamp.cost),
+                "collection_id": stamp.collection_id,
+            }
+            for stamp in stamps
+        ],
+        "collections": [
+            {
+                "id": collection.id,
+                "collector_id": collection.collector_id,
+                "name": collection.name,
+                "description": collection.description,
+                "photo_url": media_url(collection.photo_url),
+            }
+            for collection in collections
+        ],
+        "next_offset": offset + limit if more_stamps or more_collections else None,
+    }
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, db_endpoint
 from app.models.collector import Collector
 from app.models.user import User
 from app.models.collection import Collection
@@ -9,7 +9,8 @@ from app.core.security import get_payload_from_refresh_token
 router = APIRouter()
 
 @router.get("/user")
-async def get_user_settings(request: Request, db: Session = Depends(get_db)):
+@db_endpoint
+def get_user_settings(request: Request, db: Session = Depends(get_db)):
     payload = get_payload_from_refresh_token(request)
     access_user_id = payload.get("sub")
     user = User.get_user(db, access_user_id)
@@ -20,7 +21,8 @@ async def get_user_settings(request: Request, db: Session = Depends(get_db)):
     }
 
 @router.get("/collector")
-async def get_collector_settings(request: Request, db: Session = Depends(get_db)):
+@db_endpoint
+def get_collector_settings(request: Request, db: Session = Depends(get_db)):
     payload = get_payload_from_refresh_token(request)
     access_user_id = payload.get("sub")
     collector = Collector.get_collector(db, access_user_id)
@@ -1,94 +1,97 @@
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.models.stamp import Stamp
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form, status
+from app.core.database import get_db, db_endpoint
+from app.models.stamp import Stamp, RARE_COST_THRESHOLD, RARE_STAMP, rarity_label
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Form, Query
 from app.models.collector import Collector
 from app.models.collection import Collection
+from app.models.media import MediaBlob, media_garbage
 from app.core.security import get_payload_from_refresh_token
-import os
-import shutil
+from app.core.http_cache import make_etag, cache_headers, is_not_modified
+from app.core.uploads import DEFAULT_IMAGE_URL, StagedUpload, image_upload
+from app.core.cache import invalidate_tags, STAMPS
+from app.schemas.stamp import StampPage, StampOut, StampList
+from app.schemas.media import media_url, large_url
+from app.schemas.collector import CollectorRareStamps
+from typing import Optional
 
 router = APIRouter()
 
-AVATAR_UPLOAD_DIR = "static/stamps"
+MAX_PAGE_SIZE = 200
 
-@router.get("/top_expensive")
-async def get_top_expensive_stamps(db: Session = Depends(get_db)):
+@router.get("/top_expensive", response_model=list[StampOut])
+@db_endpoint
+def get_top_expensive_stamps(db: Session = Depends(get_db)):
+    # Читается по индексу на stamps.cost, без сортировки всей таблицы
     stamps = db.query(Stamp).order_by(Stamp.cost.desc()).limit(3).all()
-    result = []
-    for stamp in stamps:
-        result.append({
-            "id": stamp.id,
-            "name": stamp.name,
-            "serial_number": stamp.serial_number,
-            "country": stamp.country,
-            "year": stamp.year,
-            "circulation": stamp.circulation,
-            "cost": stamp.cost,
-            "perforation": stamp.perforation,
-            "topic": stamp.topic,
-            "features": stamp.features,
-            "photo_url": f"http://localhost:8000{stamp.photo_url}",
-            "rarity": "Редкая" if stamp.cost > 1000 else "Обычная"
-        })
-    return result
-
-@router.get("/grouped_rare")
-async def get_rare_stamps_grouped(db: Session = Depends(get_db)):
-    collectors = db.query(Collector).all()
-
-    result = []
-    for collector in collectors:
-        rare_stamps = []
-        for collection in collector.collections:
-            for stamp in collection.stamps:
-                if stamp.cost > 1000:
-                    rare_stamps.append({
-                        "id": stamp.id,
-                        "name": stamp.name,
-                        "serial_number": stamp.serial_number,
-                        "country": stamp.country,
-                        "year": stamp.year,
-                        "circulation": stamp.circulation,
-                        "cost": stamp.cost,
-                        "perforation": stamp.perforation,
-                        "topic": stamp.topic,
-                        "features": stamp.features,
-                        "photo_url": f"http://localhost:8000{stamp.photo_url}",
-                        "rarity": "Редкая"
-                    })
-        if rare_stamps:
-            result.append({
-                "collector_id": collector.user_id,
-                "username": collector.user.username,
-                "avatar_url": f"http://localhost:8000{collector.avatar_url}",
-                "country": collector.country,
-                "first_name": collector.first_name,
-                "last_name": collector.last_name,
-                "middle_name": collector.middle_name,
-                "bio": collector.bio if hasattr(collector, 'bio') else '',
-                "location": collector.location if hasattr(collector, 'location') else '',
-                "memberSince": collector.member_since if hasattr(collector, 'member_since') else '',
-                "collectionCount": len(collector.collections) if hasattr(collector, 'collections') else 0,
-                "stampCount": sum(len(collection.stamps) for collection in collector.collections) if hasattr(collector, 'collections') else 0,
-                "specialties": collector.specialties if hasattr(collector, 'specialties') else [],
-                "following": 0,
-                "followers": 0,
-                "rare_stamps": rare_stamps
-            })
-
-    return result
+    return StampList.validate_python(stamps)
+
+@router.get("/grouped_rare", response_model=list[CollectorRareStamps])
+@db_endpoint
+def get_rare_stamps_grouped(db: Session = Depends(get_db)):
+    # Все редкие марки одним запросом, сразу с владельцем коллекции
+    rare_rows = (
+        db.query(Stamp, Collection.collector_id)
+        .join(Collection, Collection.id == Stamp.collection_id)
+        .filter(RARE_STAMP)
+        .order_by(Collection.collector_id, Stamp.id)
+        .all()
+    )
+    if not rare_rows:
+        return []
+
+    rare_stamps_by_collector = {}
+    for stamp, collector_id in rare_rows:
+        rare_stamps_by_collector.setdefault(collector_id, []).append(stamp)
+
+    # Данные коллекционеров и их счётчики — одним запросом с GROUP BY
+    rare_collectors_subq = (
+        db.query(Collection.collector_id)
+        .join(Stamp, Stamp.collection_id == Collection.id)
+        .filter(RARE_STAMP)
+    )
+    summaries = (
+        Collector.get_summaries(db)
+        .filter(Collector.user_id.in_(rare_collectors_subq))
+        .order_by(Collector.user_id)
+        .all()
+    )
+
+    return [
+        CollectorRareStamps.from_summary(
+            summary,
+            collector_id=summary.Collector.user_id,
+            rare_stamps=rare_stamps_by_collector[summary.Collector.user_id],
+        )
+        for summary in summaries
+    ]
 
 @router.get("/{stamp_id}")
-async def get_stamp_by_id(stamp_id: int, db: Session = Depends(get_db)):
-    stamp = db.query(Stamp).filter(Stamp.id == stamp_id).first()
-    if not stamp:
+@db_endpoint
+def get_stamp_by_id(stamp_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    # Марка и владелец коллекции одним запросом; outer join — чтобы отличить марку без коллекции
+    row = (
+        db.query(Stamp, Collection.collector_id)
+        .outerjoin(Collection, Collection.id == Stamp.collection_id)
+        .filter(Stamp.id == stamp_id)
+        .first()
+    )
+    if not row:
         raise HTTPException(status_code=404, detail="Stamp not found")
 
-    collection = db.query(Collection).filter(Collection.id == stamp.collection_id).first()
-    if not collection:
+    stamp, collector_id = row
+    if collector_id is None:
         raise HTTPException(status_code=404, detail="Collection not found")
 
+    etag = make_etag(
+        stamp.id, stamp.name, stamp.serial_number, stamp.country, stamp.year, stamp.circulation,
+        stamp.cost, stamp.perforation, stamp.topic, stamp.features, stamp.photo_url,
+        stamp.collection_id, collector_id,
+    )
+    headers = cache_headers(etag, stamp.updated_at)
+    if is_not_modified(request.headers, etag, stamp.updated_at):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
     return {
         "id": stamp.id,
         "name": stamp.name,
@@ -100,35 +103,64 @@ async def get_stamp_by_id(stamp_id: int, db: Session = Depends(get_db)):
         "perforation": stamp.perforation,
         "topic": stamp.topic,
         "features": stamp.features,
-        "photo_url": f"http://localhost:8000{stamp.photo_url}",
-        "rarity": "Редкая" if stamp.cost > 1000 else "Обычная",
+        "photo_url": media_url(stamp.photo_url),
+        "large_url": media_url(large_url(stamp.photo_url)),
+        "rarity": rarity_label(stamp.cost),
         "collection_id": stamp.collection_id,
-        "collector_id": collection.collector_id  # 👈 добавлено
+        "collector_id": collector_id  # 👈 добавлено
     }
 
-@router.get("/")
-async def get_all_stamps(db: Session = Depends(get_db)):
-    stamps = db.query(Stamp).all()
-    result = []
-    for stamp in stamps:
-        result.append({
-            "id": stamp.id,
-            "name": stamp.name,
-            "serial_number": stamp.serial_number,
-            "country": stamp.country,
-            "year": stamp.year,
-            "circulation": stamp.circulation,
-            "cost": stamp.cost,
-            "perforation": stamp.perforation,
-            "topic": stamp.topic,
-            "features": stamp.features,
-            "photo_url": f"http://localhost:8000{stamp.photo_url}",
-            "rarity": "Редкая" if stamp.cost > 1000 else "Обычная"
-        })
-    return result
+@router.get("/", response_model=StampPage)
+@db_endpoint
+def get_all_stamps(
+    cursor: Optional[int] = Query(None, description="ID последней марки предыдущей страницы"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    country: Optional[str] = Query(None),
+    year_from: Optional[int] = Query(None),
+    year_to: Optional[int] = Query(None),
+    topic: Optional[str] = Query(None),
+    cost_from: Optional[int] = Query(None),
+    cost_to: Optional[int] = Query(None),
+    rarity: Optional[str] = Query(None, description="Редкая или Обычная"),
+    db: Session = Depends(get_db),
+):
+    # Keyset-пагинация по Stamp.id: страница всегда читается по индексу
+    # первичного ключа, поэтому её стоимость не зависит от глубины
+    query = db.query(Stamp)
+    if cursor is not None:
+        query = query.filter(Stamp.id > cursor)
+    if country:
+        query = query.filter(Stamp.country == country)
+    if year_from is not None:
+        query = query.filter(Stamp.year >= year_from)
+    if year_to is not None:
+        query = query.filter(Stamp.year <= year_to)
+    if topic:
+        query = query.filter(Stamp.topic == topic)
+    if cost_from is not None:
+        query = query.filter(Stamp.cost >= cost_from)
+    if cost_to is not None:
+        query = query.filter(Stamp.cost <= cost_to)
+    if rarity == "Редкая":
+        query = query.filter(RARE_STAMP)
+    elif rarity == "Обычная":
+        query = query.filter(Stamp.cost <= RARE_COST_THRESHOLD)
+    elif rarity:
+        raise HTTPException(status_code=400, detail="Неизвестное значение редкости")
+
+    # Берём на одну запись больше, чтобы узнать, есть ли следующая страница
+    stamps = query.order_by(Stamp.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(stamps) > limit:
+        stamps = stamps[:limit]
+        next_cursor = stamps[-1].id
+
+    # Модели собираются внутри сессии; в JSON их переводит Pydantic за один проход
+    return StampPage(items=stamps, next_cursor=next_cursor)
 
 @router.post("/create")
-async def create_stamp(
+@db_endpoint
+def create_stamp(
     request: Request,
     name: str = Form(...),
     serial_number: str = Form(...),
@@ -140,7 +172,7 @@ async def create_stamp(
     topic: str = Form(...),
     features: str = Form(...),
     collection_id: int = Form(...),
-    image: UploadFile = File(...),
+    image: StagedUpload = Depends(image_upload()),
     db: Session = Depends(get_db),
 ):
     # Check collection ownership
@@ -170,26 +202,18 @@ async def create_stamp(
         perforation=perforation,
         topic=topic,
         features=features,
-        photo_url="/static/avatars/default_avatar.png",
+        photo_url=DEFAULT_IMAGE_URL,
         collection_id=collection_id
     )
     db.add(new_stamp)
+    db.flush()
+    # Стоимость перечитывается из БД: суммы должны совпадать с тем, что реально сохранено
+    db.refresh(new_stamp, ["cost"])
+    Collector.adjust_stamp_totals(db, collection_id, new_stamp.cost)
+    # Файл уже проверен и лежит в хранилище, остаётся учесть ссылку на него
+    new_stamp.photo_url = MediaBlob.acquire(db, image)
     db.commit()
-    db.refresh(new_stamp)
-
-    # Сохраняем файл
-    file_extension = os.path.splitext(image.filename)[1]
-    filename = f"{new_stamp.id}{file_extension}"
-    file_path = os.path.join(AVATAR_UPLOAD_DIR, filename)
-
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save avatar file.")
-
-    new_stamp.photo_url = f"/{AVATAR_UPLOAD_DIR}/{filename}"
-    db.commit()
+    invalidate_tags(STAMPS)
     db.refresh(new_stamp)
     return {
         "id": new_stamp.id,
@@ -202,12 +226,18 @@ async def create_stamp(
         "perforation": new_stamp.perforation,
         "topic": new_stamp.topic,
         "features": new_stamp.features,
-        "photo_url": f"http://localhost:8000{new_stamp.photo_url}",
-        "rarity": "Редкая" if new_stamp.cost > 1000 else "Обычная"
+        "photo_url": media_url(new_stamp.photo_url),
+        "rarity": rarity_label(new_stamp.cost)
     }
 
 @router.delete("/delete/{stamp_id}")
-async def delete_stamp(stamp_id: int, request: Request, db: Session = Depends(get_db)):
+@db_endpoint
+def delete_stamp(
+    stamp_id: int,
+    request: Request,
+    garbage: list = Depends(media_garbage),
+    db: Session = Depends(get_db),
+):
     stamp = db.query(Stamp).filter(Stamp.id == stamp_id).first()
     if not stamp:
         raise HTTPException(status_code=404, detail="Stamp not found")
@@ -223,21 +253,19 @@ async def delete_stamp(stamp_id: int, request: Request, db: Session = Depends(ge
     if collection.collector_id != collector.user_id:
         raise HTTPException(status_code=403, detail="Нет доступа!")
 
-    # Delete the stamp photo file if exists
-    photo_path = stamp.photo_url.lstrip('/')
-    if os.path.exists(photo_path):
-        try:
-            os.remove(photo_path)
-        except Exception:
-            pass
+    # Фото и его уменьшенные копии удаляются, если на них больше никто не ссылается
+    garbage.extend(MediaBlob.release(db, [stamp.photo_url]))
 
+    Collector.adjust_stamp_totals(db, stamp.collection_id, -stamp.cost)
     db.delete(stamp)
     db.commit()
+    invalidate_tags(STAMPS)
 
     return {"detail": "Stamp deleted successfully"}
 
 @router.patch("/update/{stamp_id}")
-async def update_stamp(
+@db_endpoint
+def update_stamp(
     stamp_id: int,
     request: Request,
     name: str = Form(...),
@@ -249,7 +277,8 @@ async def update_stamp(
     perforation: str = Form(...),
     topic: str = Form(...),
     features: str = Form(...),
-    image: UploadFile = File(None),
+    image: StagedUpload = Depends(image_upload(required=False)),
+    garbage: list = Depends(media_garbage),
     db: Session = Depends(get_db),
 ):
     stamp = db.query(Stamp).filter(Stamp.id == stamp_id).first()
@@ -267,6 +296,7 @@ async def update_stamp(
     if collection.collector_id != collector.user_id:
         raise HTTPException(status_code=403, detail="Нет доступа!")
 
+    old_cost = stamp.cost
     stamp.name = name
     stamp.serial_number = serial_number
     stamp.country = country
@@ -278,28 +308,14 @@ async def update_stamp(
     stamp.features = features
 
     if image:
-        if not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file type. Only images are allowed.")
-
-        file_extension = os.path.splitext(image.filename)[1]
-        filename = f"{stamp.id}{file_extension}"
-        file_path = os.path.join(AVATAR_UPLOAD_DIR, filename)
-        
-        if stamp.photo_url:
-            old_filename = os.path.basename(stamp.photo_url)
-            old_path = os.path.join(AVATAR_UPLOAD_DIR, old_filename)
-            if os.path.exists(old_path) and old_path != file_path and old_path != "static/avatars\default_avatar.png":
-                os.remove(old_path)
-
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(image.file, buffer)
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save avatar file.")
-
-        stamp.photo_url = f"/{AVATAR_UPLOAD_DIR}/{filename}"
+        garbage.extend(MediaBlob.release(db, [stamp.photo_url]))
+        stamp.photo_url = MediaBlob.acquire(db, image)
 
+    db.flush()
+    db.refresh(stamp, ["cost"])
+    Collector.adjust_stamp_totals(db, stamp.collection_id, stamp.cost - old_cost)
     db.commit()
+    invalidate_tags(STAMPS)
     db.refresh(stamp)
 
     return {
@@ -313,6 +329,6 @@ async def update_stamp(
         "perforation": stamp.perforation,
         "topic": stamp.topic,
         "features": stamp.features,
-        "photo_url": f"http://localhost:8000{stamp.photo_url}",
-        "rarity": "Редкая" if stamp.cost > 1000 else "Обычная"
+        "photo_url": media_url(stamp.photo_url),
+        "rarity": rarity_label(stamp.cost)
     }
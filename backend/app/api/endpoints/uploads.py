@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+from app.core import storage
+from app.core.security import get_payload_from_refresh_token
+from app.core.uploads import UPLOAD_MAX_BYTES, incoming_key, invalid_image
+from app.schemas.upload import PresignRequest, PresignedUpload
+
+router = APIRouter()
+
+@router.post("/presign", response_model=PresignedUpload)
+async def presign_upload(body: PresignRequest, request: Request):
+    """Подписанная форма для загрузки изображения из браузера прямо в хранилище, минуя API."""
+    payload = get_payload_from_refresh_token(request)
+    if not body.content_type.startswith("image/"):
+        raise invalid_image()
+
+    key = incoming_key(payload.get("sub"))
+    form = await run_in_threadpool(storage.media_storage.presign_upload, key, body.content_type, UPLOAD_MAX_BYTES, body.sha256)
+    if form is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Прямая загрузка доступна только при STORAGE_BACKEND=s3",
+        )
+    return PresignedUpload(key=key, url=form["url"], fields=form["fields"], max_bytes=UPLOAD_MAX_BYTES)
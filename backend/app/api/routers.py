@@ -5,6 +5,9 @@ from app.api.endpoints.setting import settings, change_avatar
 from app.api.endpoints.collection import collections
 from app.api.endpoints import stamps
 from app.api.endpoints import admin
+from app.api.endpoints import search
+from app.api.endpoints import export
+from app.api.endpoints import uploads
 
 api_router = APIRouter()
 
@@ -21,4 +24,9 @@ api_router.include_router(collections.router, prefix="/collections", tags=["coll
 
 api_router.include_router(stamps.router, prefix="/stamps", tags=["stamps"])
 
+api_router.include_router(uploads.router, prefix="/uploads", tags=["uploads"])
+
+api_router.include_router(search.router, prefix="/search", tags=["search"])
+
 api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
+api_router.include_router(export.router, prefix="/admin/export", tags=["admin"])
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from app.logging_config import logger
+import os
+import threading
+import time
+
+# Кэш ответов публичных списков (см. app/middleware/cache.py).
+# memory — в памяти процесса, redis — общий для всех воркеров, none — выключен
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))  # секунды
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_ENTRY_BYTES = int(os.getenv("CACHE_MAX_ENTRY_BYTES", str(2 * 1024 * 1024)))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Число процессов сервера: его читают uvicorn (--workers) и gunicorn (-w) по умолчанию
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Теги данных, от которых зависят закэшированные ответы
+STAMPS = "stamps"
+COLLECTIONS = "collections"
+COLLECTORS = "collectors"
+
+class MemoryCacheBackend:
+    """TTL + LRU в памяти процесса.
+
+    Инвалидация по тегам — через версии: ключ записи включает версии её тегов,
+    а invalidate увеличивает версию, после чего старые записи больше не находятся
+    и вытесняются по LRU или TTL.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        # Обработчики, вызывающие invalidate, в sync-режиме работают в пуле потоков
+        self.lock = threading.Lock()
+
+    def tag_versions(self, tags):
+        with self.lock:
+            return [self.versions.get(tag, 0) for tag in tags]
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: int):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.versions[tag] = self.versions.get(tag, 0) + 1
+
+class RedisCacheBackend:
+    """Тот же протокол поверх Redis (или любого совместимого сервера): кэш общий для всех процессов.
+
+    Версии тегов — счётчики cache:tag:<тег>, записи — ключи с TTL (вытеснение — политика maxmemory сервера).
+    """
+
+    def __init__(self, client=None, url: str = CACHE_REDIS_URL, prefix: str = "cache:"):
+        if client is None:
+            import redis  # необязательная зависимость, нужна только для CACHE_BACKEND=redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def tag_versions(self, tags):
+        values = self.client.mget([f"{self.prefix}tag:{tag}" for tag in tags])
+        return [int(value or 0) for value in values]
+
+    def get(self, key: str):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def invalidate(self, tags):
+        pipeline = self.client.pipeline(transaction=False)
+        for tag in tags:
+            pipeline.incr(f"{self.prefix}tag:{tag}")
+        pipeline.execute()
+
+def create_backend(name: str = CACHE_BACKEND, workers: int = WEB_CONCURRENCY):
+    if name == "memory":
+        if workers > 1:
+            # invalidate_tags сбрасывает только кэш своего процесса: остальные воркеры
+            # отдавали бы устаревшие списки до CACHE_TTL, поэтому кэш выключается
+            logger.warning(
+                "CACHE_BACKEND=memory is per-process and WEB_CONCURRENCY=%s: response cache disabled, use CACHE_BACKEND=redis",
+                workers,
+            )
+            return None
+        return MemoryCacheBackend()
+    if name == "redis":
+        return RedisCacheBackend()
+    if name == "none":
+        return None
+    raise ValueError(f"Неизвестный CACHE_BACKEND: {name}")
+
+# None — кэш выключен
+response_cache = create_backend()
+
+def invalidate_tags(*tags):
+    """Сбрасывает закэшированные ответы, зависящие от tags. Вызывается обработчиками после commit."""
+    if response_cache is None:
+        return
+    try:
+        response_cache.invalidate(tags)
+    except Exception:
+        # Запись в БД уже выполнена; устаревший ответ проживёт не дольше CACHE_TTL
+        logger.error("Response cache invalidation failed for tags %s", tags, exc_info=True)
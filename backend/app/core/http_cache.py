@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+
+def make_etag(*values) -> str:
+    """Сильный ETag из значений, от которых зависит тело ответа.
+
+    Считается по исходным полям, а не по готовому JSON, поэтому для ответа 304
+    тело вообще не сериализуется.
+    """
+    digest = hashlib.sha256(repr(values).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def to_utc(moment: datetime) -> datetime:
+    # SQLite возвращает наивные даты; все даты в БД пишутся в UTC
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+def cache_headers(etag: str, last_modified: datetime = None) -> dict:
+    """Заголовки для повторной проверки ответа браузером или CDN (без устаревания по времени)."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(to_utc(last_modified), usegmt=True)
+    return headers
+
+# Срок для ресурсов, содержимое которых по адресу никогда не меняется (файлы по хэшу)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+def immutable_headers() -> dict:
+    """Заголовки для кэширования навсегда: браузер и CDN не перепроверяют ответ."""
+    expires = datetime.now(timezone.utc) + timedelta(seconds=IMMUTABLE_MAX_AGE)
+    return {
+        "Cache-Control": f"public, max-age={IMMUTABLE_MAX_AGE}, immutable",
+        "Expires": format_datetime(expires, usegmt=True),
+    }
+
+def is_not_modified(request_headers, etag: str, last_modified: datetime = None) -> bool:
+    """Нужно ли ответить 304 Not Modified (RFC 9110, 13.1.2 и 13.1.3).
+
+    If-None-Match имеет приоритет: If-Modified-Since учитывается, только если его нет.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Для GET сравнение слабое: W/"x" совпадает с "x"
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in candidates
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    # Last-Modified передаётся с точностью до секунды
+    return to_utc(last_modified).replace(microsecond=0) <= since
@@ -0,0 +1,64 @@
+from PIL import Image, ImageOps
+import os
+import posixpath
+import tempfile
+
+# Уменьшенные копии изображений: имя варианта → наибольшая сторона в пикселях.
+# Списки отдают thumb, детальные страницы — large; оригинал не увеличивается
+IMAGE_VARIANTS = {"large": 1280, "thumb": 320}
+VARIANT_FORMAT = "WEBP"
+VARIANT_EXTENSION = ".webp"
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+
+class InvalidImage(ValueError):
+    pass
+
+def variant_url(url: str, variant: str) -> str:
+    """Путь варианта рядом с оригиналом: /static/stamps/5.jpg → /static/stamps/5.thumb.webp."""
+    return f"{posixpath.splitext(url)[0]}.{variant}{VARIANT_EXTENSION}"
+
+def is_variant(filename: str) -> bool:
+    return any(filename.endswith(f".{variant}{VARIANT_EXTENSION}") for variant in IMAGE_VARIANTS)
+
+def render_variants(source_path: str, directory: str) -> dict:
+    """Декодирует изображение и пишет варианты во временные файлы в directory.
+
+    Возвращает {вариант: путь временного файла}. Варианты считаются от большего к меньшему,
+    каждый следующий — из предыдущего, а JPEG сразу декодируется в уменьшенном масштабе.
+    """
+    largest = max(IMAGE_VARIANTS.values())
+    try:
+        image = Image.open(source_path)
+        image.draft("RGB", (largest, largest))
+        image.load()
+    except Exception as error:
+        # Неизвестный формат, обрезанный файл или слишком большое разрешение (DecompressionBombError)
+        raise InvalidImage(str(error)) from error
+
+    rendered = {}
+    with image:
+        try:
+            current = ImageOps.exif_transpose(image)
+            has_alpha = "A" in current.getbands() or "transparency" in current.info
+            current = current.convert("RGBA" if has_alpha else "RGB")
+            for variant, size in sorted(IMAGE_VARIANTS.items(), key=lambda item: -item[1]):
+                current.thumbnail((size, size), Image.Resampling.LANCZOS)
+                fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+                rendered[variant] = temp_path
+                with os.fdopen(fd, "wb") as buffer:
+                    current.save(buffer, VARIANT_FORMAT, quality=IMAGE_VARIANT_QUALITY)
+        except BaseException:
+            for temp_path in rendered.values():
+                os.remove(temp_path)
+            raise
+    return rendered
+
+def remove_image(url: str, keep=()):
+    """Удаляет файл изображения и его варианты, кроме путей из keep."""
+    for path in [url, *(variant_url(url, variant) for variant in IMAGE_VARIANTS)]:
+        if path in keep:
+            continue
+        try:
+            os.remove(path.lstrip("/"))
+        except FileNotFoundError:
+            pass
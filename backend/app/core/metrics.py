@@ -0,0 +1,61 @@
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from app.core.database import get_engines_pool_stats
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "Количество HTTP-запросов",
+    ["method", "route", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP-запросы, обрабатываемые прямо сейчас",
+    ["method"],
+)
+DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Число SQL-запросов на один HTTP-запрос",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Суммарное время SQL-запросов на один HTTP-запрос",
+    ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+class PoolStatsCollector:
+    """Отдаёт статистику пулов соединений (см. get_engines_pool_stats) в момент сбора метрик."""
+
+    def collect(self):
+        gauges = {
+            "checked_out": GaugeMetricFamily("db_pool_checked_out", "Занятые соединения пула", labels=["engine"]),
+            "checked_in": GaugeMetricFamily("db_pool_checked_in", "Свободные соединения пула", labels=["engine"]),
+            "overflow": GaugeMetricFamily("db_pool_overflow", "Соединения сверх pool_size", labels=["engine"]),
+        }
+        counters = {
+            "checkouts": CounterMetricFamily("db_pool_checkouts", "Выдачи соединений из пула", labels=["engine"]),
+            "timeouts": CounterMetricFamily("db_pool_timeouts", "Таймауты ожидания соединения", labels=["engine"]),
+            "wait_time_total_ms": CounterMetricFamily(
+                "db_pool_wait_seconds", "Суммарное ожидание соединения", labels=["engine"]
+            ),
+        }
+        for engine_name, stats in get_engines_pool_stats().items():
+            for key, metric in gauges.items():
+                if key in stats:
+                    metric.add_metric([engine_name], stats[key])
+            for key, metric in counters.items():
+                if key in stats:
+                    value = stats[key] / 1000 if key == "wait_time_total_ms" else stats[key]
+                    metric.add_metric([engine_name], value)
+        yield from gauges.values()
+        yield from counters.values()
+
+REGISTRY.register(PoolStatsCollector())
@@ -0,0 +1,65 @@
+from contextvars import ContextVar
+from pathlib import Path
+from sqlalchemy import event
+import os
+import sys
+import time
+
+# Режим профилирования: заголовки X-DB-Queries / X-DB-Time-ms и лог самых медленных запросов.
+# Выключен по умолчанию; в выключенном состоянии SQL-тексты и места вызова не собираются.
+DB_PROFILE = os.getenv("DB_PROFILE", "0").lower() in ("1", "true", "yes")
+DB_PROFILE_TOP_N = int(os.getenv("DB_PROFILE_TOP_N", "5"))
+
+APP_DIR = str(Path(__file__).parent.parent)
+CORE_DIR = str(Path(__file__).parent)
+
+class QueryStats:
+    """Число SQL-запросов и суммарное время их выполнения в рамках одного HTTP-запроса."""
+
+    def __init__(self, profile: bool = False):
+        self.count = 0
+        self.total_time = 0.0
+        # (время, SQL, место вызова) — заполняется только в режиме профилирования
+        self.statements = [] if profile else None
+
+    def slowest(self, limit: int):
+        return sorted(self.statements or [], key=lambda item: item[0], reverse=True)[:limit]
+
+def find_call_site():
+    """Ближайший к запросу кадр кода приложения (эндпоинт, модель), минуя app/core."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and not filename.startswith(CORE_DIR):
+            return f"{os.path.relpath(filename, APP_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+# Устанавливается middleware на время обработки запроса; вне запроса — None
+current_query_stats: ContextVar = ContextVar("current_query_stats", default=None)
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.total_time += elapsed
+        if stats.statements is not None:
+            stats.statements.append((elapsed, statement, find_call_site()))
+
+def handle_error(exception_context):
+    # Для упавшего запроса after_cursor_execute не вызывается
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_time"):
+        connection.info["query_start_time"].pop()
+
+def track_queries(engine):
+    """Подключает подсчёт запросов к синхронному движку (для AsyncEngine — к engine.sync_engine)."""
+    if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
@@ -0,0 +1,92 @@
+from sqlalchemy import DDL, Float, Integer, event, func, literal_column, select, text
+import re
+
+# Конфигурация полнотекстового поиска Postgres: русская морфология, латиница — английский стеммер
+SEARCH_CONFIG = "russian"
+
+def postgres_search_ddl(table: str, weighted_columns: dict, trigram_column: str):
+    """DDL для Postgres: вычисляемый tsvector с весами, GIN-индекс по нему и триграммный индекс."""
+    vector = " || ".join(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({column}, '')), '{weight}')"
+        for column, weight in weighted_columns.items()
+    )
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING gin (search_vector)",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_{trigram_column}_trgm ON {table} USING gin ({trigram_column} gin_trgm_ops)",
+    ]
+
+def sqlite_search_ddl(table: str, columns):
+    """DDL для SQLite: внешняя FTS5-таблица {table}_fts и триггеры, которые держат её в синхроне."""
+    fts = f"{table}_fts"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, content='{table}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END",
+    ]
+
+def register_search_index(table, weighted_columns: dict, trigram_column: str):
+    """Создаёт поисковый индекс вместе с таблицей при metadata.create_all (тесты, бенчмарки).
+
+    weighted_columns — {колонка: вес A–D}; в рабочей БД Postgres то же создаёт миграция Alembic.
+    """
+    for statement in postgres_search_ddl(table.name, weighted_columns, trigram_column):
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+    for statement in sqlite_search_ddl(table.name, list(weighted_columns)):
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    # Триггеры удаляются вместе с таблицей, FTS-таблицу нужно удалить отдельно
+    event.listen(table, "before_drop", DDL(f"DROP TABLE IF EXISTS {table.name}_fts").execute_if(dialect="sqlite"))
+
+def fts5_match_query(query: str):
+    """Пользовательская строка → выражение MATCH для FTS5: все слова, каждое как префикс.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 во вводе не интерпретируются.
+    """
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words) or None
+
+def escape_like(value: str):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def ranked_matches(db, table, weighted_columns: dict, trigram_column: str, query: str):
+    """Подзапрос (id, rank) совпадений в table; чем больше rank, тем выше результат.
+
+    Postgres: tsvector @@ websearch_to_tsquery или подстрока в trigram_column (по триграммному индексу),
+    ранг — ts_rank_cd плюс триграммное сходство. SQLite: FTS5 MATCH, ранг — bm25 с весами колонок.
+    Возвращает None, если в запросе нет ни одного слова.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        search_vector = literal_column(f"{table.name}.search_vector")
+        column = table.c[trigram_column]
+        return (
+            select(
+                table.c.id.label("id"),
+                (func.ts_rank_cd(search_vector, tsquery) + func.similarity(column, query)).label("rank"),
+            )
+            .where(search_vector.op("@@")(tsquery) | column.ilike(f"%{escape_like(query)}%", escape="\\"))
+            .subquery("ranked")
+        )
+
+    match = fts5_match_query(query)
+    if match is None:
+        return None
+    fts = f"{table.name}_fts"
+    # Вес колонки в bm25: A — 10, B — 5, C — 2, D — 1
+    weights = ", ".join(str({"A": 10, "B": 5, "C": 2}.get(weight, 1)) for weight in weighted_columns.values())
+    return (
+        text(f"SELECT rowid AS id, -bm25({fts}, {weights}) AS rank FROM {fts} WHERE {fts} MATCH :match")
+        .bindparams(match=match)
+        .columns(id=Integer, rank=Float)
+        .subquery("ranked")
+    )
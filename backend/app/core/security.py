@@ -2,11 +2,19 @@ from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError, ExpiredSignatureError
 from fastapi import HTTPException
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import os
+import threading
+import time
 
 SECRET_KEY = "АФК ЛЕГЕНДА ДОТЫ"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -29,7 +37,61 @@ def verify_refresh_token(token: str):
     except JWTError:
         return None
     
+class VerifiedTokenCache:
+    """LRU-кэш проверенных claims access-токенов по SHA-256 токена.
+
+    Запись живёт до exp токена, поэтому подпись каждого токена проверяется
+    в процессе не больше одного раза. Сами токены в памяти не хранятся.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        # Обработчики в sync-режиме выполняются в пуле потоков
+        self.lock = threading.Lock()
+
+    def get(self, digest: bytes):
+        with self.lock:
+            claims = self.entries.get(digest)
+            if claims is None:
+                return None
+            if claims["exp"] <= time.time():
+                del self.entries[digest]
+                return None
+            self.entries.move_to_end(digest)
+            return claims
+
+    def put(self, digest: bytes, claims: dict):
+        # Без exp запись нельзя было бы инвалидировать по времени
+        if not isinstance(claims.get("exp"), (int, float)) or self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[digest] = claims
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+verified_tokens = VerifiedTokenCache(TOKEN_CACHE_SIZE)
+
+def decode_access_token(token: str):
+    """Claims access-токена; исключения те же, что у jwt.decode (ExpiredSignatureError, JWTError).
+
+    Возвращаемый словарь общий для всех запросов с этим токеном — не изменять.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = verified_tokens.get(digest)
+    if claims is None:
+        # Истёкший токен удаляется из кэша, и jwt.decode поднимет ExpiredSignatureError
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        verified_tokens.put(digest, claims)
+    return claims
+
 def get_payload_from_refresh_token(request):
+    # Middleware уже проверило токен и положило claims в request.state
+    payload = getattr(request.state, "token_claims", None)
+    if payload is not None:
+        return payload
+
     auth_header = getattr(request.state, "token", None)
     if not auth_header:
         auth_header = request.headers.get("Authorization")
@@ -37,11 +99,7 @@ def get_payload_from_refresh_token(request):
     access_token = auth_header.split(" ")[1]
 
     try:
-        payload = jwt.decode(
-            access_token,
-            SECRET_KEY,
-            algorithms=[ALGORITHM]
-        )
+        payload = decode_access_token(access_token)
     except ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except JWTError:
@@ -51,10 +109,68 @@ def get_payload_from_refresh_token(request):
     
     return payload
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Параметры Argon2 (по умолчанию — значения passlib). При их изменении старые хэши
+# пересчитываются при следующем успешном входе (см. verify_and_update_password)
+ARGON2_ROUNDS = int(os.getenv("ARGON2_ROUNDS", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # КиБ
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=ARGON2_ROUNDS,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
+
+# Argon2 намеренно тяжёлый по CPU и памяти: хэши считаются в отдельном ограниченном пуле,
+# а не в event loop и не в общем пуле потоков. argon2-cffi отпускает GIL, поэтому хватает потоков
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+
+class PasswordHashPool:
+    """Пул потоков для Argon2 с ограничением очереди.
+
+    Если задач (выполняемых и ожидающих) уже max_pending, новая сразу отклоняется
+    с 503 и Retry-After: всплеск логинов не копит бесконечную очередь и не тормозит остальной трафик.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.slots = threading.BoundedSemaphore(max_pending) if max_pending > 0 else None
+
+    async def run(self, fn, *args):
+        if self.slots is None or not self.slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=503,
+                detail="Сервер перегружен, попробуйте позже",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        # Слот освобождается по завершении вычисления, даже если клиент уже отключился
+        future.add_done_callback(lambda _: self.slots.release())
+        return await asyncio.wrap_future(future)
+
+password_hash_pool = PasswordHashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
 
 def get_password_hash(password: str):
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+async def hash_password(password: str):
+    """Хэш пароля, вычисленный в пуле password_hash_pool."""
+    return await password_hash_pool.run(get_password_hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Проверка пароля в пуле password_hash_pool.
+
+    Возвращает (верен ли пароль, новый хэш или None). Новый хэш возвращается,
+    если сохранённый посчитан с устаревшими параметрами pwd_context.
+    """
+    return await password_hash_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
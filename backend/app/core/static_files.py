@@ -0,0 +1,116 @@
+from mimetypes import guess_type
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from urllib.parse import quote
+from app.core.http_cache import immutable_headers
+from app.core.uploads import MEDIA_DIR
+import os
+
+# direct — /static отдаётся в обход middleware (app/middleware/static.py), app — как обычный маршрут
+STATIC_SERVING = os.getenv("STATIC_SERVING", "direct")
+# Сколько секунд браузер может не перепроверять файлы вне хранилища по хэшу; 0 — проверка по ETag каждый раз
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "0"))
+# Передача файла прокси вместо чтения в Python: x-accel-redirect (nginx) или x-sendfile (Apache, lighttpd)
+STATIC_SENDFILE = os.getenv("STATIC_SENDFILE", "")
+# internal-location nginx, из которой отдаются файлы при x-accel-redirect
+STATIC_ACCEL_PREFIX = os.getenv("STATIC_ACCEL_PREFIX", "/internal/static/")
+
+# Заранее сжатые копии рядом с файлом (app.css.br, app.css.gz) в порядке предпочтения
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+# Изображения (кроме SVG) уже сжаты: для них соседние файлы не ищутся
+COMPRESSIBLE_TYPES = ("application/javascript", "application/json", "application/xml", "image/svg+xml")
+
+def accepted_encodings(request_headers) -> set:
+    """Кодировки из Accept-Encoding, кроме явно запрещённых через q=0."""
+    encodings = set()
+    for item in request_headers.get("accept-encoding", "").split(","):
+        name, _, params = item.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        if name.strip():
+            encodings.add(name.strip().lower())
+    return encodings
+
+def is_compressible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+class MediaStaticFiles(StaticFiles):
+    """Раздача /static с заголовками кэширования.
+
+    Файлы хранилища по хэшу кэшируются навсегда. Остальные (аватарка по умолчанию, загрузки
+    до появления хранилища) могут смениться по тому же адресу и перепроверяются по ETag
+    через STATIC_MAX_AGE секунд. Range, ETag и 304 обрабатывает FileResponse; для текстовых
+    файлов отдаётся сжатая копия .br/.gz, если она лежит рядом и клиент её принимает.
+    """
+
+    def __init__(
+        self,
+        *,
+        directory,
+        immutable_directory: str = MEDIA_DIR,
+        max_age: int = None,
+        sendfile: str = None,
+        accel_prefix: str = None,
+        **kwargs,
+    ):
+        super().__init__(directory=directory, **kwargs)
+        # Путь внутри directory: static/media → media
+        self.immutable_prefix = os.path.basename(immutable_directory) + os.sep
+        self.max_age = STATIC_MAX_AGE if max_age is None else max_age
+        self.sendfile = (STATIC_SENDFILE if sendfile is None else sendfile).lower()
+        self.accel_prefix = STATIC_ACCEL_PREFIX if accel_prefix is None else accel_prefix
+        if self.sendfile not in ("", "x-accel-redirect", "x-sendfile"):
+            raise ValueError(f"Unknown STATIC_SENDFILE mode: {self.sendfile}")
+
+    def cache_control(self, path: str) -> dict:
+        if path.startswith(self.immutable_prefix):
+            return immutable_headers()
+        if self.max_age:
+            return {"Cache-Control": f"public, max-age={self.max_age}"}
+        return {"Cache-Control": "no-cache"}
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        path = self.get_path(scope)
+        media_type = guess_type(str(full_path))[0] or "application/octet-stream"
+        headers = self.cache_control(path)
+
+        if is_compressible(media_type):
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers)
+            for encoding, suffix in PRECOMPRESSED:
+                if encoding not in accepted:
+                    continue
+                try:
+                    compressed_stat = os.stat(f"{full_path}{suffix}")
+                except OSError:
+                    continue
+                # Свой ETag и Content-Length у сжатой копии получаются из её stat
+                full_path, stat_result = f"{full_path}{suffix}", compressed_stat
+                path = f"{path}{suffix}"
+                headers["Content-Encoding"] = encoding
+                break
+
+        if self.sendfile:
+            return self.sendfile_response(full_path, path, status_code, headers, media_type)
+
+        response = FileResponse(
+            full_path, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_result
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def sendfile_response(self, full_path, path, status_code, headers, media_type):
+        """Пустой ответ с адресом файла: тело, Range и условные запросы обрабатывает прокси."""
+        if self.sendfile == "x-accel-redirect":
+            url_path = "/".join(path.split(os.sep))
+            headers["X-Accel-Redirect"] = self.accel_prefix.rstrip("/") + "/" + quote(url_path)
+        else:
+            headers["X-Sendfile"] = os.path.abspath(full_path)
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
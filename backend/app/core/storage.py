@@ -0,0 +1,205 @@
+from datetime import datetime, timezone
+import base64
+import hashlib
+import os
+import shutil
+import uuid
+
+# Хранилище загруженных изображений: local — папка static на диске этого сервера,
+# s3 — S3-совместимое хранилище (AWS S3, MinIO), общее для всех серверов
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+# Адрес backend для файлов, которые отдаются через /static
+MEDIA_HOST = os.getenv("MEDIA_HOST", "http://localhost:8000")
+STATIC_ROOT = "static"
+
+S3_BUCKET = os.getenv("S3_BUCKET", "philatelist-media")
+# Пусто — AWS S3; для MinIO — адрес сервера, например http://localhost:9000
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+# Откуда браузер читает файлы (CDN или публичный адрес бакета); по умолчанию {S3_ENDPOINT_URL}/{S3_BUCKET}
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", "")
+# Время жизни подписанной ссылки для прямой загрузки
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "600"))
+
+# Файлы хранилища адресуются по хэшу и не меняются
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+class LocalStorage:
+    """Файлы в папке root на диске, отдаются через /static (app/core/static_files.py).
+
+    Прямая загрузка мимо API не поддерживается: файл всё равно записывается этим сервером.
+    """
+
+    def __init__(self, root: str = STATIC_ROOT, base_url: str = None):
+        self.root = root
+        self.base_url = base_url or f"{MEDIA_HOST}/{STATIC_ROOT}"
+        # Временные файлы загрузки пишутся рядом, чтобы save обходился жёсткой ссылкой и переименованием
+        self.temp_dir = os.path.join(root, "media")
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def size(self, key: str):
+        try:
+            return os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, source_path: str, content_type: str):
+        """Копирует локальный файл source_path в хранилище под ключом key; source_path остаётся."""
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = f"{target}.{uuid.uuid4().hex}.part"
+        try:
+            # Жёсткая ссылка вместо копирования: временные файлы лежат в той же файловой системе
+            os.link(source_path, partial)
+        except OSError:
+            shutil.copyfile(source_path, partial)
+        os.replace(partial, target)
+
+    def copy(self, source_key: str, key: str, content_type: str):
+        self.save(key, self.path(source_key), content_type)
+
+    def read(self, key: str, length: int) -> bytes:
+        with open(self.path(key), "rb") as source:
+            return source.read(length)
+
+    def checksum(self, key: str) -> str:
+        """SHA-256 содержимого в hex."""
+        digest = hashlib.sha256()
+        with open(self.path(key), "rb") as source:
+            while chunk := source.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def download(self, key: str, target_path: str):
+        with open(self.path(key), "rb") as source, open(target_path, "wb") as target:
+            while chunk := source.read(1024 * 1024):
+                target.write(chunk)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix: str):
+        """(ключ, время изменения) для всех файлов под prefix."""
+        for directory, _, filenames in os.walk(self.path(prefix)):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                yield key, datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+
+    def presign_upload(self, key: str, content_type: str, max_bytes: int, checksum: str = None):
+        return None
+
+class S3Storage:
+    """Бакет S3-совместимого хранилища; браузер читает файлы по S3_PUBLIC_URL
+    и загружает их напрямую по подписанной форме (presign_upload)."""
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: str = S3_ENDPOINT_URL, region: str = S3_REGION,
+                 public_url: str = S3_PUBLIC_URL, client=None):
+        if client is None:
+            import boto3  # необязательная зависимость, нужна только для STORAGE_BACKEND=s3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        endpoint = endpoint_url or f"https://{bucket}.s3.{region}.amazonaws.com"
+        self.base_url = (public_url or (f"{endpoint}/{bucket}" if endpoint_url else endpoint)).rstrip("/")
+        # Загрузка собирается во временной папке системы и затем отправляется в бакет
+        self.temp_dir = None
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def size(self, key: str):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self.size(key) is not None
+
+    def save(self, key: str, source_path: str, content_type: str):
+        self.client.upload_file(
+            source_path, self.bucket, key,
+            ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL},
+        )
+
+    def copy(self, source_key: str, key: str, content_type: str):
+        """Копирование внутри бакета: байты не проходят через сервер API."""
+        self.client.copy_object(
+            Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": source_key},
+            MetadataDirective="REPLACE", ContentType=content_type, CacheControl=IMMUTABLE_CACHE_CONTROL,
+        )
+
+    def read(self, key: str, length: int) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{length - 1}")["Body"].read()
+
+    def checksum(self, key: str) -> str:
+        """SHA-256 содержимого в hex, посчитанный хранилищем.
+
+        Объект, загруженный с x-amz-checksum-sha256, уже хранит сумму. Иначе (хранилища,
+        не поддерживающие суммы в POST) объект копируется сам в себя с ChecksumAlgorithm,
+        и сумму считает S3.
+        """
+        head = self.client.head_object(Bucket=self.bucket, Key=key, ChecksumMode="ENABLED")
+        checksum = head.get("ChecksumSHA256")
+        if checksum is None:
+            result = self.client.copy_object(
+                Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+                MetadataDirective="REPLACE", ContentType=head.get("ContentType", "binary/octet-stream"),
+                ChecksumAlgorithm="SHA256",
+            )
+            checksum = result["CopyObjectResult"]["ChecksumSHA256"]
+        return base64.b64decode(checksum).hex()
+
+    def download(self, key: str, target_path: str):
+        self.client.download_file(self.bucket, key, target_path)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def keys(self, prefix: str):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{prefix}/"):
+            for item in page.get("Contents", []):
+                yield item["Key"], item["LastModified"]
+
+    def presign_upload(self, key: str, content_type: str, max_bytes: int, checksum: str = None):
+        """Форма для POST прямо в бакет: ключ, тип и размер файла зафиксированы подписью.
+
+        checksum — SHA-256 файла в base64: S3 отклонит загрузку с другим содержимым
+        и сохранит сумму вместе с объектом.
+        """
+        fields = {"Content-Type": content_type}
+        if checksum:
+            fields.update({"x-amz-checksum-algorithm": "SHA256", "x-amz-checksum-sha256": checksum})
+        return self.client.generate_presigned_post(
+            self.bucket, key,
+            Fields=fields,
+            Conditions=[*({name: value} for name, value in fields.items()), ["content-length-range", 1, max_bytes]],
+            ExpiresIn=S3_PRESIGN_EXPIRES,
+        )
+
+def create_storage(name: str = STORAGE_BACKEND):
+    if name == "local":
+        return LocalStorage()
+    if name == "s3":
+        return S3Storage()
+    raise ValueError(f"Неизвестный STORAGE_BACKEND: {name}")
+
+media_storage = create_storage()
@@ -0,0 +1,309 @@
+from fastapi import BackgroundTasks, File, Form, HTTPException, Request, UploadFile, status
+from mimetypes import guess_type
+from starlette.concurrency import run_in_threadpool
+from app.core import storage
+from app.core.images import IMAGE_VARIANTS, InvalidImage, remove_image, render_variants, variant_url
+from app.core.security import get_payload_from_refresh_token
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import uuid
+
+logger = logging.getLogger("backend_logger")
+
+# Ограничение размера загружаемого изображения
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+DEFAULT_IMAGE_URL = "/static/avatars/default_avatar.png"
+
+# Загруженные изображения хранятся по хэшу содержимого под ключом media/ab/ab12….jpg
+# в app.core.storage. Одинаковые файлы сохраняются один раз, а содержимое по адресу никогда не меняется.
+# В БД записывается путь /static/media/…: он не зависит от STORAGE_BACKEND, а адрес для браузера
+# строится при сериализации (app/schemas/media.py)
+MEDIA_PREFIX = "media"
+MEDIA_DIR = f"{storage.STATIC_ROOT}/{MEDIA_PREFIX}"
+# Файлы, загруженные браузером напрямую в хранилище и ещё не проверенные: incoming/{user_id}/{uuid}
+INCOMING_PREFIX = "incoming"
+
+def media_path(digest: str, extension: str) -> str:
+    return f"/{MEDIA_DIR}/{digest[:2]}/{digest}{extension}"
+
+def media_digest(url: str):
+    """Хэш из пути загруженного файла или None для файлов вне хранилища (загрузки до его появления)."""
+    prefix = f"/{MEDIA_DIR}/"
+    if not url or not url.startswith(prefix):
+        return None
+    return os.path.splitext(url.rsplit("/", 1)[-1])[0]
+
+def media_key(url: str):
+    """Ключ в хранилище для пути из БД: /static/media/ab/…jpg → media/ab/…jpg."""
+    if media_digest(url) is None:
+        return None
+    return url.removeprefix(f"/{storage.STATIC_ROOT}/")
+
+def incoming_key(user_id) -> str:
+    return f"{INCOMING_PREFIX}/{user_id}/{uuid.uuid4().hex}"
+
+def is_incoming_key(key: str, user_id) -> bool:
+    # Пользователь может сослаться только на свою прямую загрузку
+    return re.fullmatch(rf"{INCOMING_PREFIX}/{re.escape(str(user_id))}/[0-9a-f]{{32}}", key) is not None
+
+# Сигнатуры (magic bytes) допустимых форматов и расширение, под которым сохраняется файл
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+def detect_image_extension(header: bytes):
+    """Расширение по первым байтам файла или None, если это не поддерживаемое изображение."""
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+def invalid_image():
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file type. Only images are allowed.")
+
+def too_large():
+    return HTTPException(status_code=413, detail=f"Файл больше {UPLOAD_MAX_BYTES // (1024 * 1024)} МБ")
+
+def missing_upload():
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Файл не найден в хранилище")
+
+class StagedUpload:
+    """Проверенное изображение и его уменьшенные варианты во временных файлах.
+
+    store кладёт их в хранилище под ключами по хэшу (локально — атомарным переименованием),
+    поэтому по URL никогда не отдаётся недописанный файл. Временные файлы живут до конца
+    запроса и удаляются discard. Для прямой загрузки (source_key) временных файлов нет:
+    store копирует объект внутри хранилища, а варианты строятся после ответа (render_stored_variants).
+    """
+
+    def __init__(self, temp_path: str, extension: str, digest: str = None, variants: dict = None, source_key: str = None):
+        self.temp_path = temp_path
+        self.extension = extension
+        self.digest = digest
+        self.variants = variants or {}
+        self.source_key = source_key
+        # Ссылку на файл учёл MediaBlob.acquire
+        self.acquired = False
+
+    @property
+    def url(self) -> str:
+        return media_path(self.digest, self.extension)
+
+    def store(self):
+        """Кладёт файл и варианты в хранилище; уже сохранённые (такое же содержимое) пропускаются.
+
+        Вызывается в пуле потоков до обработчика: в транзакции БД остаётся только счётчик ссылок.
+        """
+        backend = storage.media_storage
+        url = self.url
+        # Сначала варианты: к моменту появления оригинала в БД они уже на месте
+        targets = [(temp_path, variant_url(url, variant)) for variant, temp_path in self.variants.items()]
+        for temp_path, target in targets:
+            key = media_key(target)
+            if not backend.exists(key):
+                backend.save(key, temp_path, guess_type(target)[0])
+        key = media_key(url)
+        if backend.exists(key):
+            return
+        if self.source_key is not None:
+            backend.copy(self.source_key, key, guess_type(url)[0])
+        else:
+            backend.save(key, self.temp_path, guess_type(url)[0])
+
+    def ensure_stored(self):
+        """Повторно кладёт файл, если его удалила сборка мусора, завершившаяся между store и acquire.
+
+        Сборка удаляет файлы, пока строка media_blobs заблокирована, поэтому после commit
+        обработчика отсутствие оригинала означает, что удалены и варианты.
+        """
+        if not storage.media_storage.exists(media_key(self.url)):
+            self.store()
+
+    def discard(self):
+        for temp_path in [self.temp_path, *self.variants.values()]:
+            if temp_path is None:
+                continue
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+        self.temp_path = None
+        self.variants = {}
+
+def open_temp_file(directory: str):
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+    return os.fdopen(fd, "wb"), temp_path
+
+async def stage_image(upload: UploadFile, max_bytes: int = None) -> StagedUpload:
+    """Потоково пишет загрузку во временный файл, проверяя размер и сигнатуру изображения
+    и считая SHA-256, затем декодирует его и готовит уменьшенные варианты (app/core/images.py).
+
+    Диск и Pillow работают только в пуле потоков, event loop не блокируется.
+    """
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    if not (upload.content_type or "").startswith("image/"):
+        raise invalid_image()
+    if upload.size is not None and upload.size > max_bytes:
+        raise too_large()
+
+    header = await upload.read(UPLOAD_CHUNK_BYTES)
+    extension = detect_image_extension(header)
+    if extension is None:
+        raise invalid_image()
+
+    temp_dir = storage.media_storage.temp_dir
+    buffer, temp_path = await run_in_threadpool(open_temp_file, temp_dir)
+    staged = StagedUpload(temp_path, extension)
+    digest = hashlib.sha256()
+    try:
+        size = 0
+        chunk = header
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise too_large()
+            digest.update(chunk)
+            await run_in_threadpool(buffer.write, chunk)
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        await run_in_threadpool(buffer.close)
+        staged.digest = digest.hexdigest()
+        staged.variants = await run_in_threadpool(render_variants, temp_path, temp_dir)
+    except InvalidImage:
+        await run_in_threadpool(staged.discard)
+        raise invalid_image()
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(staged.discard)
+        raise
+    return staged
+
+def inspect_stored(key: str) -> StagedUpload:
+    backend = storage.media_storage
+    extension = detect_image_extension(backend.read(key, 16))
+    if extension is None:
+        raise InvalidImage("unsupported image format")
+    return StagedUpload(None, extension, backend.checksum(key), source_key=key)
+
+async def stage_stored_image(key: str, max_bytes: int = None) -> StagedUpload:
+    """То же, что stage_image, для файла, загруженного браузером напрямую в хранилище.
+
+    Байты через сервер не проходят: размер берётся из метаданных, сигнатура — из первых байтов,
+    SHA-256 считает хранилище. Изображение декодируется позже, при построении вариантов.
+    """
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    size = await run_in_threadpool(storage.media_storage.size, key)
+    if size is None:
+        raise missing_upload()
+    if size > max_bytes:
+        raise too_large()
+    try:
+        return await run_in_threadpool(inspect_stored, key)
+    except InvalidImage:
+        raise invalid_image()
+
+def render_stored_variants(url: str):
+    """Строит недостающие варианты файла хранилища по его оригиналу.
+
+    Выполняется фоновой задачей после ответа на прямую загрузку и из scripts.generate_image_variants.
+    Если оригинал уже удалён, ничего не делает.
+    """
+    backend = storage.media_storage
+    targets = {variant: media_key(variant_url(url, variant)) for variant in IMAGE_VARIANTS}
+    missing = {variant: key for variant, key in targets.items() if not backend.exists(key)}
+    if not missing or not backend.exists(media_key(url)):
+        return
+    buffer, temp_path = open_temp_file(backend.temp_dir)
+    buffer.close()
+    staged = StagedUpload(temp_path, None)
+    try:
+        backend.download(media_key(url), temp_path)
+        try:
+            staged.variants = render_variants(temp_path, backend.temp_dir)
+        except InvalidImage as error:
+            # Сигнатура прямой загрузки верна, но файл не декодируется: остаётся без вариантов
+            logger.warning(f"Image variants for {url} skipped: {error}")
+            return
+        for variant, key in missing.items():
+            backend.save(key, staged.variants[variant], guess_type(key)[0])
+    finally:
+        staged.discard()
+
+def image_upload(field: str = "image", required: bool = True):
+    """Зависимость FastAPI: файл из поля формы field или ключ прямой загрузки из поля {field}_key
+    (POST /api/uploads/presign), сохранённые через stage_image или stage_stored_image.
+
+    Обработчик получает StagedUpload (или None для необязательного поля без файла)
+    и передаёт его в MediaBlob.acquire. Файл кладётся в хранилище до обработчика, а после
+    успешного ответа проверяется ещё раз — всё в пуле потоков, вне транзакции и event loop.
+    Если обработчик не сослался на файл или завершился ошибкой, файл удаляется, когда на него
+    нет других ссылок (app.models.media.collect_upload). Прямая загрузка удаляется из incoming
+    в любом случае.
+    """
+    async def dependency(
+        request: Request,
+        background_tasks: BackgroundTasks,
+        upload: UploadFile = File(None, alias=field),
+        key: str = Form(None, alias=f"{field}_key"),
+    ):
+        from app.models.media import collect_upload  # модели импортируют этот модуль
+
+        if key:
+            if not is_incoming_key(key, get_payload_from_refresh_token(request).get("sub")):
+                raise missing_upload()
+            try:
+                staged = await stage_stored_image(key)
+            except BaseException:
+                await run_in_threadpool(storage.media_storage.delete, key)
+                raise
+        elif upload is not None and upload.filename:
+            staged = await stage_image(upload)
+        elif required:
+            raise invalid_image()
+        else:
+            yield None
+            return
+        try:
+            await run_in_threadpool(staged.store)
+            if staged.source_key is not None:
+                # Выполняется только после успешного ответа; без оригинала ничего не делает
+                background_tasks.add_task(render_stored_variants, staged.url)
+            try:
+                yield staged
+            except BaseException:
+                # Транзакция обработчика откатилась вместе с acquire
+                await collect_upload(request, staged)
+                raise
+            if staged.acquired:
+                await run_in_threadpool(staged.ensure_stored)
+            else:
+                await collect_upload(request, staged)
+        finally:
+            if staged.source_key is not None:
+                await run_in_threadpool(storage.media_storage.delete, staged.source_key)
+            await run_in_threadpool(staged.discard)
+
+    return dependency
+
+def remove_media(url: str):
+    """Удаляет файл хранилища и его варианты."""
+    backend = storage.media_storage
+    for path in [url, *(variant_url(url, variant) for variant in IMAGE_VARIANTS)]:
+        backend.delete(media_key(path))
+
+def remove_uploaded(url: str):
+    """Удаляет изображение, загруженное до появления хранилища, вместе с вариантами
+    (общую аватарку по умолчанию — никогда). Такие файлы всегда лежат на локальном диске."""
+    if url and url != DEFAULT_IMAGE_URL:
+        remove_image(url)
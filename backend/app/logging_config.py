@@ -1,5 +1,10 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
 
 LOG_DIR = "logs"
 LOG_FILE = "backend.log"
@@ -9,13 +14,66 @@ if not os.path.exists(LOG_DIR):
 
 log_path = os.path.join(LOG_DIR, LOG_FILE)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_path),
-        logging.StreamHandler()
-    ]
+class JsonFormatter(logging.Formatter):
+    """Одна запись лога — одна строка JSON; поля из extra={"fields": {...}} попадают на верхний уровень."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        # После очереди трейсбек приходит уже текстом в exc_text (см. StructuredQueueHandler)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не склеивает трейсбек с сообщением.
+
+    Стандартный prepare форматирует запись целиком в msg и обнуляет exc_info/exc_text,
+    из-за чего JsonFormatter получал трейсбек внутри "message". Здесь в msg попадает
+    только текст сообщения, а трейсбек сохраняется строкой в exc_text.
+    """
+
+    def prepare(self, record):
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = formatter.formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+formatter = JsonFormatter()
+file_handler = logging.FileHandler(log_path, encoding="utf-8")
+file_handler.setFormatter(formatter)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+
+# Обработчики пишут в файл и консоль в отдельном потоке QueueListener,
+# а в потоке event loop запись только кладётся в неограниченную очередь
+log_queue = queue.SimpleQueue()
+queue_listener = logging.handlers.QueueListener(
+    log_queue, file_handler, stream_handler, respect_handler_level=True
 )
+queue_listener.start()
+atexit.register(queue_listener.stop)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(StructuredQueueHandler(log_queue))
 
 logger = logging.getLogger("backend_logger")
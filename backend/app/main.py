@@ -2,13 +2,24 @@ from fastapi import FastAPI
 from app.api.routers import api_router
 from app.middleware.auto_refresh import auto_refresh_token_middleware
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from app.middleware.logging import LoggingMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.cache import ResponseCacheMiddleware
+from app.middleware.static import StaticFilesMiddleware
+from app.middleware.upload_limit import UploadSizeLimitMiddleware
+from app.core.static_files import MediaStaticFiles, STATIC_SERVING
+from app.api.endpoints import metrics
 import app.logging_config  # to initialize logging config
 
 app = FastAPI(title="PhilateList")
 
+# Добавлен первым, поэтому внутренний: попадания в кэш тоже проходят через логи и метрики
+app.add_middleware(ResponseCacheMiddleware)
+
+# Слишком большие загрузки отклоняются до разбора multipart; ответ 413 проходит через логи, CORS и метрики
+app.add_middleware(UploadSizeLimitMiddleware)
+
 app.add_middleware(LoggingMiddleware)
 
 app.middleware("http")(auto_refresh_token_middleware)
@@ -19,9 +30,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Разрешить все методы
     allow_headers=["*"],  # Разрешить все заголовки
+    expose_headers=["X-Request-ID", "X-DB-Queries", "X-DB-Time-ms", "X-Cache"],  # Диагностика доступна из браузера
 )
 
+# Внешний для API: учитывает все запросы, в том числе отклонённые авторизацией
+app.add_middleware(MetricsMiddleware)
+
 static_path = Path(__file__).parent.parent / "static"
-app.mount("/static", StaticFiles(directory=str(static_path)), name="static")
+# Загрузки лежат в static/media под хэшем содержимого и кэшируются навсегда
+static_files = MediaStaticFiles(directory=str(static_path))
+app.mount("/static", static_files, name="static")
+if STATIC_SERVING == "direct":
+    # Добавлен последним, поэтому самый внешний: файлы отдаются до всех остальных middleware
+    app.add_middleware(StaticFilesMiddleware, path="/static", static_app=static_files)
 
 app.include_router(api_router, prefix="/api")
+app.include_router(metrics.router)
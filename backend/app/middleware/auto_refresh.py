@@ -1,98 +1,69 @@
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
-from jose import jwt, JWTError, ExpiredSignatureError
+from jose import JWTError, ExpiredSignatureError
 from datetime import datetime
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, open_db, run_db
 from app.models.user import User
 from app.core.security import (
-    SECRET_KEY,
-    ALGORITHM,
     create_access_token,
+    decode_access_token,
     verify_refresh_token,
 )
 import re
 
-EXCLUDED_PATHS = [
-    "/api/auth/", 
+# Пути, доступные без токена (проверяется префикс)
+PUBLIC_PREFIXES = (
+    "/api/auth/",
     "/api/profiles/",  # Исключает все пути, начинающиеся с /api/profiles/
     "/static/",
-    "/docs", 
-    "/openapi.json", 
+    "/docs",
+    "/openapi.json",
     "/redoc",
+    "/metrics",  # Проверяет собственный токен METRICS_TOKEN, а не токен пользователя
     "/api/collections",
-    "/api/stamps"
-]
-
-async def auto_refresh_token_middleware(request: Request, call_next):
-    # Проверяем, является ли путь /api/profiles/{user_id}/settings
-    is_user_settings_path = re.match(
-        r'^/api/profiles/\d+/user_settings$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
-
-    is_collections_delete_path = re.match(
-        r'^/api/collections/delete/\d+$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
-
-    is_collections_update_path = re.match(
-        r'^/api/collections/update/\d+$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
-
-    is_stamps_update_path = re.match(
-        r'^/api/stamps/update/\d+$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
-
-    is_stamps_delete_path = re.match(
-        r'^/api/stamps/delete/\d+$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
-
-    is_users_update_path = re.match(
-        r'^/api/profiles/users/\d+$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
-
-    is_profiles_update_path = re.match(
-        r'^/api/profiles/collectors/\d+$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
-
-    is_collections_create_path = re.match(
-        r'^/api/collections/create$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
+    "/api/stamps",
+    "/api/search",
+)
 
-    is_stamps_create_path = re.match(
-        r'^/api/stamps/create$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
+# Маршруты внутри публичных префиксов, которые всё равно требуют токен.
+# {param} — числовой параметр пути. Новый защищённый эндпоинт добавляется сюда одной строкой.
+PROTECTED_ROUTES = (
+    "/api/auth/logout",
+    "/api/auth/delete",
+    "/api/profiles/{user_id}/user_settings",
+    "/api/profiles/{user_id}/collector_settings",
+    "/api/profiles/{user_id}/change_avatar",
+    "/api/profiles/users/{user_id}",
+    "/api/profiles/collectors/{user_id}",
+    "/api/collections/create",
+    "/api/collections/update/{collection_id}",
+    "/api/collections/delete/{collection_id}",
+    "/api/stamps/create",
+    "/api/stamps/update/{stamp_id}",
+    "/api/stamps/delete/{stamp_id}",
+)
 
-    is_collector_settings_path = re.match(
-        r'^/api/profiles/\d+/collector_settings$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
+def compile_public_path_pattern(public_prefixes, protected_routes):
+    """Собирает политику доступа в одно регулярное выражение.
 
-    is_change_avatar_path = re.match(
-        r'^/api/profiles/\d+/change_avatar$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
+    Путь публичный, если начинается с одного из public_prefixes и целиком
+    не совпадает ни с одним из protected_routes. Всё остальное защищено.
+    """
+    protected = "|".join(
+        r"\d+".join(re.escape(part) for part in re.split(r"\{\w+\}", route))
+        for route in protected_routes
+    )
+    public = "|".join(re.escape(prefix) for prefix in public_prefixes)
+    return re.compile(rf"(?!(?:{protected})$)(?:{public})")
 
-    is_logout_path = re.match(
-        r'^/api/auth/logout$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
+PUBLIC_PATH_PATTERN = compile_public_path_pattern(PUBLIC_PREFIXES, PROTECTED_ROUTES)
 
-    is_delete_path = re.match(
-        r'^/api/auth/delete$',  # \d+ — только цифры для user_id
-        request.url.path
-    ) is not None
+def is_public_path(path: str) -> bool:
+    return PUBLIC_PATH_PATTERN.match(path) is not None
 
-    # Если путь исключен И НЕ является /api/profiles/{user_id}/settings
-    if any(request.url.path.startswith(p) for p in EXCLUDED_PATHS) and not is_user_settings_path and not is_stamps_update_path and not is_profiles_update_path and not is_users_update_path and not is_collections_update_path and not is_stamps_delete_path and not is_collections_delete_path and not is_stamps_create_path and not is_collections_create_path and not is_change_avatar_path and not is_collector_settings_path and not is_logout_path and not is_delete_path:
+async def auto_refresh_token_middleware(request: Request, call_next):
+    if is_public_path(request.url.path):
         return await call_next(request)
     
     # Остальная логика middleware...
@@ -104,14 +75,9 @@ async def auto_refresh_token_middleware(request: Request, call_next):
         )
     
     access_token = auth_header.split(" ")[1]
-    db: Session = next(get_db())
 
     try:
-        payload = jwt.decode(
-            access_token,
-            SECRET_KEY,
-            algorithms=[ALGORITHM]
-        )
+        payload = decode_access_token(access_token)
         exp = payload.get("exp")
         if not exp:
             return JSONResponse(
@@ -119,15 +85,28 @@ async def auto_refresh_token_middleware(request: Request, call_next):
                 content={"detail": "Токен не содержит времени истечения"},
             )
         
+        # Обработчики берут проверенные claims отсюда, не декодируя токен повторно
+        request.state.token_claims = payload
         return await call_next(request)
 
     except ExpiredSignatureError:
         refresh_token = request.cookies.get("refresh_token")
         if not refresh_token:
-            raise HTTPException(status_code=401, detail="Refresh token отсутствует")
+            return JSONResponse(
+                status_code=401,
+                content={"detail": "Refresh token отсутствует"},
+            )
+
+        # Сессия БД нужна только здесь: открываем её через ту же зависимость, что и обработчики,
+        # и закрываем сразу после поиска пользователя, до вызова самого обработчика
+        try:
+            async with open_db(request.app.dependency_overrides.get(get_db, get_db)) as db:
+                new_access_token = await run_db(db, refresh_access_token, refresh_token)
+        except HTTPException as e:
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
 
-        new_access_token = await refresh_access_token(refresh_token, db)
         request.state.token = f"Bearer {new_access_token}"
+        request.state.token_claims = decode_access_token(new_access_token)
         response = await call_next(request)
         response.headers["New-Access-Token"] = new_access_token
         return response
@@ -137,7 +116,7 @@ async def auto_refresh_token_middleware(request: Request, call_next):
             content={"detail": "Недействительный токен"},
         )
 
-async def refresh_access_token(refresh_token: str, db: Session):
+def refresh_access_token(db: Session, refresh_token: str):
     payload = verify_refresh_token(refresh_token)
     if not payload:
         raise HTTPException(status_code=401, detail="Недействительный refresh token")
@@ -148,4 +127,4 @@ async def refresh_access_token(refresh_token: str, db: Session):
         raise HTTPException(status_code=401, detail="Пользователь не найден")
     
     new_access_token = create_access_token(data={"sub": str(user.id)})
-    return new_access_token
\ No newline at end of file
+    return new_access_token
@@ -0,0 +1,104 @@
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from urllib.parse import parse_qsl, urlencode
+from app.core import cache
+from app.core.cache import STAMPS, COLLECTIONS, COLLECTORS
+from app.logging_config import logger
+
+# Публичные списки, одинаковые для всех посетителей, и теги данных, от которых они зависят.
+# Обработчики записи сбрасывают теги через invalidate_tags; новый список добавляется сюда одной строкой
+CACHED_ROUTES = {
+    "/api/stamps/": (STAMPS,),
+    "/api/stamps/top_expensive": (STAMPS,),
+    "/api/stamps/grouped_rare": (STAMPS, COLLECTIONS, COLLECTORS),
+    "/api/collections": (COLLECTIONS,),
+    "/api/collections/top_expensive": (COLLECTIONS, STAMPS),
+    "/api/collections/grouped": (COLLECTIONS, STAMPS, COLLECTORS),
+    "/api/profiles/list": (COLLECTORS, COLLECTIONS, STAMPS),
+    "/api/profiles/most_expensive_stamp_collector": (COLLECTORS, COLLECTIONS, STAMPS),
+    "/api/profiles/max_rare_stamp_collector": (COLLECTORS, COLLECTIONS, STAMPS),
+    "/api/profiles/sorted_by_collection_value": (COLLECTORS, COLLECTIONS, STAMPS),
+    "/api/profiles/collectors_with_old_stamps": (COLLECTORS, COLLECTIONS, STAMPS),
+}
+
+def cache_key(scope, versions):
+    # Параметры сортируются, чтобы ?a=1&b=2 и ?b=2&a=1 попадали в одну запись
+    query = urlencode(sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)))
+    return f"{scope['path']}?{query}|{':'.join(map(str, versions))}"
+
+async def call_backend(backend, method, *args):
+    # Сетевой клиент (Redis) синхронный — вызываем его вне event loop
+    if isinstance(backend, cache.RedisCacheBackend):
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+class ResponseCacheMiddleware:
+    """ASGI middleware: отдаёт закэшированные ответы GET для CACHED_ROUTES, не вызывая обработчик.
+
+    Кэшируются только ответы 200 не больше CACHE_MAX_ENTRY_BYTES. Версии тегов читаются
+    до обработки запроса, поэтому ответ, собранный до инвалидации, сохраняется под старыми
+    версиями и после записи в БД уже не отдаётся.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        backend = cache.response_cache
+        tags = CACHED_ROUTES.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if backend is None or tags is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            versions = await call_backend(backend, backend.tag_versions, tags)
+            key = cache_key(scope, versions)
+            cached = await call_backend(backend, backend.get, key)
+        except Exception:
+            # Недоступный кэш не должен ломать чтение: запрос обрабатывается как обычно
+            logger.warning("Response cache is unavailable", exc_info=True)
+            await self.app(scope, receive, send)
+            return
+
+        if cached is not None:
+            content_type, body = cached.split(b"\0", 1)
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", content_type),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-cache", b"HIT"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        content_type = None
+        chunks = []
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal content_type, chunks, size
+            if message["type"] == "http.response.start":
+                if message["status"] == 200:
+                    headers = MutableHeaders(scope=message)
+                    content_type = headers.get("content-type", "application/json").encode("latin-1")
+                    headers.append("X-Cache", "MISS")
+            elif message["type"] == "http.response.body" and content_type is not None and chunks is not None:
+                body = message.get("body", b"")
+                size += len(body)
+                # Слишком большой ответ не кэшируется и не копится в памяти
+                if size > cache.CACHE_MAX_ENTRY_BYTES:
+                    chunks = None
+                else:
+                    chunks.append(body)
+            await send(message)
+
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and chunks is not None and content_type is not None:
+                try:
+                    await call_backend(backend, backend.set, key, content_type + b"\0" + b"".join(chunks), cache.CACHE_TTL)
+                except Exception:
+                    logger.warning("Response cache is unavailable", exc_info=True)
+
+        await self.app(scope, receive, send_wrapper)
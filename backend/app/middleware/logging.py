@@ -1,15 +1,72 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Mount
 import time
+import uuid
 from app.logging_config import logger
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        response: Response = await call_next(request)
-        process_time = (time.time() - start_time) * 1000
-        logger.info(
-            f"{request.method} {request.url.path} - Status: {response.status_code} - Time: {process_time:.2f}ms"
-        )
-        return response
+def route_template(scope):
+    """Шаблон маршрута запроса (например, /api/stamps/{stamp_id}) или None, если маршрут не найден.
+
+    Доступен только после роутинга, т.е. когда запрос уже обработан.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return None
+    if isinstance(route, Mount):
+        template += "/{path}"
+    # Маршруты из include_router в новых версиях FastAPI хранят путь без префикса роутера:
+    # достраиваем префикс из фактического пути (в префиксах нет параметров)
+    path = scope["path"]
+    prefix_depth = path.count("/") - template.count("/")
+    if prefix_depth > 0 and not isinstance(route, Mount):
+        template = "/".join(path.split("/")[:prefix_depth + 1]) + template
+    return template
+
+class LoggingMiddleware:
+    """ASGI middleware: одна структурированная запись лога на каждый HTTP-запрос.
+
+    Работает на уровне ASGI-сообщений, поэтому не оборачивает тело ответа
+    и не ломает потоковые ответы, в отличие от BaseHTTPMiddleware.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter_ns()
+        request_id = Headers(scope=scope).get("x-request-id") or uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
+        status_code = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("X-Request-ID", request_id)
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            process_time = (time.perf_counter_ns() - start_time) / 1_000_000
+            route = route_template(scope)
+            logger.info(
+                f"{scope['method']} {scope['path']} - Status: {status_code} - Time: {process_time:.2f}ms",
+                extra={"fields": {
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status_code,
+                    "latency_ms": round(process_time, 3),
+                    "bytes": response_bytes,
+                }},
+            )
@@ -0,0 +1,75 @@
+from starlette.datastructures import MutableHeaders
+import time
+from app.core import query_stats as query_profiler
+from app.core.metrics import REQUESTS, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, DB_QUERIES, DB_TIME
+from app.core.query_stats import QueryStats, current_query_stats
+from app.logging_config import logger
+from app.middleware.logging import route_template
+
+class MetricsMiddleware:
+    """ASGI middleware: счётчики, гистограммы задержки и SQL-запросов по шаблону маршрута.
+
+    При DB_PROFILE=1 дополнительно отдаёт X-DB-Queries / X-DB-Time-ms
+    и пишет в лог самые медленные SQL-запросы с местами вызова.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        profile = query_profiler.DB_PROFILE
+        query_stats = QueryStats(profile=profile)
+        token = current_query_stats.set(query_stats)
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        start_time = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profile:
+                    # Для потоковых ответов учитываются запросы, выполненные до начала ответа
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-DB-Queries", str(query_stats.count))
+                    headers.append("X-DB-Time-ms", f"{query_stats.total_time * 1000:.2f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            in_flight.dec()
+            current_query_stats.reset(token)
+            # Сырые пути не используются как метки, чтобы не раздувать число временных рядов
+            route = route_template(scope) or "unmatched"
+            REQUESTS.labels(method, route, str(status_code)).inc()
+            REQUEST_LATENCY.labels(method, route).observe(elapsed)
+            DB_QUERIES.labels(method, route).observe(query_stats.count)
+            DB_TIME.labels(method, route).observe(query_stats.total_time)
+            if profile:
+                log_slowest_queries(scope, route, query_stats)
+
+def log_slowest_queries(scope, route, query_stats):
+    slowest = query_stats.slowest(query_profiler.DB_PROFILE_TOP_N)
+    if not slowest:
+        return
+    logger.info(
+        f"DB profile {scope['method']} {scope['path']} - Queries: {query_stats.count} - Time: {query_stats.total_time * 1000:.2f}ms",
+        extra={"fields": {
+            "request_id": scope.get("state", {}).get("request_id"),
+            "route": route,
+            "db_queries": query_stats.count,
+            "db_time_ms": round(query_stats.total_time * 1000, 3),
+            "slowest_queries": [
+                {"time_ms": round(elapsed * 1000, 3), "statement": statement, "call_site": call_site}
+                for elapsed, statement, call_site in slowest
+            ],
+        }},
+    )
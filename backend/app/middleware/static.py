@@ -0,0 +1,33 @@
+from starlette.exceptions import HTTPException
+from starlette.responses import PlainTextResponse
+
+class StaticFilesMiddleware:
+    """ASGI middleware: запросы к path сразу отдаются static_app, минуя остальной стек.
+
+    Добавляется последним (внешним): логи, метрики, обновление токена и кэш ответов
+    для каждой картинки не нужны. Ошибки StaticFiles (404, 405) переводятся в ответы здесь же,
+    потому что обработчик исключений FastAPI в обход тоже не вызывается.
+    """
+
+    def __init__(self, app, path: str, static_app):
+        self.app = app
+        self.path = path.rstrip("/")
+        self.static_app = static_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        root_path = scope.get("root_path", "")
+        route_path = scope["path"].removeprefix(root_path)
+        if not route_path.startswith(self.path + "/"):
+            await self.app(scope, receive, send)
+            return
+
+        # Так же, как Mount: StaticFiles читает путь файла относительно root_path
+        scope = {**scope, "root_path": root_path + self.path}
+        try:
+            await self.static_app(scope, receive, send)
+        except HTTPException as exc:
+            response = PlainTextResponse(exc.detail, status_code=exc.status_code, headers=exc.headers)
+            await response(scope, receive, send)
@@ -0,0 +1,50 @@
+from starlette.responses import JSONResponse
+from app.core import uploads
+
+# Запас на остальные поля формы и заголовки частей multipart
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware: multipart-запросы больше UPLOAD_MAX_BYTES отклоняются с 413 до разбора формы.
+
+    Starlette сохраняет файлы формы во временные файлы целиком, ещё до обработчика и stage_image,
+    поэтому без этой проверки большой файл сначала занимал бы диск и время воркера.
+    Запрос с Content-Length отклоняется сразу, без него — как только тело превысит предел
+    (HTTPException из receive FastAPI пробрасывает как есть).
+    """
+
+    def __init__(self, app, max_bytes: int = None):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.is_multipart(scope):
+            await self.app(scope, receive, send)
+            return
+
+        limit = (uploads.UPLOAD_MAX_BYTES if self.max_bytes is None else self.max_bytes) + FORM_OVERHEAD_BYTES
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self.reject(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise uploads.too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def is_multipart(self, scope) -> bool:
+        content_type = dict(scope["headers"]).get(b"content-type", b"")
+        return content_type.lower().startswith(b"multipart/form-data")
+
+    async def reject(self, scope, receive, send):
+        response = JSONResponse({"detail": uploads.too_large().detail}, status_code=413, headers={"Connection": "close"})
+        await response(scope, receive, send)
@@ -2,15 +2,21 @@ from sqlalchemy import Column, Integer, String, ForeignKey
 from sqlalchemy.orm import relationship, Session
 from .base import Base
 from app.models.stamp import Stamp # for model
+from app.core.search import register_search_index, ranked_matches
+
+# Поля полнотекстового поиска и их веса (A — самый значимый)
+COLLECTION_SEARCH_COLUMNS = {"name": "A", "description": "B"}
 
 class Collection(Base):
     __tablename__ = "collections"
 
     id = Column(Integer, primary_key=True)
-    collector_id = Column(Integer, ForeignKey("collectors.user_id"), nullable=False)
+    collector_id = Column(Integer, ForeignKey("collectors.user_id"), nullable=False, index=True)
     name = Column(String(100), nullable=False)
     description = Column(String(500), nullable=True)
     photo_url = Column(String, nullable=False, default="/static/avatars/default_avatar.png")
+    # Суммарная стоимость марок коллекции; поддерживается Collector.adjust_stamp_totals
+    total_cost = Column(Integer, nullable=False, default=0, server_default="0", index=True)
     
     # Связь один-к-одному с Stamp
     stamps = relationship("Stamp", back_populates="collection", cascade="all, delete-orphan")
@@ -25,4 +31,17 @@ class Collection(Base):
             .all()
         )
 
-        return collections
\ No newline at end of file
+        return collections
+
+    def search(db: Session, query: str):
+        """Query коллекций по поисковой строке, от самых релевантных; None, если искать нечего."""
+        ranked = ranked_matches(db, Collection.__table__, COLLECTION_SEARCH_COLUMNS, "name", query)
+        if ranked is None:
+            return None
+        return (
+            db.query(Collection)
+            .join(ranked, ranked.c.id == Collection.id)
+            .order_by(ranked.c.rank.desc(), Collection.id)
+        )
+
+register_search_index(Collection.__table__, COLLECTION_SEARCH_COLUMNS, "name")
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, func, distinct
 from sqlalchemy.orm import relationship, Session
 from .base import Base
 from app.models.collection import Collection # for model
+from app.models.stamp import Stamp
 from fastapi import HTTPException
 
 class Collector(Base):
@@ -14,6 +15,8 @@ class Collector(Base):
     first_name = Column(String(50), nullable=True)
     last_name = Column(String(50), nullable=True)
     middle_name = Column(String(50), nullable=True)  # Отчество может быть пустым
+    # Суммарная стоимость марок во всех коллекциях; поддерживается adjust_stamp_totals
+    total_value = Column(Integer, nullable=False, default=0, server_default="0", index=True)
 
     # Связи
     user = relationship("User", back_populates="collector")
@@ -25,3 +28,63 @@ class Collector(Base):
             raise HTTPException(status_code=400, detail="Коллекционер не найден с таким ID!")
         
         return collector
+
+    def adjust_stamp_totals(db: Session, collection_id: int, delta):
+        """Сдвигает стоимость коллекции и её владельца на delta при добавлении, изменении или удалении марки.
+
+        Обновления выполняются в БД как x = x + delta, поэтому параллельные изменения не теряются.
+        Коммит остаётся за вызывающим кодом — в той же транзакции, что и изменение марки.
+        """
+        if not delta:
+            return
+        db.query(Collection).filter(Collection.id == collection_id).update(
+            {Collection.total_cost: Collection.total_cost + delta}, synchronize_session=False
+        )
+        owner_id = db.query(Collection.collector_id).filter(Collection.id == collection_id).scalar_subquery()
+        Collector.adjust_total_value(db, owner_id, delta)
+
+    def adjust_total_value(db: Session, collector_id, delta):
+        if not delta:
+            return
+        db.query(Collector).filter(Collector.user_id == collector_id).update(
+            {Collector.total_value: Collector.total_value + delta}, synchronize_session=False
+        )
+
+    def rebuild_totals(db: Session):
+        """Пересчитывает total_cost коллекций и total_value коллекционеров по таблице марок (для бэкфилла)."""
+        collection_total = (
+            db.query(func.coalesce(func.sum(Stamp.cost), 0))
+            .filter(Stamp.collection_id == Collection.id)
+            .scalar_subquery()
+        )
+        db.query(Collection).update({Collection.total_cost: collection_total}, synchronize_session=False)
+        collector_total = (
+            db.query(func.coalesce(func.sum(Collection.total_cost), 0))
+            .filter(Collection.collector_id == Collector.user_id)
+            .scalar_subquery()
+        )
+        db.query(Collector).update({Collector.total_value: collector_total}, synchronize_session=False)
+        db.commit()
+
+    def get_summaries(db: Session):
+        """Коллекционеры с именем пользователя, числом коллекций и марок и общей стоимостью марок.
+
+        Возвращает Query со строками (Collector, username, collection_count, stamp_count, total_value),
+        которые считаются одним GROUP BY. Вызывающий код может дополнить его фильтрами,
+        сортировкой (например, по ``desc("total_value")``) и лимитом.
+        """
+        from app.models.user import User
+
+        return (
+            db.query(
+                Collector,
+                User.username.label("username"),
+                func.count(distinct(Collection.id)).label("collection_count"),
+                func.count(Stamp.id).label("stamp_count"),
+                func.coalesce(func.sum(Stamp.cost), 0).label("total_value"),
+            )
+            .join(User, User.id == Collector.user_id)
+            .outerjoin(Collection, Collection.collector_id == Collector.user_id)
+            .outerjoin(Stamp, Stamp.collection_id == Collection.id)
+            .group_by(Collector.user_id, User.id)
+        )
@@ -0,0 +1,140 @@
+from collections import Counter
+from fastapi import Request
+from sqlalchemy import Column, DateTime, Integer, String, delete, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from .base import Base
+from app.core.database import get_db, open_db, run_db
+from app.core.uploads import StagedUpload, media_digest, media_path, remove_media, remove_uploaded
+
+class MediaBlob(Base):
+    """Файл в хранилище по хэшу (app/core/uploads.py, app/core/storage.py) и число ссылок на него
+    из stamps.photo_url, collections.photo_url и collectors.avatar_url."""
+    __tablename__ = "media_blobs"
+
+    digest = Column(String(64), primary_key=True)  # SHA-256 содержимого
+    extension = Column(String(10), nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    @property
+    def url(self) -> str:
+        return media_path(self.digest, self.extension)
+
+    def acquire(db: Session, staged: StagedUpload) -> str:
+        """Учитывает новую ссылку на загруженный файл; возвращает путь.
+
+        Сам файл уже в хранилище (image_upload): в транзакции не выполняется ввод-вывод хранилища.
+        """
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        statement = insert(MediaBlob).values(digest=staged.digest, extension=staged.extension, ref_count=1)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[MediaBlob.digest],
+            set_={"ref_count": MediaBlob.ref_count + 1},
+        ))
+        staged.acquired = True
+        return staged.url
+
+    def release(db: Session, urls) -> list:
+        """Снимает ссылки на файлы в текущей транзакции.
+
+        Возвращает пути, которые нужно передать в media_garbage (или MediaBlob.collect) после commit.
+        """
+        counts = Counter(url for url in urls if url)
+        for url, count in counts.items():
+            digest = media_digest(url)
+            if digest is not None:
+                db.execute(
+                    update(MediaBlob)
+                    .where(MediaBlob.digest == digest)
+                    .values(ref_count=MediaBlob.ref_count - count)
+                )
+        return list(counts)
+
+    def claim(db: Session, urls) -> list:
+        """Удаляет строки файлов из urls, на которые больше никто не ссылается, без commit.
+
+        Возвращает пути файлов, которые нужно удалить из хранилища до commit. Файлы, загруженные
+        до появления хранилища, принадлежат одной строке и возвращаются всегда.
+        """
+        removed = []
+        for url in urls:
+            digest = media_digest(url)
+            if digest is None:
+                removed.append(url)
+                continue
+            # Условное удаление строки атомарно: параллельный acquire либо успел увеличить счётчик,
+            # либо ждёт commit и затем заново кладёт файл (StagedUpload.ensure_stored)
+            result = db.execute(delete(MediaBlob).where(MediaBlob.digest == digest, MediaBlob.ref_count <= 0))
+            if result.rowcount:
+                removed.append(url)
+        return removed
+
+    def claim_upload(db: Session, staged: StagedUpload) -> list:
+        """claim для файла, на который запрос так и не сослался.
+
+        Строка с нулевым счётчиком вставляется, если её нет: параллельный acquire того же файла
+        ждёт commit и затем заново кладёт файл, а уже учтённый файл остаётся на месте.
+        """
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        db.execute(
+            insert(MediaBlob)
+            .values(digest=staged.digest, extension=staged.extension, ref_count=0)
+            .on_conflict_do_nothing(index_elements=[MediaBlob.digest])
+        )
+        return MediaBlob.claim(db, [staged.url])
+
+    def collect(db: Session, urls):
+        """Синхронная сборка для scripts.collect_media: claim, удаление файлов, commit."""
+        remove_files(MediaBlob.claim(db, urls))
+        db.commit()
+
+    def recount(db: Session) -> int:
+        """Пересчитывает ref_count по ссылкам в таблицах; возвращает число исправленных строк."""
+        from app.models.collection import Collection
+        from app.models.collector import Collector
+        from app.models.stamp import Stamp
+
+        counts = Counter()
+        for column in (Stamp.photo_url, Collection.photo_url, Collector.avatar_url):
+            for url, in db.query(column):
+                digest = media_digest(url)
+                if digest is not None:
+                    counts[digest] += 1
+        fixed = 0
+        for blob in db.query(MediaBlob):
+            if blob.ref_count != counts[blob.digest]:
+                blob.ref_count = counts[blob.digest]
+                fixed += 1
+        db.commit()
+        return fixed
+
+def remove_files(urls):
+    for url in urls:
+        if media_digest(url) is None:
+            remove_uploaded(url)
+        else:
+            remove_media(url)
+
+async def media_garbage(request: Request):
+    """Зависимость: список, в который обработчик складывает результат MediaBlob.release.
+
+    После успешного ответа файлы без ссылок удаляются в отдельной транзакции: строки media_blobs
+    удаляются через run_db, а файлы — в пуле потоков, пока строки ещё заблокированы, и только
+    затем commit. Так обращения к S3 не выполняются ни в run_sync, ни в event loop.
+    """
+    garbage = []
+    yield garbage
+    if garbage:
+        await collect_in_session(request, MediaBlob.claim, garbage)
+
+async def collect_upload(request: Request, staged: StagedUpload):
+    """Удаляет сохранённую загрузку, если запрос на неё не сослался и других ссылок нет (image_upload)."""
+    await collect_in_session(request, MediaBlob.claim_upload, staged)
+
+async def collect_in_session(request: Request, claim, *args):
+    async with open_db(request.app.dependency_overrides.get(get_db, get_db)) as db:
+        removed = await run_db(db, claim, *args)
+        await run_in_threadpool(remove_files, removed)
+        await run_db(db, lambda session: session.commit())
@@ -1,22 +1,67 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, func, literal_column, text
+from datetime import datetime, timezone
+from sqlalchemy.orm import relationship, Session
 from .base import Base
+from app.core.search import register_search_index, ranked_matches
+
+# Марки дороже этого порога считаются редкими
+RARE_COST_THRESHOLD = 1000
+# Условие частичного индекса ix_stamps_rare; в запросах — через RARE_STAMP
+RARE_STAMP_PREDICATE = f"cost > {RARE_COST_THRESHOLD}"
+# Поля полнотекстового поиска и их веса (A — самый значимый)
+STAMP_SEARCH_COLUMNS = {"name": "A", "serial_number": "A", "topic": "B", "country": "B", "features": "C"}
 
 class Stamp(Base):
     __tablename__ = "stamps"
+    __table_args__ = (
+        # Соединение с коллекциями и суммы по коллекции читаются из индекса без обращения к таблице
+        Index("ix_stamps_collection_id_cost", "collection_id", "cost"),
+        # Только редкие марки (около 10%): grouped_rare и поиск коллекционера с максимумом редких марок
+        Index(
+            "ix_stamps_rare",
+            "collection_id",
+            postgresql_where=text(RARE_STAMP_PREDICATE),
+            sqlite_where=text(RARE_STAMP_PREDICATE),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     serial_number = Column(String(50), nullable=False, unique=True)  # Уникальный серийный номер
-    country = Column(String(50), nullable=False)
-    year = Column(Integer, nullable=False)  # Исправлено: Integer без аргумента
+    country = Column(String(50), nullable=False, index=True)
+    year = Column(Integer, nullable=False, index=True)  # Исправлено: Integer без аргумента
     circulation = Column(Integer, nullable=False)
-    cost = Column(Integer, nullable=False)
+    cost = Column(Integer, nullable=False, index=True)  # индекс — для топа самых дорогих марок
     perforation = Column(Integer, nullable=False)
-    topic = Column(String(100), nullable=False)
+    topic = Column(String(100), nullable=False, index=True)
     features = Column(String(500), nullable=True)
     photo_url = Column(String, nullable=False, default="/static/avatars/default_avatar.png")
+    # Время последнего изменения (UTC) — для Last-Modified / If-Modified-Since
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+    )
     
     # Связь один-к-одному с Collection
     collection_id = Column(Integer, ForeignKey("collections.id"))
-    collection = relationship("Collection", back_populates="stamps")
\ No newline at end of file
+    collection = relationship("Collection", back_populates="stamps")
+
+    def search(db: Session, query: str):
+        """Query марок по поисковой строке, от самых релевантных; None, если искать нечего."""
+        ranked = ranked_matches(db, Stamp.__table__, STAMP_SEARCH_COLUMNS, "name", query)
+        if ranked is None:
+            return None
+        return db.query(Stamp).join(ranked, ranked.c.id == Stamp.id).order_by(ranked.c.rank.desc(), Stamp.id)
+
+# Порог подставляется в SQL литералом, а не параметром: иначе при подготовленных запросах
+# (asyncpg) Postgres строит общий план и не может применить частичный индекс ix_stamps_rare
+RARE_STAMP = Stamp.cost > literal_column(str(RARE_COST_THRESHOLD))
+
+def rarity_label(cost) -> str:
+    """Редкость марки в ответах API; совпадает с RARE_STAMP и фильтром rarity"""
+    return "Редкая" if cost > RARE_COST_THRESHOLD else "Обычная"
+
+register_search_index(Stamp.__table__, STAMP_SEARCH_COLUMNS, "name")
@@ -4,13 +4,15 @@ from sqlalchemy.orm import relationship, Session
 from .base import Base
 from app.models.role import Role # for model
 from app.models.collector import Collector
-import os
 from app.core.security import get_payload_from_refresh_token
 from app.schemas.user import UserLoginWithPasswordValidation, UserCreateWithPasswordValidation
-from app.core.security import verify_password, create_access_token, create_refresh_token, REFRESH_TOKEN_EXPIRE_DAYS, get_password_hash
+from app.core.security import create_access_token, create_refresh_token, REFRESH_TOKEN_EXPIRE_DAYS, hash_password, verify_and_update_password
+from app.core.database import run_db
+from app.models.media import MediaBlob
+from app.models.collection import Collection
+from app.models.stamp import Stamp
+from app.core.cache import invalidate_tags, STAMPS, COLLECTIONS, COLLECTORS
 
-DEFAULT_AVATAR = "/static/avatars/default_avatar.png"  # путь по умолчанию
-AVATAR_FOLDER = os.path.join("static", "avatars")  # путь к папке с аватарками
 
 class User(Base):
     __tablename__ = "users"
@@ -25,7 +27,7 @@ class User(Base):
     role = relationship("Role", back_populates="users")
     collector = relationship("Collector", back_populates="user", uselist=False, cascade="all, delete")  # <-- Add this)
 
-    def delete(db: Session, response: Response, request: Request):
+    def delete(db: Session, response: Response, request: Request, garbage: list):
         payload = get_payload_from_refresh_token(request)
         access_user_id = payload.get("sub")
         user = User.get_user(db, access_user_id)
@@ -33,14 +35,16 @@ class User(Base):
         if not user:
             raise HTTPException(status_code=401, detail="Пользователь не найден с таким ID!")
         
-        if collector.avatar_url and collector.avatar_url != DEFAULT_AVATAR:
-            avatar_filename = os.path.basename(collector.avatar_url)  # извлекаем имя файла
-            avatar_path = os.path.join(AVATAR_FOLDER, avatar_filename)
-            if os.path.exists(avatar_path):
-                try:
-                    os.remove(avatar_path)
-                except Exception as e:
-                    raise HTTPException(status_code=500, detail=f"Ошибка при удалении аватарки: {str(e)}")
+        # Ссылки на аватарку и фото коллекций и марок, удаляемых каскадом
+        photos = [
+            url for url, in db.query(Collection.photo_url).filter(Collection.collector_id == collector.user_id)
+        ] + [
+            url for url, in db.query(Stamp.photo_url)
+            .join(Collection, Collection.id == Stamp.collection_id)
+            .filter(Collection.collector_id == collector.user_id)
+        ]
+        # Файлы удаляются после ответа зависимостью media_garbage
+        garbage.extend(MediaBlob.release(db, [collector.avatar_url, *photos]))
         
         response.delete_cookie(
             key="refresh_token",
@@ -51,19 +55,26 @@ class User(Base):
 
         db.delete(user)
         db.commit()
+        # Вместе с пользователем удалены его коллекции и марки
+        invalidate_tags(COLLECTORS, COLLECTIONS, STAMPS)
 
         return {
             "message": "Пользователь удален.",
         }
     
-    def login(db: Session, response: Response, user: UserLoginWithPasswordValidation):
-        user_bd = db.query(User).filter((User.email == user.username) | (User.username == user.username)).first()
+    async def login(db: Session, response: Response, user: UserLoginWithPasswordValidation):
+        # Хэш проверяется вне сессии: соединение с БД не удерживается на время Argon2
+        user_bd = await run_db(db, User.get_credentials, user.username)
 
         if not user_bd:
             raise HTTPException(status_code=400, detail="Пользователь не найден!")
         
-        if not verify_password(user.password, user_bd.hashed_password):
+        verified, new_hash = await verify_and_update_password(user.password, user_bd.hashed_password)
+        if not verified:
             raise HTTPException(status_code=400, detail="Пароль введен неверно!")
+        if new_hash:
+            # Параметры хэширования изменились — сохраняем пересчитанный хэш
+            await run_db(db, User.update_password_hash, user_bd.id, new_hash)
         
         access_token = create_access_token(data={
             "sub": str(user_bd.id),
@@ -92,6 +103,18 @@ class User(Base):
             "email": user_bd.email
         }
     
+    def get_credentials(db: Session, login: str):
+        """Данные для входа по email или логину; транзакция сразу завершается, чтобы вернуть соединение в пул."""
+        credentials = db.query(User.id, User.role_id, User.username, User.email, User.hashed_password).filter(
+            (User.email == login) | (User.username == login)
+        ).first()
+        db.rollback()
+        return credentials
+    
+    def update_password_hash(db: Session, user_id: int, hashed_password: str):
+        db.query(User).filter(User.id == user_id).update({User.hashed_password: hashed_password})
+        db.commit()
+    
     def logout(db: Session, request: Request, response: Response):
         payload = get_payload_from_refresh_token(request)
         access_user_id = payload.get("sub")
@@ -111,25 +134,16 @@ class User(Base):
             "message": "Пользователь вышел из системы.",
         }
     
-    def register(db: Session, response: Response, user: UserCreateWithPasswordValidation):
+    async def register(db: Session, response: Response, user: UserCreateWithPasswordValidation):
         if user.password != user.re_password:
             raise HTTPException(status_code=400, detail="Пароли не совпадают!")
-        db_user_email = db.query(User).filter(User.email == user.email).first()
-        db_user_username = db.query(User).filter(User.username == user.username).first()
-        if db_user_email or db_user_username:
-            raise HTTPException(status_code=400, detail="Почта или логин уже зарезервированы!")
+        await run_db(db, User.check_available, user.email, user.username)
         
-        # Хэширование пароля
-        hashed_password = get_password_hash(user.password)
+        # Хэширование пароля (в пуле Argon2, вне сессии)
+        hashed_password = await hash_password(user.password)
         
         # Создание нового пользователя
-        db_user = User(email=user.email, username=user.username, hashed_password=hashed_password)
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        db_collector = Collector(user_id=db_user.id)
-        db.add(db_collector)
-        db.commit()
+        db_user = await run_db(db, User.create_with_collector, user.email, user.username, hashed_password)
 
             # Генерируем токены для нового пользователя
         access_token = create_access_token(data={
@@ -161,6 +175,26 @@ class User(Base):
             "id": db_user.id,
         }
     
+    def check_available(db: Session, email: str, username: str):
+        db_user_email = db.query(User.id).filter(User.email == email).first()
+        db_user_username = db.query(User.id).filter(User.username == username).first()
+        db.rollback()
+        if db_user_email or db_user_username:
+            raise HTTPException(status_code=400, detail="Почта или логин уже зарезервированы!")
+    
+    def create_with_collector(db: Session, email: str, username: str, hashed_password: str):
+        db_user = User(email=email, username=username, hashed_password=hashed_password)
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+        db_collector = Collector(user_id=db_user.id)
+        db.add(db_collector)
+        db.commit()
+        invalidate_tags(COLLECTORS)
+        # Объект отдаётся за пределы сессии: загружаем поля заново после commit
+        db.refresh(db_user)
+        return db_user
+    
     def get_user(db: Session, user_id):
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
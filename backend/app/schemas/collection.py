@@ -0,0 +1,26 @@
+from typing import Optional, Union
+from pydantic import BaseModel, ConfigDict, TypeAdapter, computed_field
+from app.schemas.media import MediaUrl, thumbnail_url
+
+# Коллекция внутри карточки коллекционера (владелец известен из карточки)
+class CollectionBrief(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    photo_url: MediaUrl
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @computed_field
+    @property
+    def thumbnail_url(self) -> Optional[MediaUrl]:
+        return thumbnail_url(self.photo_url)
+
+class CollectionOut(CollectionBrief):
+    collector_id: int
+
+# Для топа самых дорогих коллекций
+class CollectionWithCost(CollectionOut):
+    total_cost: Union[int, float]
+
+CollectionList = TypeAdapter(list[CollectionOut])
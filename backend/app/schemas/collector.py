@@ -0,0 +1,59 @@
+from typing import Optional, Union
+from pydantic import BaseModel, computed_field
+from app.schemas.collection import CollectionBrief
+from app.schemas.media import MediaUrl, thumbnail_url
+from app.schemas.stamp import StampOut
+
+# Общие поля карточки коллекционера в списках
+class CollectorCard(BaseModel):
+    username: str
+    avatar_url: MediaUrl
+    country: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    middle_name: Optional[str] = None
+    # Заглушки: фронтенд ожидает эти поля, в модели Collector их пока нет
+    bio: str = ""
+    location: str = ""
+    memberSince: str = ""
+    collectionCount: int
+    stampCount: int
+    specialties: list[str] = []
+    following: int = 0
+    followers: int = 0
+
+    @computed_field
+    @property
+    def avatar_thumbnail_url(self) -> Optional[MediaUrl]:
+        return thumbnail_url(self.avatar_url)
+
+    @classmethod
+    def from_summary(cls, summary, **fields):
+        """Карточка из строки Collector.get_summaries; fields — поля конкретного ответа."""
+        collector = summary.Collector
+        return cls(
+            username=summary.username,
+            avatar_url=collector.avatar_url,
+            country=collector.country,
+            first_name=collector.first_name,
+            last_name=collector.last_name,
+            middle_name=collector.middle_name,
+            collectionCount=summary.collection_count,
+            stampCount=summary.stamp_count,
+            **fields,
+        )
+
+class CollectorSummary(CollectorCard):
+    id: int
+    featured: bool = False
+
+class CollectorValueSummary(CollectorSummary):
+    totalCollectionValue: Union[int, float]
+
+class CollectorRareStamps(CollectorCard):
+    collector_id: int
+    rare_stamps: list[StampOut]
+
+class CollectorCollections(CollectorCard):
+    collector_id: int
+    collections: list[CollectionBrief]
@@ -0,0 +1,40 @@
+from typing import Annotated, Optional
+from pydantic import PlainSerializer
+from app.core import storage
+from app.core.images import variant_url
+from app.core.uploads import media_digest, media_key
+import os
+
+def media_url(path: Optional[str]) -> Optional[str]:
+    # Файлы хранилища — по адресу текущего STORAGE_BACKEND, остальные (аватарка по умолчанию,
+    # загрузки до появления хранилища) — через /static этого backend
+    if path is None:
+        return None
+    key = media_key(path)
+    if key is not None:
+        return storage.media_storage.url(key)
+    return f"{storage.MEDIA_HOST}{path}"
+
+# В модели хранится путь из БД, полный адрес подставляется только при сериализации
+MediaUrl = Annotated[str, PlainSerializer(media_url, return_type=str)]
+
+def variant_path(path: str, variant: str) -> Optional[str]:
+    """Путь уменьшенной копии или None, если её нет и клиенту нужен оригинал.
+
+    Файлы хранилища получают копии при загрузке. У загрузок до появления копий (они всегда
+    на локальном диске) копии есть, только если их создал scripts.generate_image_variants.
+    """
+    if not path:
+        return None
+    url = variant_url(path, variant)
+    if media_digest(path) is None and not os.path.exists(url.lstrip("/")):
+        return None
+    return url
+
+def thumbnail_url(path: str) -> Optional[str]:
+    # Уменьшенная копия для карточек в списках
+    return variant_path(path, "thumb")
+
+def large_url(path: str) -> Optional[str]:
+    # Копия для детальной страницы: не больше 1280 пикселей по большей стороне
+    return variant_path(path, "large")
@@ -0,0 +1,40 @@
+from typing import Optional, Union
+from pydantic import BaseModel, ConfigDict, TypeAdapter, computed_field
+from app.models.stamp import rarity_label
+from app.schemas.media import MediaUrl, thumbnail_url
+
+# Марка в списках; строится прямо из объекта Stamp
+class StampOut(BaseModel):
+    id: int
+    name: str
+    serial_number: str
+    country: str
+    year: int
+    circulation: int
+    # Колонки целочисленные, но формы принимают дробную стоимость и строковую перфорацию,
+    # а SQLite хранит значения как есть
+    cost: Union[int, float]
+    perforation: Union[int, str]
+    topic: str
+    features: Optional[str] = None
+    photo_url: MediaUrl
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @computed_field
+    @property
+    def rarity(self) -> str:
+        return rarity_label(self.cost)
+
+    @computed_field
+    @property
+    def thumbnail_url(self) -> Optional[MediaUrl]:
+        return thumbnail_url(self.photo_url)
+
+# Страница GET /api/stamps/ с курсором на следующую
+class StampPage(BaseModel):
+    items: list[StampOut]
+    next_cursor: Optional[int] = None
+
+# Проверка списка объектов Stamp одним вызовом вместо цикла по model_validate
+StampList = TypeAdapter(list[StampOut])
@@ -0,0 +1,16 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+# Запрос формы для прямой загрузки изображения в хранилище;
+# sha256 — SHA-256 файла в base64, по нему хранилище проверит содержимое
+class PresignRequest(BaseModel):
+    content_type: str
+    sha256: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9+/]{43}=$")
+
+# Форма для POST в хранилище: браузер отправляет fields и файл полем file на url,
+# затем передаёт key в поле {field}_key формы создания или изменения (например, image_key)
+class PresignedUpload(BaseModel):
+    key: str
+    url: str
+    fields: dict[str, str]
+    max_bytes: int
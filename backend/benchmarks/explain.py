@@ -0,0 +1,66 @@
+"""Планы выполнения (EXPLAIN) для запросов, которые опираются на индексы марок и коллекций.
+
+Запросы собираются теми же конструкциями ORM, что и в эндпоинтах, и компилируются
+с подставленными параметрами. Для SQLite выводится EXPLAIN QUERY PLAN, для Postgres — EXPLAIN.
+
+Запуск из папки backend (база заранее заполняется benchmarks.seed):
+    python -m benchmarks.explain --database-url sqlite:///./benchmarks/bench.db
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import Session
+
+from app.models.user import User  # noqa: F401 — регистрирует связанные модели
+from app.models.collector import Collector
+from app.models.collection import Collection
+from app.models.stamp import Stamp, RARE_STAMP
+
+def affected_queries(db):
+    yield "grouped_rare: rare stamps with owners", (
+        db.query(Stamp, Collection.collector_id)
+        .join(Collection, Collection.id == Stamp.collection_id)
+        .filter(RARE_STAMP)
+        .order_by(Collection.collector_id, Stamp.id)
+    )
+    yield "max_rare_stamp_collector: rare stamps per collector", (
+        db.query(Collection.collector_id, func.count(Stamp.id))
+        .join(Stamp, Stamp.collection_id == Collection.id)
+        .filter(RARE_STAMP)
+        .group_by(Collection.collector_id)
+    )
+    yield "collectors_with_old_stamps: stamps older than cutoff", (
+        db.query(Collection.collector_id)
+        .join(Stamp, Stamp.collection_id == Collection.id)
+        .filter(Stamp.year < 1950)
+        .distinct()
+    )
+    yield "collector summaries for one collector", Collector.get_summaries(db).filter(Collector.user_id == 1)
+    yield "collection detail: stamps of a collection", db.query(Stamp).filter(Stamp.collection_id == 1)
+    yield "profile: collections of a collector", db.query(Collection).filter(Collection.collector_id == 1)
+    yield "stamps list filtered by country and year", (
+        db.query(Stamp).filter(Stamp.country == "Япония", Stamp.year >= 2000).order_by(Stamp.id).limit(51)
+    )
+    yield "stamps list filtered by topic", db.query(Stamp).filter(Stamp.topic == "Космос").order_by(Stamp.id).limit(51)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    prefix = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+    with Session(engine) as db:
+        for title, query in affected_queries(db):
+            sql = query.statement.compile(engine, compile_kwargs={"literal_binds": True})
+            print(f"-- {title}")
+            for row in db.execute(text(f"{prefix} {sql}")):
+                print("   ", row[-1])
+            print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Микробенчмарк проверки пути в auto_refresh_token_middleware.
+
+Сравнивает прежнюю цепочку из 13 re.match и линейного startswith по EXCLUDED_PATHS
+с одним предкомпилированным выражением PUBLIC_PATH_PATTERN, а также накладные
+расходы всего middleware на публичном пути.
+
+Запуск из папки backend:
+    python -m benchmarks.middleware_overhead
+"""
+import asyncio
+import re
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from starlette.requests import Request
+from starlette.responses import Response
+from app.middleware.auto_refresh import auto_refresh_token_middleware, is_public_path
+
+LEGACY_EXCLUDED_PATHS = [
+    "/api/auth/",
+    "/api/profiles/",
+    "/static/",
+    "/docs",
+    "/openapi.json",
+    "/redoc",
+    "/api/collections",
+    "/api/stamps"
+]
+
+LEGACY_PROTECTED_PATTERNS = [
+    r'^/api/profiles/\d+/user_settings$',
+    r'^/api/collections/delete/\d+$',
+    r'^/api/collections/update/\d+$',
+    r'^/api/stamps/update/\d+$',
+    r'^/api/stamps/delete/\d+$',
+    r'^/api/profiles/users/\d+$',
+    r'^/api/profiles/collectors/\d+$',
+    r'^/api/collections/create$',
+    r'^/api/stamps/create$',
+    r'^/api/profiles/\d+/collector_settings$',
+    r'^/api/profiles/\d+/change_avatar$',
+    r'^/api/auth/logout$',
+    r'^/api/auth/delete$',
+]
+
+def legacy_is_public_path(path: str) -> bool:
+    # Та же логика, что была в middleware: все 13 выражений вычисляются на каждый запрос
+    matches = [re.match(pattern, path) is not None for pattern in LEGACY_PROTECTED_PATTERNS]
+    return any(path.startswith(p) for p in LEGACY_EXCLUDED_PATHS) and not any(matches)
+
+SAMPLE_PATHS = [
+    "/static/stamps/1.png",
+    "/api/stamps/",
+    "/api/stamps/42",
+    "/api/stamps/update/42",
+    "/api/collections/grouped",
+    "/api/profiles/list",
+    "/api/profiles/7/user_settings",
+    "/api/auth/login",
+    "/api/auth/logout",
+    "/api/settings/user",
+]
+
+def make_request(path: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []})
+
+async def call_next(request):
+    return Response()
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e9
+
+def main():
+    for path in SAMPLE_PATHS:
+        assert legacy_is_public_path(path) == is_public_path(path), path
+
+    number = 20000
+    legacy = bench(lambda: [legacy_is_public_path(p) for p in SAMPLE_PATHS], number) / len(SAMPLE_PATHS)
+    current = bench(lambda: [is_public_path(p) for p in SAMPLE_PATHS], number) / len(SAMPLE_PATHS)
+    print(f"path check, legacy:  {legacy:8.0f} ns/request")
+    print(f"path check, current: {current:8.0f} ns/request ({legacy / current:.1f}x)")
+
+    # Полный проход через middleware для публичных путей (в т.ч. статики):
+    # каждый запрос получает новый Request, как в реальном приложении
+    public_paths = [p for p in SAMPLE_PATHS if is_public_path(p)]
+    loop = asyncio.new_event_loop()
+
+    def run(middleware):
+        start = time.perf_counter_ns()
+        for _ in range(2000):
+            for path in public_paths:
+                request = make_request(path)
+                loop.run_until_complete(middleware(request, call_next))
+        return (time.perf_counter_ns() - start) / (2000 * len(public_paths))
+
+    async def no_middleware(request, call_next):
+        return await call_next(request)
+
+    async def legacy_middleware(request, call_next):
+        if legacy_is_public_path(request.url.path):
+            return await call_next(request)
+
+    # Прогоны чередуются, чтобы прогрев и шум распределялись поровну
+    timings = {no_middleware: [], legacy_middleware: [], auto_refresh_token_middleware: []}
+    for _ in range(5):
+        for middleware, results in timings.items():
+            results.append(run(middleware))
+    baseline = min(timings[no_middleware])
+    legacy = min(timings[legacy_middleware]) - baseline
+    current = min(timings[auto_refresh_token_middleware]) - baseline
+    loop.close()
+    print(f"middleware overhead on public paths, legacy:  {legacy:8.0f} ns/request")
+    print(f"middleware overhead on public paths, current: {current:8.0f} ns/request")
+
+if __name__ == "__main__":
+    main()
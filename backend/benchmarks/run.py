@@ -0,0 +1,179 @@
+"""Нагрузочный бенчмарк горячих эндпоинтов PhilateList.
+
+По умолчанию поднимает приложение в процессе (httpx + ASGITransport) поверх отдельной
+SQLite-базы, заполненной benchmarks.seed, и гоняет запросы с заданной конкурентностью.
+С --base-url бьёт по уже запущенному серверу (данные нужно засеять заранее,
+а для подсчёта SQL-запросов сервер должен работать с DB_PROFILE=1).
+
+Кэш ответов (app/core/cache.py) по умолчанию выключен: иначе после прогрева каждый GET
+отдаётся из кэша и замеряется не работа эндпоинта. --cache memory|redis включает его
+для оценки попаданий; у запущенного сервера кэш задаётся его CACHE_BACKEND.
+
+Для каждого эндпоинта выводятся p50/p95/p99, запросы в секунду и SQL-запросы на запрос.
+Результаты сравниваются с benchmarks/baseline.json; --save перезаписывает базовую линию.
+
+Запуск из папки backend:
+    python -m benchmarks.run
+    python -m benchmarks.run --users 1000 --requests 500 --concurrency 32 --save
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+
+BENCH_DIR = Path(__file__).parent
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+DEFAULT_DATABASE_URL = f"sqlite:///{BENCH_DIR / 'bench.db'}"
+
+# (имя, метод, путь); логин считается отдельно — Argon2 намеренно дорогой
+ENDPOINTS = [
+    ("stamps_page", "GET", "/api/stamps/"),
+    ("stamps_grouped_rare", "GET", "/api/stamps/grouped_rare"),
+    ("collections_grouped", "GET", "/api/collections/grouped"),
+    ("profiles_list", "GET", "/api/profiles/list"),
+    ("profiles_sorted_by_collection_value", "GET", "/api/profiles/sorted_by_collection_value"),
+    ("auth_login", "POST", "/api/auth/login"),
+]
+LOGIN_REQUESTS_DIVISOR = 5
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def drive(client, method, path, requests, concurrency, users):
+    from benchmarks.seed import BENCH_PASSWORD
+
+    latencies = []
+    queries = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            kwargs = {}
+            if method == "POST":
+                kwargs["json"] = {"username": f"bench{i % users + 1}", "password": BENCH_PASSWORD}
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+            if "X-DB-Queries" in response.headers:
+                queries.append(int(response.headers["X-DB-Queries"]))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "queries_per_request": round(statistics.mean(queries), 2) if queries else None,
+    }
+
+async def run(args):
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        # Конфигурация читается при импорте приложения, поэтому окружение задаётся до него
+        os.environ.setdefault("DATABASE_URL", args.database_url)
+        os.environ["DB_PROFILE"] = "1"
+        os.environ["CACHE_BACKEND"] = args.cache
+        from sqlalchemy import create_engine
+        from benchmarks.seed import seed
+        from app.main import app
+
+        # Записи о каждом запросе (приложения и httpx) заглушили бы отчёт
+        logging.getLogger().setLevel(logging.WARNING)
+        seed(create_engine(os.environ["DATABASE_URL"]), args.users, args.collections_per_collector, args.stamps_per_collection)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    results = {}
+    async with client:
+        for name, method, path in ENDPOINTS:
+            requests, concurrency = args.requests, args.concurrency
+            if name == "auth_login":
+                requests //= LOGIN_REQUESTS_DIVISOR
+                if not args.base_url:
+                    # Сверх очереди Argon2 логины отклоняются с 503 (app/core/security.py):
+                    # замеряется время принятых логинов, а не отказы
+                    from app.core.security import PASSWORD_HASH_MAX_PENDING
+                    concurrency = min(concurrency, PASSWORD_HASH_MAX_PENDING)
+            # Прогрев: первый запрос компилирует SQL и заполняет кэши
+            await drive(client, method, path, min(requests, concurrency), concurrency, args.users)
+            results[name] = await drive(client, method, path, requests, concurrency, args.users)
+            print(format_row(name, results[name]))
+    return results
+
+def format_row(name, result):
+    queries = result["queries_per_request"]
+    return (
+        f"{name:38} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms"
+        f"  {result['rps']:8.1f} rps  queries {queries if queries is not None else '-':>5}  errors {result['errors']}"
+    )
+
+def compare(results, baseline):
+    print("\nChange vs baseline:")
+    for name, result in results.items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            print(f"{name:38} no baseline")
+            continue
+        p95_change = (result["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0
+        rps_change = (result["rps"] - previous["rps"]) / previous["rps"] * 100 if previous["rps"] else 0
+        line = f"{name:38} p95 {p95_change:+7.1f}%  rps {rps_change:+7.1f}%"
+        if result["queries_per_request"] != previous["queries_per_request"]:
+            line += f"  queries {previous['queries_per_request']} -> {result['queries_per_request']}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="URL запущенного сервера; без него приложение поднимается в процессе")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--collections-per-collector", type=int, default=3)
+    parser.add_argument("--stamps-per-collection", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="запросов на эндпоинт")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cache", default="none", choices=["none", "memory", "redis"],
+                        help="CACHE_BACKEND приложения в процессе; none — замерять эндпоинты без кэша ответов")
+    parser.add_argument("--save", action="store_true", help="сохранить результаты как новую базовую линию")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if BASELINE_PATH.exists():
+        compare(results, json.loads(BASELINE_PATH.read_text(encoding="utf-8")))
+    if args.save:
+        config = {
+            "users": args.users,
+            "collections_per_collector": args.collections_per_collector,
+            "stamps_per_collection": args.stamps_per_collection,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cache": args.cache,
+        }
+        BASELINE_PATH.write_text(
+            json.dumps({"config": config, "endpoints": results}, indent=2, ensure_ascii=False) + "\n",
+            encoding="utf-8",
+        )
+        print(f"\nBaseline saved to {BASELINE_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Генератор синтетических данных для бенчмарков.
+
+Создаёт N пользователей-коллекционеров, у каждого по несколько коллекций с марками.
+У всех пользователей один пароль (BENCH_PASSWORD), чтобы бенчмарк мог логиниться.
+
+Запуск из папки backend:
+    python -m benchmarks.seed --database-url sqlite:///./benchmarks/bench.db --users 1000
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+from app.models.base import Base
+from app.models.role import Role
+from app.models.user import User
+from app.models.collector import Collector
+from app.models.collection import Collection
+from app.models.stamp import Stamp
+from app.core.security import get_password_hash
+
+BENCH_PASSWORD = "benchpassword"
+COUNTRIES = ["Россия", "СССР", "Германия", "Франция", "Япония", "США", "Италия", "Бразилия"]
+TOPICS = ["Космос", "Фауна", "Флора", "Спорт", "Искусство", "Транспорт", "История"]
+BATCH_SIZE = 5000
+
+def seed(engine, users=200, collections_per_collector=3, stamps_per_collection=10, seed_value=42):
+    """Пересоздаёт схему и заполняет её данными. Возвращает число созданных марок."""
+    rng = random.Random(seed_value)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    # Хеш Argon2 дорогой, поэтому считается один раз на всех пользователей
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+    user_rows = [
+        {"id": i, "email": f"bench{i}@example.com", "username": f"bench{i}", "hashed_password": hashed_password, "role_id": 2}
+        for i in range(1, users + 1)
+    ]
+    collector_rows = [
+        {"user_id": i, "country": rng.choice(COUNTRIES), "first_name": f"Имя{i}", "last_name": f"Фамилия{i}"}
+        for i in range(1, users + 1)
+    ]
+    collection_rows = []
+    stamp_rows = []
+    for collector_id in range(1, users + 1):
+        for _ in range(collections_per_collector):
+            collection_id = len(collection_rows) + 1
+            collection_rows.append({
+                "id": collection_id,
+                "collector_id": collector_id,
+                "name": f"Коллекция {collection_id}",
+                "description": "Синтетическая коллекция",
+            })
+            for _ in range(stamps_per_collection):
+                stamp_id = len(stamp_rows) + 1
+                stamp_rows.append({
+                    "id": stamp_id,
+                    "name": f"Марка {stamp_id}",
+                    "serial_number": f"BENCH-{stamp_id}",
+                    "country": rng.choice(COUNTRIES),
+                    "year": rng.randint(1900, 2024),
+                    "circulation": rng.randint(100, 1_000_000),
+                    # Примерно каждая десятая марка — редкая (дороже 1000)
+                    "cost": rng.randint(1001, 50000) if rng.random() < 0.1 else rng.randint(1, 1000),
+                    "perforation": rng.randint(10, 15),
+                    "topic": rng.choice(TOPICS),
+                    "features": "Синтетические данные",
+                    "collection_id": collection_id,
+                })
+
+    with engine.begin() as connection:
+        connection.execute(insert(Role), [{"id": 1, "name": "admin"}, {"id": 2, "name": "user"}])
+        for table, rows in ((User, user_rows), (Collector, collector_rows), (Collection, collection_rows), (Stamp, stamp_rows)):
+            for start in range(0, len(rows), BATCH_SIZE):
+                connection.execute(insert(table), rows[start:start + BATCH_SIZE])
+        if engine.dialect.name == "postgresql":
+            # id вставлены явно, поэтому последовательности нужно сдвинуть вручную
+            for table in ("roles", "users", "collections", "stamps"):
+                connection.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+
+    # Данные вставлены в обход обработчиков, поэтому суммы для рейтингов считаются отдельно
+    with Session(engine) as db:
+        Collector.rebuild_totals(db)
+
+    return len(stamp_rows)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--collections-per-collector", type=int, default=3)
+    parser.add_argument("--stamps-per-collection", type=int, default=10)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    stamps = seed(engine, args.users, args.collections_per_collector, args.stamps_per_collection)
+    print(f"Seeded {args.users} users, {args.users * args.collections_per_collector} collections, {stamps} stamps")
+
+if __name__ == "__main__":
+    main()
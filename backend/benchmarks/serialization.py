@@ -0,0 +1,90 @@
+"""Бенчмарк сериализации списка марок: ручные словари против моделей ответа.
+
+Старый путь — словарь на каждую марку, затем jsonable_encoder и json.dumps (как JSONResponse).
+Новый — StampList проверяет объекты Stamp в ядре Pydantic, а FastAPI сериализует
+результат сразу в JSON-байты (response_model без своего response_class).
+БД не нужна: объекты Stamp создаются в памяти.
+
+Запуск из папки backend:
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --sizes 10000 100000 --repeat 5
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from app.core.images import variant_url
+from app.models.user import User  # noqa: F401 — регистрирует связанные модели
+from app.models.stamp import Stamp, RARE_COST_THRESHOLD
+from app.schemas.stamp import StampOut, StampList
+
+def make_stamps(count):
+    return [
+        Stamp(
+            id=i, name=f"Stamp {i}", serial_number=f"SN-{i}", country="Testland", year=1900 + i % 120,
+            circulation=1000, cost=i % 5000, perforation=12, topic="Space", features="Perforated",
+            photo_url=f"/static/stamps/{i}.jpg", collection_id=1,
+        )
+        for i in range(count)
+    ]
+
+def legacy_render(stamps):
+    result = []
+    for stamp in stamps:
+        result.append({
+            "id": stamp.id,
+            "name": stamp.name,
+            "serial_number": stamp.serial_number,
+            "country": stamp.country,
+            "year": stamp.year,
+            "circulation": stamp.circulation,
+            "cost": stamp.cost,
+            "perforation": stamp.perforation,
+            "topic": stamp.topic,
+            "features": stamp.features,
+            "photo_url": f"http://localhost:8000{stamp.photo_url}",
+            "rarity": "Редкая" if stamp.cost > RARE_COST_THRESHOLD else "Обычная",
+            "thumbnail_url": f"http://localhost:8000{variant_url(stamp.photo_url, 'thumb')}",
+        })
+    return JSONResponse(jsonable_encoder(result)).body
+
+# Так FastAPI обрабатывает ответ с response_model: повторная проверка (для готовых моделей
+# без копирования) и dump_json
+RESPONSE_ADAPTER = TypeAdapter(list[StampOut])
+
+def model_render(stamps):
+    items = StampList.validate_python(stamps)
+    return RESPONSE_ADAPTER.dump_json(RESPONSE_ADAPTER.validate_python(items, from_attributes=True))
+
+def measure(render, stamps, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = render(stamps)
+        timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'stamps':>8} {'dicts+json, ms':>15} {'models, ms':>11} {'speedup':>8} {'bytes':>10}")
+    for size in args.sizes:
+        stamps = make_stamps(size)
+        legacy_time, legacy_body = measure(legacy_render, stamps, args.repeat)
+        model_time, model_body = measure(model_render, stamps, args.repeat)
+        # Оба пути отдают один и тот же JSON (отличаются только пробелами)
+        assert json.loads(model_body) == json.loads(legacy_body)
+        print(f"{size:>8} {legacy_time * 1000:>15.1f} {model_time * 1000:>11.1f} {legacy_time / model_time:>7.1f}x {len(model_body):>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Сборка мусора в хранилище изображений (media/ в STORAGE_BACKEND).
+
+Обработчики удаляют файлы сразу, когда на них пропадает последняя ссылка. Скрипт нужен
+после правок в БД в обход API и падений посреди запроса: он пересчитывает media_blobs.ref_count
+по таблицам, удаляет файлы без ссылок, файлы, которых нет в media_blobs
+(например, оставшиеся от прерванных загрузок), и невостребованные прямые загрузки из incoming/.
+Файлы моложе --grace секунд не трогаются: это могут быть загрузки, транзакция которых
+ещё не завершилась.
+
+Запуск из папки backend (используется DATABASE_URL):
+    python -m scripts.collect_media
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.database import SessionLocal
+from app.core import storage
+from app.core.images import IMAGE_VARIANTS, variant_url
+from app.core.uploads import INCOMING_PREFIX, MEDIA_PREFIX, media_key
+from app.models.user import User  # noqa: F401 — регистрирует связанные модели
+from app.models.media import MediaBlob
+
+def remove_orphans(known_keys: set, grace: float) -> int:
+    backend = storage.media_storage
+    deadline = datetime.now(timezone.utc) - timedelta(seconds=grace)
+    removed = 0
+    for prefix in (MEDIA_PREFIX, INCOMING_PREFIX):
+        for key, modified in list(backend.keys(prefix)):
+            if key in known_keys or modified > deadline:
+                continue
+            backend.delete(key)
+            removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grace", type=float, default=3600, help="возраст файла в секундах, после которого он считается брошенным")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(f"{MediaBlob.recount(db)} reference counts fixed")
+        unreferenced = [blob.url for blob in db.query(MediaBlob).filter(MediaBlob.ref_count <= 0)]
+        MediaBlob.collect(db, unreferenced)
+        print(f"{len(unreferenced)} unreferenced images removed")
+        known_keys = set()
+        for blob in db.query(MediaBlob):
+            known_keys.add(media_key(blob.url))
+            known_keys.update(media_key(variant_url(blob.url, variant)) for variant in IMAGE_VARIANTS)
+    finally:
+        db.close()
+    print(f"{remove_orphans(known_keys, args.grace)} orphaned files removed")
+
+if __name__ == "__main__":
+    main()
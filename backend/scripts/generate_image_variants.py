@@ -0,0 +1,63 @@
+"""Создание уменьшенных копий (thumb, large) для изображений, загруженных до их появления.
+
+Новые загрузки получают копии сразу, прямые загрузки — фоновой задачей после ответа.
+Скрипт нужен для уже лежащих в static файлов, после изменения IMAGE_VARIANTS и для файлов
+хранилища (media/ в STORAGE_BACKEND), чья фоновая задача не выполнилась.
+Существующие копии не перезаписываются без --force.
+
+Запуск из папки backend:
+    python -m scripts.generate_image_variants
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core import storage
+from app.core.images import IMAGE_VARIANTS, InvalidImage, is_variant, render_variants, variant_url
+from app.core.uploads import MEDIA_PREFIX, render_stored_variants
+
+IMAGE_DIRECTORIES = ("static/stamps", "static/collections", "static/avatars")
+
+def generate(directory: str, force: bool = False):
+    created = 0
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith(".") or is_variant(filename):
+            continue
+        url = f"/{directory}/{filename}"
+        targets = {variant: variant_url(url, variant).lstrip("/") for variant in IMAGE_VARIANTS}
+        if not force and all(os.path.exists(target) for target in targets.values()):
+            continue
+        try:
+            rendered = render_variants(os.path.join(directory, filename), directory)
+        except InvalidImage as error:
+            print(f"Skipped {url}: {error}")
+            continue
+        for variant, temp_path in rendered.items():
+            os.replace(temp_path, targets[variant])
+        created += 1
+    return created
+
+def generate_media():
+    """Недостающие копии файлов хранилища; возвращает число просмотренных оригиналов."""
+    originals = [
+        f"/{storage.STATIC_ROOT}/{key}" for key, _ in storage.media_storage.keys(MEDIA_PREFIX)
+        if not is_variant(key) and not key.endswith(".part")
+    ]
+    for url in originals:
+        render_stored_variants(url)
+    return len(originals)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", action="store_true", help="пересоздать существующие копии")
+    args = parser.parse_args()
+    for directory in IMAGE_DIRECTORIES:
+        if os.path.isdir(directory):
+            print(f"{directory}: {generate(directory, args.force)} images processed")
+    print(f"{MEDIA_PREFIX}: {generate_media()} images checked")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Пересчёт сумм для рейтингов (collections.total_cost, collectors.total_value).
+
+Суммы поддерживаются обработчиками создания, изменения и удаления марок; пересчёт нужен
+после загрузки данных в обход API или ручных правок в БД.
+
+Запуск из папки backend (используется DATABASE_URL):
+    python -m scripts.rebuild_leaderboards
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.database import SessionLocal
+from app.models.user import User  # noqa: F401 — регистрирует связанные модели
+from app.models.collector import Collector
+
+def main():
+    db = SessionLocal()
+    try:
+        Collector.rebuild_totals(db)
+    finally:
+        db.close()
+    print("Leaderboard totals rebuilt")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 
@@ -5,6 +6,9 @@ from pathlib import Path
 root_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(root_dir))
 
+# Тесты пишут в БД напрямую и считают SQL-запросы: кэш ответов включается только в своих тестах
+os.environ.setdefault("CACHE_BACKEND", "none")
+
 import pytest
 from sqlalchemy import create_engine
 from app.main import app
@@ -37,6 +41,35 @@ def test_db():
     yield
     Base.metadata.drop_all(bind=engine)
 
+@pytest.fixture(autouse=True)
+def media_storage(tmp_path, monkeypatch):
+    """Загрузки тестов пишутся во временную папку, а не в backend/static/media;
+    /static отдаёт файлы сначала из неё."""
+    from app.core import storage
+    from app.main import static_files
+
+    backend = storage.LocalStorage(root=str(tmp_path / "static"))
+    monkeypatch.setattr(storage, "media_storage", backend)
+    monkeypatch.setattr(static_files, "all_directories", [backend.root, *static_files.all_directories])
+    return backend
+
+def stored_path(url):
+    # Путь к файлу хранилища по адресу из ответа API
+    from app.core import storage
+    from app.core.uploads import media_key
+    return storage.media_storage.path(media_key(url.removeprefix(storage.MEDIA_HOST)))
+
+def make_image(image_format="JPEG", size=(40, 30), color="red"):
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, image_format)
+    return buffer.getvalue()
+
+# Загрузки декодируются (проверка и уменьшенные копии), поэтому нужно настоящее изображение
+TEST_JPEG = make_image()
+
 # Helper functions
 def register_user(email, username, password):
     response = client.post("/api/auth/register", json={
@@ -237,7 +270,7 @@ def test_create_stamp(test_db):
 
     # Prepare a dummy image file for upload
     import io
-    image_content = io.BytesIO(b"fake image data")
+    image_content = io.BytesIO(TEST_JPEG)
     image_content.name = "test_image.jpg"
 
     # Create a stamp
@@ -263,3 +296,1198 @@ def test_create_stamp(test_db):
     assert data["name"] == "Test Stamp"
     assert data["serial_number"] == "SN123456"
     assert data["rarity"] == "Редкая"
+
+def create_stamp(headers, collection_id, serial_number, cost=100.0, country="Testland", year=2020, topic="Test Topic", image=TEST_JPEG):
+    import io
+    image_content = io.BytesIO(image)
+    response = client.post(
+        "/api/stamps/create",
+        data={
+            "name": f"Stamp {serial_number}",
+            "serial_number": serial_number,
+            "country": country,
+            "year": year,
+            "circulation": 1000,
+            "cost": cost,
+            "perforation": "Type A",
+            "topic": topic,
+            "features": "Feature",
+            "collection_id": collection_id
+        },
+        files={"image": ("test_image.jpg", image_content, "image/jpeg")},
+        headers=headers
+    )
+    assert response.status_code == 200
+    return response.json()
+
+def test_get_stamps_cursor_pagination(test_db):
+    access_token = login_user("stampcollector", "stamppass")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = client.post("/api/collections/create", data={
+        "name": "Paginated Collection",
+        "description": "Collection for pagination"
+    }, headers=headers)
+    collection_id = response.json()["id"]
+    created = [
+        create_stamp(headers, collection_id, f"PAGE-{i}", cost=500.0 * (i + 1), country="Pagiland", year=1990 + i)
+        for i in range(5)
+    ]
+
+    ids = []
+    cursor = None
+    while True:
+        params = {"country": "Pagiland", "limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get("/api/stamps/", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) <= 2
+        ids.extend(stamp["id"] for stamp in data["items"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == [stamp["id"] for stamp in created]
+
+def test_get_stamps_filters(test_db):
+    response = client.get("/api/stamps/", params={"country": "Pagiland", "year_from": 1991, "year_to": 1993})
+    assert [stamp["year"] for stamp in response.json()["items"]] == [1991, 1992, 1993]
+
+    response = client.get("/api/stamps/", params={"country": "Pagiland", "rarity": "Редкая"})
+    assert all(stamp["cost"] > 1000 for stamp in response.json()["items"])
+    assert len(response.json()["items"]) == 3
+
+    response = client.get("/api/stamps/", params={"country": "Pagiland", "cost_from": 1000, "cost_to": 1500})
+    assert [stamp["cost"] for stamp in response.json()["items"]] == [1000, 1500]
+
+    # Редкость в списке, карточке марки и коллекции считается по одному порогу
+    from app.models.stamp import RARE_COST_THRESHOLD
+    items = client.get("/api/stamps/", params={"country": "Pagiland"}).json()["items"]
+    details = {stamp["id"]: client.get(f"/api/stamps/{stamp['id']}").json() for stamp in items}
+    collection = client.get(f"/api/collections/{details[items[0]['id']]['collection_id']}").json()
+    in_collection = {stamp["id"]: stamp["rarity"] for stamp in collection["stamps"]}
+    for stamp in items:
+        expected = "Редкая" if stamp["cost"] > RARE_COST_THRESHOLD else "Обычная"
+        assert stamp["rarity"] == details[stamp["id"]]["rarity"] == in_collection[stamp["id"]] == expected
+
+    response = client.get("/api/stamps/", params={"rarity": "Неизвестная"})
+    assert response.status_code == 400
+
+def seed_rare_collectors(count, offset):
+    from app.models.user import User
+    from app.models.collector import Collector
+    from app.models.collection import Collection
+    from app.models.stamp import Stamp
+
+    db = TestingSessionLocal()
+    try:
+        for i in range(offset, offset + count):
+            user = User(email=f"seed{i}@example.com", username=f"seed{i}", hashed_password="x")
+            user.collector = Collector()
+            collection = Collection(name=f"Seed {i}", description="", collector=user.collector)
+            collection.stamps = [
+                Stamp(name=f"Seed stamp {i}-{j}", serial_number=f"SEED-{i}-{j}", country="Seedland",
+                      year=1950, circulation=10, cost=2000 if j == 0 else 10, perforation=1, topic="Seed")
+                for j in range(3)
+            ]
+            db.add(user)
+            db.add(collection)
+        db.commit()
+        # Данные добавлены в обход обработчиков марок — суммы для рейтингов пересчитываются
+        Collector.rebuild_totals(db)
+    finally:
+        db.close()
+
+def count_queries(path):
+    from sqlalchemy import event
+
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements), response.json()
+
+def test_grouped_rare_query_count_is_constant(test_db):
+    seed_rare_collectors(2, offset=0)
+    small_count, small_result = count_queries("/api/stamps/grouped_rare")
+    seed_rare_collectors(20, offset=2)
+    large_count, large_result = count_queries("/api/stamps/grouped_rare")
+
+    assert len(large_result) == len(small_result) + 20
+    assert small_count == large_count
+
+    seeded = next(group for group in large_result if group["username"] == "seed0")
+    assert seeded["collectionCount"] == 1
+    assert seeded["stampCount"] == 3
+    assert [stamp["cost"] for stamp in seeded["rare_stamps"]] == [2000]
+
+def test_collector_listings_use_aggregated_summary(test_db):
+    paths = [
+        "/api/profiles/list",
+        "/api/profiles/sorted_by_collection_value",
+        "/api/profiles/collectors_with_old_stamps",
+        "/api/collections/grouped",
+    ]
+    before = {path: count_queries(path)[0] for path in paths}
+    seed_rare_collectors(5, offset=100)
+    after = {path: count_queries(path)[0] for path in paths}
+    assert before == after
+
+    _, collectors = count_queries("/api/profiles/sorted_by_collection_value")
+    seeded = next(collector for collector in collectors if collector["username"] == "seed100")
+    assert seeded["collectionCount"] == 1
+    assert seeded["stampCount"] == 3
+    assert seeded["totalCollectionValue"] == 2020
+    values = [collector["totalCollectionValue"] for collector in collectors]
+    assert values == sorted(values, reverse=True)
+
+    _, collector = count_queries("/api/profiles/most_expensive_stamp_collector")
+    assert collector["stampCount"] > 0
+
+def test_endpoints_with_async_session(test_db):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+    AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_async_db
+    try:
+        register_user("asyncuser@example.com", "asyncuser", "asyncpass")
+        access_token = login_user("asyncuser", "asyncpass")
+        headers = {"Authorization": f"Bearer {access_token}"}
+        response = client.post("/api/collections/create", data={
+            "name": "Async Collection",
+            "description": "Created through AsyncSession"
+        }, headers=headers)
+        assert response.status_code == 200
+        collection_id = response.json()["id"]
+        create_stamp(headers, collection_id, "ASYNC-1", cost=5000.0)
+
+        response = client.get("/api/stamps/grouped_rare")
+        assert response.status_code == 200
+        assert any(group["username"] == "asyncuser" for group in response.json())
+
+        response = client.get(f"/api/collections/{collection_id}")
+        assert response.status_code == 200
+        assert [stamp["serial_number"] for stamp in response.json()["stamps"]] == ["ASYNC-1"]
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+        import asyncio
+        asyncio.run(async_engine.dispose())
+
+def test_pool_stats_track_checkouts_and_waits():
+    from app.core.database import TimedQueuePool, get_pool_stats
+
+    pool_engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05)
+    try:
+        checkouts_before = TimedQueuePool.wait_stats.checkouts
+        with pool_engine.connect():
+            stats = get_pool_stats(pool_engine.pool)
+            assert stats["checked_out"] == 1
+            assert stats["size"] == 1
+            with pytest.raises(Exception):
+                pool_engine.connect()
+        stats = get_pool_stats(pool_engine.pool)
+        assert stats["checked_out"] == 0
+        assert stats["checkouts"] == checkouts_before + 2
+        assert stats["timeouts"] >= 1
+        assert stats["wait_time_max_ms"] >= 50
+    finally:
+        pool_engine.dispose()
+
+def test_pool_stats_requires_admin(test_db):
+    register_user("poolviewer@example.com", "poolviewer", "poolviewer")
+    access_token = login_user("poolviewer", "poolviewer")
+    response = client.get("/api/admin/pool", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 403
+
+def test_refresh_middleware_releases_connections_under_load(test_db):
+    import asyncio
+    import httpx
+    from datetime import datetime, timedelta, timezone
+    from jose import jwt
+    from sqlalchemy import event
+    from app.core.security import SECRET_KEY, ALGORITHM
+
+    response = register_user("refreshuser@example.com", "refreshuser", "refreshpass")
+    user_id = response.json()["id"]
+    refresh_token = response.cookies.get("refresh_token")
+    expired_token = jwt.encode(
+        {"sub": str(user_id), "exp": datetime.now(timezone.utc) - timedelta(minutes=1)},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+
+    checked_out = {"current": 0, "peak": 0}
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out["current"] += 1
+        checked_out["peak"] = max(checked_out["peak"], checked_out["current"])
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out["current"] -= 1
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", cookies={"refresh_token": refresh_token}) as async_client:
+            return await asyncio.gather(*[
+                async_client.get("/api/settings/user", headers={"Authorization": f"Bearer {expired_token}"})
+                for _ in range(50)
+            ])
+
+    try:
+        responses = asyncio.run(burst())
+    finally:
+        event.remove(engine, "checkout", on_checkout)
+        event.remove(engine, "checkin", on_checkin)
+
+    assert all(response.status_code == 200 for response in responses)
+    assert all("New-Access-Token" in response.headers for response in responses)
+    assert checked_out["current"] == 0
+    assert engine.pool.checkedout() == 0
+    assert checked_out["peak"] <= engine.pool.size() + engine.pool._max_overflow
+
+def test_refresh_without_cookie_is_rejected(test_db):
+    from datetime import datetime, timedelta, timezone
+    from jose import jwt
+    from app.core.security import SECRET_KEY, ALGORITHM
+
+    expired_token = jwt.encode({"sub": "1", "exp": datetime.now(timezone.utc) - timedelta(minutes=1)}, SECRET_KEY, algorithm=ALGORITHM)
+    # Отдельный клиент без refresh_token в cookies
+    response = TestClient(app).get("/api/settings/user", headers={"Authorization": f"Bearer {expired_token}"})
+    assert response.status_code == 401
+
+@pytest.mark.parametrize("path, public", [
+    ("/static/stamps/1.png", True),
+    ("/api/stamps/", True),
+    ("/api/stamps/42", True),
+    ("/api/stamps/update/42", False),
+    ("/api/stamps/update/abc", True),
+    ("/api/collections/create", False),
+    ("/api/collections/grouped", True),
+    ("/api/profiles/list", True),
+    ("/api/profiles/7/user_settings", False),
+    ("/api/profiles/collectors/7", False),
+    ("/api/auth/login", True),
+    ("/api/auth/logout", False),
+    ("/api/settings/user", False),
+    ("/api/admin/users", False),
+    ("/api/search/", True),
+])
+def test_route_protection_policy(path, public):
+    from app.middleware.auto_refresh import is_public_path
+
+    assert is_public_path(path) is public
+
+def test_request_logging_is_structured(test_db, caplog):
+    import json
+    from app.logging_config import JsonFormatter
+
+    with caplog.at_level("INFO", logger="backend_logger"):
+        response = client.get("/api/stamps/999999", headers={"X-Request-ID": "req-42"})
+    assert response.status_code == 404
+    assert response.headers["X-Request-ID"] == "req-42"
+
+    record = next(r for r in caplog.records if getattr(r, "fields", {}).get("request_id") == "req-42")
+    assert record.fields["route"] == "/api/stamps/{stamp_id}"
+    assert record.fields["status"] == 404
+    assert record.fields["bytes"] == int(response.headers["content-length"])
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["method"] == "GET"
+    assert entry["latency_ms"] >= 0
+
+def test_queued_log_keeps_traceback_separate():
+    import json
+    import logging
+    import queue
+    from app.logging_config import JsonFormatter, StructuredQueueHandler
+
+    log_queue = queue.SimpleQueue()
+    handler = StructuredQueueHandler(log_queue)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.getLogger("backend_logger").makeRecord(
+            "backend_logger", logging.ERROR, __file__, 0, "Ошибка %s", ("req-1",), sys.exc_info(),
+        )
+    handler.handle(record)
+
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert entry["message"] == "Ошибка req-1"
+    assert "ZeroDivisionError" in entry["exc_info"]
+
+def test_metrics_endpoint(test_db, monkeypatch):
+    from app.core.query_stats import track_queries
+    from app.api.endpoints import metrics
+
+    # Без настроенного токена метрики (и состояние пулов БД) не отдаются никому
+    assert client.get("/metrics").status_code == 404
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    track_queries(engine)
+    client.get("/api/stamps/grouped_rare")
+    client.get("/api/stamps/999999")
+
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/stamps/grouped_rare",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="/api/stamps/{stamp_id}",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/api/stamps/grouped_rare"}' in body
+    assert 'http_requests_in_flight{method="GET"}' in body
+    assert "db_pool_checked_out" in body
+
+    queries = next(
+        line for line in body.splitlines()
+        if line.startswith('http_request_db_queries_sum{method="GET",route="/api/stamps/grouped_rare"}')
+    )
+    assert float(queries.split()[-1]) >= 1
+
+def test_query_profiler_headers(test_db, monkeypatch, caplog):
+    from app.core import query_stats
+
+    response = client.get("/api/profiles/list")
+    assert "X-DB-Queries" not in response.headers
+
+    query_stats.track_queries(engine)
+    monkeypatch.setattr(query_stats, "DB_PROFILE", True)
+    with caplog.at_level("INFO", logger="backend_logger"):
+        response = client.get("/api/profiles/list")
+    assert response.status_code == 200
+    assert int(response.headers["X-DB-Queries"]) >= 1
+    assert float(response.headers["X-DB-Time-ms"]) >= 0
+
+    record = next(r for r in caplog.records if getattr(r, "fields", {}).get("slowest_queries"))
+    assert record.fields["route"] == "/api/profiles/list"
+    slowest = record.fields["slowest_queries"][0]
+    assert "SELECT" in slowest["statement"]
+    assert slowest["call_site"].startswith("api/endpoints/profile/profiles.py:")
+
+def test_login_rehashes_outdated_password_hash(test_db):
+    from passlib.context import CryptContext
+    from app.core.security import pwd_context
+    from app.models.user import User
+
+    register_user("rehash@example.com", "rehashuser", "rehashpass")
+    old_context = CryptContext(schemes=["argon2"], argon2__rounds=1, argon2__memory_cost=1024, argon2__parallelism=1)
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == "rehashuser").update({User.hashed_password: old_context.hash("rehashpass")})
+        db.commit()
+
+        assert login_user("rehashuser", "rehashpass")
+        db.expire_all()
+        new_hash = db.query(User.hashed_password).filter(User.username == "rehashuser").scalar()
+    finally:
+        db.close()
+    assert not pwd_context.needs_update(new_hash)
+    assert pwd_context.verify("rehashpass", new_hash)
+    assert login_user("rehashuser", "rehashpass")
+
+def test_password_hashing_backpressure(test_db, monkeypatch):
+    from app.core import security
+
+    # Пул без свободных слотов: логин отклоняется сразу, не вставая в очередь
+    monkeypatch.setattr(security, "password_hash_pool", security.PasswordHashPool(1, 0))
+    response = client.post("/api/auth/login", json={"username": "rehashuser", "password": "rehashpass"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_access_token_verified_once_per_process(test_db, monkeypatch):
+    from app.core import security
+
+    access_token = login_user("rehashuser", "rehashpass")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    decoded = []
+    original_decode = security.jwt.decode
+
+    def counting_decode(token, *args, **kwargs):
+        decoded.append(token)
+        return original_decode(token, *args, **kwargs)
+
+    monkeypatch.setattr(security.jwt, "decode", counting_decode)
+    for i in range(3):
+        response = client.post("/api/collections/create", data={"name": f"Cached token {i}", "description": "Token cache"}, headers=headers)
+        assert response.status_code == 200
+    assert decoded.count(access_token) == 1
+
+def test_verified_token_cache_expiry_and_eviction():
+    import time
+    from app.core.security import VerifiedTokenCache
+
+    cache = VerifiedTokenCache(maxsize=2)
+    cache.put(b"expired", {"sub": "1", "exp": time.time() - 1})
+    assert cache.get(b"expired") is None
+    cache.put(b"no-exp", {"sub": "1"})
+    assert cache.get(b"no-exp") is None
+
+    for key in (b"a", b"b"):
+        cache.put(key, {"sub": key.decode(), "exp": time.time() + 60})
+    cache.get(b"a")
+    cache.put(b"c", {"sub": "c", "exp": time.time() + 60})
+    assert cache.get(b"b") is None
+    assert cache.get(b"a")["sub"] == "a"
+    assert cache.get(b"c")["sub"] == "c"
+
+def test_stamp_detail_single_query_and_conditional_get(test_db):
+    register_user("etag@example.com", "etaguser", "etagpass")
+    headers = {"Authorization": f"Bearer {login_user('etaguser', 'etagpass')}"}
+    response = client.post("/api/collections/create", data={"name": "ETag", "description": "ETag"}, headers=headers)
+    collection_id = response.json()["id"]
+    stamp = create_stamp(headers, collection_id, "ETAG-1")
+
+    queries, data = count_queries(f"/api/stamps/{stamp['id']}")
+    assert queries == 1
+    assert data["collector_id"] is not None
+
+    response = client.get(f"/api/stamps/{stamp['id']}")
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+    assert etag.startswith('"') and not etag.startswith('W/')
+
+    response = client.get(f"/api/stamps/{stamp['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    response = client.get(f"/api/stamps/{stamp['id']}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    response = client.patch(f"/api/stamps/update/{stamp['id']}", data={
+        "name": "Renamed", "serial_number": "ETAG-1", "country": "Testland", "year": 2020,
+        "circulation": 1000, "cost": 100.0, "perforation": "Type A", "topic": "Test Topic", "features": "Feature",
+    }, headers=headers)
+    assert response.status_code == 200
+
+    response = client.get(f"/api/stamps/{stamp['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Renamed"
+    assert response.headers["ETag"] != etag
+
+def test_leaderboard_totals_follow_stamp_changes(test_db):
+    from app.models.collector import Collector
+    from app.models.collection import Collection
+
+    register_user("leader@example.com", "leaderuser", "leaderpass")
+    headers = {"Authorization": f"Bearer {login_user('leaderuser', 'leaderpass')}"}
+    collection_id = client.post("/api/collections/create", data={"name": "Leader", "description": "Top"}, headers=headers).json()["id"]
+    first = create_stamp(headers, collection_id, "LEAD-1", cost=900000.0)
+    create_stamp(headers, collection_id, "LEAD-2", cost=100000.0)
+
+    def leader_totals():
+        db = TestingSessionLocal()
+        try:
+            collection = db.query(Collection).filter(Collection.id == collection_id).one()
+            return collection.total_cost, collection.collector.total_value
+        finally:
+            db.close()
+
+    assert leader_totals() == (1000000, 1000000)
+    response = client.get("/api/collections/top_expensive")
+    assert response.json()[0]["id"] == collection_id
+    assert response.json()[0]["total_cost"] == 1000000
+    response = client.get("/api/profiles/sorted_by_collection_value?limit=1")
+    assert [(c["username"], c["totalCollectionValue"]) for c in response.json()] == [("leaderuser", 1000000)]
+
+    response = client.patch(f"/api/stamps/update/{first['id']}", data={
+        "name": "Cheaper", "serial_number": "LEAD-1", "country": "Testland", "year": 2020,
+        "circulation": 1000, "cost": 800000.0, "perforation": "Type A", "topic": "Test Topic", "features": "Feature",
+    }, headers=headers)
+    assert response.status_code == 200
+    assert leader_totals() == (900000, 900000)
+
+    assert client.delete(f"/api/stamps/delete/{first['id']}", headers=headers).status_code == 200
+    assert leader_totals() == (100000, 100000)
+
+    # Пересчёт с нуля даёт те же суммы, что и инкрементальные обновления
+    db = TestingSessionLocal()
+    try:
+        Collector.rebuild_totals(db)
+    finally:
+        db.close()
+    assert leader_totals() == (100000, 100000)
+
+    # Дробные стоимости: SQLite хранит суммы как REAL, ответы не должны падать на валидации
+    create_stamp(headers, collection_id, "LEAD-3", cost=0.5)
+    response = client.get("/api/collections/top_expensive")
+    assert response.status_code == 200
+    assert next(c["total_cost"] for c in response.json() if c["id"] == collection_id) == 100000.5
+    response = client.get("/api/profiles/sorted_by_collection_value")
+    assert response.status_code == 200
+    assert next(c["totalCollectionValue"] for c in response.json() if c["username"] == "leaderuser") == 100000.5
+
+    client.delete(f"/api/collections/delete/{collection_id}", headers=headers)
+    db = TestingSessionLocal()
+    try:
+        collector = db.query(Collector).join(Collector.user).filter_by(username="leaderuser").one()
+        assert collector.total_value == 0
+    finally:
+        db.close()
+
+def test_stamp_filters_use_indexes(test_db):
+    from sqlalchemy import text
+    from app.models.stamp import Stamp, RARE_STAMP
+
+    db = TestingSessionLocal()
+    try:
+        # Порог редкости — литерал в SQL, иначе частичный индекс неприменим к подготовленным запросам
+        assert "stamps.cost > 1000" in str(db.query(Stamp.id).filter(RARE_STAMP).statement)
+
+        def plan(sql):
+            return " ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+        assert "ix_stamps_collection_id_cost" in plan("SELECT * FROM stamps WHERE collection_id = 1")
+        assert "ix_collections_collector_id" in plan("SELECT * FROM collections WHERE collector_id = 1")
+        assert "ix_stamps_topic" in plan("SELECT * FROM stamps WHERE topic = 'Space'")
+        assert "ix_stamps_rare" in plan("SELECT collection_id FROM stamps INDEXED BY ix_stamps_rare WHERE cost > 1000")
+    finally:
+        db.close()
+
+def test_search_ranks_and_paginates(test_db):
+    register_user("search@example.com", "searchuser", "searchpass")
+    headers = {"Authorization": f"Bearer {login_user('searchuser', 'searchpass')}"}
+    collection_id = client.post("/api/collections/create", data={
+        "name": "Космическая серия", "description": "Марки о покорении орбиты"
+    }, headers=headers).json()["id"]
+    in_name = create_stamp(headers, collection_id, "SRCH-1", topic="Космонавтика")
+    in_topic = create_stamp(headers, collection_id, "SRCH-2", topic="Космонавтика")
+    client.patch(f"/api/stamps/update/{in_name['id']}", data={
+        "name": "Гагарин космонавт", "serial_number": "SRCH-1", "country": "СССР", "year": 1961,
+        "circulation": 1000, "cost": 100.0, "perforation": "Type A", "topic": "История", "features": "Feature",
+    }, headers=headers)
+
+    response = client.get("/api/search/", params={"q": "гагарин"})
+    assert response.status_code == 200
+    assert [stamp["id"] for stamp in response.json()["stamps"]] == [in_name["id"]]
+
+    # Префикс слова, совпадение в названии выше совпадения в теме
+    data = client.get("/api/search/", params={"q": "косм"}).json()
+    assert [stamp["id"] for stamp in data["stamps"]] == [in_name["id"], in_topic["id"]]
+    assert [collection["id"] for collection in data["collections"]] == [collection_id]
+
+    data = client.get("/api/search/", params={"q": "косм", "limit": 1}).json()
+    assert [stamp["id"] for stamp in data["stamps"]] == [in_name["id"]]
+    assert data["next_offset"] == 1
+    data = client.get("/api/search/", params={"q": "косм", "limit": 1, "offset": 1}).json()
+    assert [stamp["id"] for stamp in data["stamps"]] == [in_topic["id"]]
+    assert data["next_offset"] is None
+
+    # Индекс следует за изменениями марок, включая удаление
+    assert client.get("/api/search/", params={"q": "SRCH-1"}).json()["stamps"][0]["id"] == in_name["id"]
+    client.delete(f"/api/stamps/delete/{in_topic['id']}", headers=headers)
+    data = client.get("/api/search/", params={"q": "космонавтика"}).json()
+    assert data["stamps"] == []
+
+    data = client.get("/api/search/", params={"q": "\"*:"}).json()
+    assert data == {"stamps": [], "collections": [], "next_offset": None}
+
+def check_response_cache(monkeypatch, backend, email, username):
+    from app.core import cache
+
+    monkeypatch.setattr(cache, "response_cache", backend)
+    register_user(email, username, "cachepass")
+    headers = {"Authorization": f"Bearer {login_user(username, 'cachepass')}"}
+    collection_id = client.post("/api/collections/create", data={
+        "name": "Кэшируемая", "description": "Test"
+    }, headers=headers).json()["id"]
+
+    first = client.get("/api/stamps/top_expensive")
+    assert first.headers["X-Cache"] == "MISS"
+    second = client.get("/api/stamps/top_expensive")
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+    assert second.headers["content-type"] == first.headers["content-type"]
+
+    # Порядок параметров не влияет на ключ
+    client.get("/api/stamps/", params={"limit": 5, "country": "Testland"})
+    assert client.get("/api/stamps/?country=Testland&limit=5").headers["X-Cache"] == "HIT"
+
+    # Запись через API сбрасывает зависящие от неё списки
+    stamp = create_stamp(headers, collection_id, f"CACHE-{username}", cost=999999.0)
+    response = client.get("/api/stamps/top_expensive")
+    assert response.headers["X-Cache"] == "MISS"
+    assert stamp["id"] in [item["id"] for item in response.json()]
+
+    client.delete(f"/api/collections/delete/{collection_id}", headers=headers)
+    response = client.get("/api/stamps/top_expensive")
+    assert response.headers["X-Cache"] == "MISS"
+    assert stamp["id"] not in [item["id"] for item in response.json()]
+
+    # Маршруты вне CACHED_ROUTES и ошибки не кэшируются
+    assert "X-Cache" not in client.get(f"/api/collections/{collection_id}").headers
+    assert "X-Cache" not in client.get("/api/stamps/", params={"limit": 0}).headers
+
+def test_response_cache_memory_backend(test_db, monkeypatch):
+    from app.core.cache import MemoryCacheBackend
+
+    check_response_cache(monkeypatch, MemoryCacheBackend(), "cachemem@example.com", "cachemem")
+
+def test_response_cache_redis_backend(test_db, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from app.core.cache import RedisCacheBackend
+
+    check_response_cache(monkeypatch, RedisCacheBackend(client=fakeredis.FakeRedis()), "cacheredis@example.com", "cacheredis")
+
+def test_memory_cache_ttl_and_lru(monkeypatch):
+    from app.core import cache
+
+    backend = cache.MemoryCacheBackend(max_entries=2)
+    backend.set("a", b"1", 60)
+    backend.set("b", b"2", 60)
+    backend.get("a")
+    backend.set("c", b"3", 60)
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+
+    now = cache.time.monotonic()
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now + 61)
+    assert backend.get("a") is None
+
+    assert backend.tag_versions(["stamps"]) == [0]
+    backend.invalidate(["stamps"])
+    assert backend.tag_versions(["stamps", "collections"]) == [1, 0]
+
+    # Инвалидация в памяти не доходит до других воркеров: с ними кэш не включается
+    assert isinstance(cache.create_backend("memory", workers=1), cache.MemoryCacheBackend)
+    assert cache.create_backend("memory", workers=4) is None
+
+def test_list_endpoints_use_response_models(test_db):
+    register_user("models@example.com", "modelsuser", "modelspass")
+    headers = {"Authorization": f"Bearer {login_user('modelsuser', 'modelspass')}"}
+    collection_id = client.post("/api/collections/create", data={
+        "name": "Модели", "description": "Test"
+    }, headers=headers).json()["id"]
+    stamp = create_stamp(headers, collection_id, "MODEL-1", cost=5000.0, country="Modelland")
+
+    item = client.get("/api/stamps/", params={"country": "Modelland"}).json()["items"][0]
+    assert item == {
+        "id": stamp["id"], "name": "Stamp MODEL-1", "serial_number": "MODEL-1", "country": "Modelland",
+        "year": 2020, "circulation": 1000, "cost": 5000, "perforation": "Type A", "topic": "Test Topic",
+        "features": "Feature", "photo_url": stamp["photo_url"], "rarity": "Редкая",
+        "thumbnail_url": stamp["photo_url"].removesuffix(".jpg") + ".thumb.webp",
+    }
+    assert item["photo_url"].startswith("http://localhost:8000/static/")
+
+    grouped = next(entry for entry in client.get("/api/stamps/grouped_rare").json() if entry["username"] == "modelsuser")
+    assert grouped["rare_stamps"] == [item]
+    assert grouped["bio"] == "" and grouped["specialties"] == [] and grouped["collectionCount"] == 1
+
+    collector = next(entry for entry in client.get("/api/profiles/sorted_by_collection_value").json() if entry["username"] == "modelsuser")
+    assert collector["totalCollectionValue"] == 5000
+    assert collector["featured"] is False
+
+    schemas = client.get("/openapi.json").json()["components"]["schemas"]
+    assert {"StampOut", "StampPage", "CollectionOut", "CollectorSummary", "CollectorRareStamps"} <= set(schemas)
+
+def test_streaming_export(test_db, monkeypatch):
+    import csv
+    import io
+    import json
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app.api.endpoints import export
+    from app.models.stamp import Stamp
+    from app.models.user import User
+
+    register_user("exporter@example.com", "exporter", "exporterpass")
+    headers = {"Authorization": f"Bearer {login_user('exporter', 'exporterpass')}"}
+    collection_id = client.post("/api/collections/create", data={
+        "name": "Выгрузка", "description": "Test"
+    }, headers=headers).json()["id"]
+    for i in range(5):
+        create_stamp(headers, collection_id, f"EXPORT-{i}", country="Exportland")
+
+    assert client.get("/api/admin/export/stamps", headers=headers).status_code == 403
+    db = TestingSessionLocal()
+    db.query(User).filter(User.username == "exporter").update({User.role_id: 1})
+    db.commit()
+    expected_ids = [stamp_id for (stamp_id,) in db.query(Stamp.id).order_by(Stamp.id)]
+    db.close()
+
+    # Маленькие пачки: каждая читается из курсора и отправляется отдельно
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    batches = []
+    encode_ndjson = export.encode_ndjson
+    monkeypatch.setattr(export, "encode_ndjson", lambda columns, rows: batches.append(len(rows)) or encode_ndjson(columns, rows))
+
+    def check_exports():
+        batches.clear()
+        response = client.get("/api/admin/export/stamps", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "content-length" not in response.headers
+        assert max(batches) == 2 and sum(batches) == len(expected_ids)
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == expected_ids
+        exported = next(row for row in rows if row["serial_number"] == "EXPORT-0")
+        assert exported["collection_id"] == collection_id
+        assert exported["photo_url"].startswith("http://localhost:8000/static/")
+
+        response = client.get("/api/admin/export/collectors", params={"format": "csv"}, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "text/csv; charset=utf-8"
+        assert 'filename="collectors.csv"' in response.headers["content-disposition"]
+        collectors = list(csv.DictReader(io.StringIO(response.text)))
+        assert any(row["username"] == "exporter" and row["email"] == "exporter@example.com" for row in collectors)
+
+    check_exports()
+
+    async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+    AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_async_db
+    try:
+        check_exports()
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+        import asyncio
+        asyncio.run(async_engine.dispose())
+
+def test_image_upload_validation(test_db, media_storage, monkeypatch):
+    import hashlib
+    import io
+    from app.core import uploads
+
+    register_user("uploader@example.com", "uploader", "uploaderpass")
+    headers = {"Authorization": f"Bearer {login_user('uploader', 'uploaderpass')}"}
+    collection_id = client.post("/api/collections/create", data={
+        "name": "Загрузки", "description": "Test"
+    }, headers=headers).json()["id"]
+    form = {
+        "name": "Upload", "serial_number": "UPLOAD-1", "country": "Testland", "year": 2020,
+        "circulation": 1000, "cost": 100.0, "perforation": "Type A", "topic": "Test Topic",
+        "features": "Feature", "collection_id": collection_id,
+    }
+
+    def upload_stamp(content, content_type="image/jpeg"):
+        return client.post("/api/stamps/create", data=form, headers=headers,
+                           files={"image": ("photo.jpg", io.BytesIO(content), content_type)})
+
+    def leftovers():
+        temp_dir = media_storage.temp_dir
+        return [name for name in os.listdir(temp_dir) if name.startswith(".upload-")] if os.path.isdir(temp_dir) else []
+
+    # Расширение и Content-Type не спасают файл, который не является изображением
+    assert upload_stamp(b"not an image at all").status_code == 400
+    assert upload_stamp(TEST_JPEG, "text/plain").status_code == 400
+    # Сигнатура JPEG без самого изображения не декодируется
+    assert upload_stamp(b"\xff\xd8\xff\xe0" + b"fake image data").status_code == 400
+    assert leftovers() == []
+
+    with monkeypatch.context() as limits:
+        limits.setattr(uploads, "UPLOAD_MAX_BYTES", len(TEST_JPEG) + 10)
+        limits.setattr(uploads, "UPLOAD_CHUNK_BYTES", 16)
+        assert upload_stamp(TEST_JPEG + b"\0" * 100).status_code == 413
+        assert leftovers() == []
+
+        # Заведомо большое тело отклоняется по Content-Length, до разбора формы
+        from app.middleware.upload_limit import FORM_OVERHEAD_BYTES
+        oversized = TEST_JPEG + b"\0" * (FORM_OVERHEAD_BYTES + 100)
+        parsed = []
+        limits.setattr(uploads, "stage_image", lambda *args, **kwargs: parsed.append(args))
+        response = client.post("/api/stamps/create", data=form, headers=headers,
+                               files={"image": ("photo.jpg", io.BytesIO(oversized), "image/jpeg")})
+        assert response.status_code == 413
+        assert response.json()["detail"] == uploads.too_large().detail
+        # Без Content-Length тело обрывается, как только превысит предел
+        chunks = iter([b"--x\r\n", oversized, b"\r\n--x--\r\n"])
+        response = client.post("/api/stamps/create", content=chunks, headers={
+            **headers, "Content-Type": "multipart/form-data; boundary=x",
+        })
+        assert response.status_code == 413
+        assert parsed == [] and leftovers() == []
+
+    # PNG сохраняется под хэшем содержимого с расширением по содержимому, а не по имени файла
+    png = make_image("PNG", color="orange")
+    response = upload_stamp(png)
+    assert response.status_code == 200
+    photo_url = response.json()["photo_url"]
+    digest = hashlib.sha256(png).hexdigest()
+    assert photo_url == f"http://localhost:8000/static/media/{digest[:2]}/{digest}.png"
+    with open(stored_path(photo_url), "rb") as saved:
+        assert saved.read() == png
+    assert os.path.exists(stored_path(photo_url.removesuffix(".png") + ".thumb.webp"))
+    assert leftovers() == []
+
+    # При смене формата прежний файл удаляется
+    response = client.patch(f"/api/stamps/update/{response.json()['id']}", data={
+        key: value for key, value in form.items() if key != "collection_id"
+    }, files={"image": ("photo.png", io.BytesIO(TEST_JPEG), "image/jpeg")}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["photo_url"].endswith(".jpg")
+    assert not os.path.exists(stored_path(photo_url))
+    assert not os.path.exists(stored_path(photo_url.removesuffix(".png") + ".thumb.webp"))
+    assert os.path.exists(stored_path(response.json()["photo_url"].removesuffix(".jpg") + ".thumb.webp"))
+
+    response = client.patch("/api/settings/avatar", files={"file": ("me.gif", io.BytesIO(make_image("GIF")), "image/gif")}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["avatar_url"].endswith(".gif")
+    assert os.path.exists("static/avatars/default_avatar.png")
+
+def test_image_variants_for_lists_and_details(test_db):
+    import io
+    from PIL import Image
+
+    register_user("thumbs@example.com", "thumbsuser", "thumbspass")
+    headers = {"Authorization": f"Bearer {login_user('thumbsuser', 'thumbspass')}"}
+    response = client.post("/api/collections/create", data={"name": "Миниатюры", "description": "Test"},
+                           files={"image": ("wide.png", io.BytesIO(make_image("PNG", (2000, 1000))), "image/png")},
+                           headers=headers)
+    collection_id = response.json()["id"]
+
+    def image_size(url):
+        with Image.open(stored_path(url)) as image:
+            return image.format, image.size
+
+    collection = next(item for item in client.get("/api/collections").json() if item["id"] == collection_id)
+    assert collection["thumbnail_url"] == collection["photo_url"].removesuffix(".png") + ".thumb.webp"
+    assert image_size(collection["thumbnail_url"]) == ("WEBP", (320, 160))
+    detail = client.get(f"/api/collections/{collection_id}").json()
+    assert image_size(detail["large_url"]) == ("WEBP", (1280, 640))
+
+    # Маленькие изображения не увеличиваются
+    stamp = create_stamp(headers, collection_id, "THUMB-1", country="Thumbland", image=make_image(color="teal"))
+    item = client.get("/api/stamps/", params={"country": "Thumbland"}).json()["items"][0]
+    assert image_size(item["thumbnail_url"]) == ("WEBP", (40, 30))
+    assert client.get(f"/api/collections/{collection_id}").json()["stamps"][0]["thumbnail_url"] == item["thumbnail_url"]
+    large = client.get(f"/api/stamps/{stamp['id']}").json()["large_url"]
+    assert image_size(large) == ("WEBP", (40, 30))
+
+    collector = next(entry for entry in client.get("/api/profiles/list").json() if entry["username"] == "thumbsuser")
+    assert collector["avatar_thumbnail_url"] == "http://localhost:8000/static/avatars/default_avatar.thumb.webp"
+
+    # Старые загрузки без копий: клиент получает null и показывает оригинал
+    from app.models.collector import Collector
+    db = TestingSessionLocal()
+    try:
+        owner = db.query(Collector).filter(Collector.user_id == collection["collector_id"]).one()
+        owner.avatar_url = "/static/avatars/2.jpg"
+        db.commit()
+    finally:
+        db.close()
+    collector = next(entry for entry in client.get("/api/profiles/list").json() if entry["username"] == "thumbsuser")
+    assert (collector["avatar_url"], collector["avatar_thumbnail_url"]) == ("http://localhost:8000/static/avatars/2.jpg", None)
+
+    client.delete(f"/api/stamps/delete/{stamp['id']}", headers=headers)
+    assert not os.path.exists(stored_path(item["thumbnail_url"]))
+    assert not os.path.exists(stored_path(large))
+
+def test_media_storage_deduplicates_and_collects(test_db):
+    import hashlib
+    import io
+    from app.models.media import MediaBlob
+    from app.core.uploads import media_digest, media_path
+
+    register_user("media@example.com", "mediauser", "mediapass")
+    headers = {"Authorization": f"Bearer {login_user('mediauser', 'mediapass')}"}
+    image = make_image(color="purple")
+
+    def ref_count(url):
+        db = TestingSessionLocal()
+        try:
+            blob = db.get(MediaBlob, media_digest(url.removeprefix("http://localhost:8000")))
+            return blob.ref_count if blob else None
+        finally:
+            db.close()
+
+    collection = client.post("/api/collections/create", data={"name": "Дубликаты", "description": "Test"},
+                             files={"image": ("cover.jpg", io.BytesIO(image), "image/jpeg")}, headers=headers).json()
+    first = create_stamp(headers, collection["id"], "MEDIA-1", image=image)
+    second = create_stamp(headers, collection["id"], "MEDIA-2", image=image)
+    # Одно содержимое — один файл на диске и три ссылки на него
+    assert first["photo_url"] == second["photo_url"] == collection["photo_url"]
+    assert ref_count(first["photo_url"]) == 3
+
+    # Отклонённый запрос удаляет свой файл, но не файл, на который уже есть ссылки
+    rejected = make_image(color="olive")
+    rejected_url = "http://localhost:8000" + media_path(hashlib.sha256(rejected).hexdigest(), ".jpg")
+    for content in (rejected, image):
+        response = client.post("/api/stamps/create", headers=headers, files={"image": ("x.jpg", io.BytesIO(content), "image/jpeg")}, data={
+            "name": "Rejected", "serial_number": "MEDIA-X", "country": "Testland", "year": 2020, "circulation": 1,
+            "cost": 1.0, "perforation": "A", "topic": "T", "features": "F", "collection_id": 999999,
+        })
+        assert response.status_code == 403
+    assert ref_count(rejected_url) is None
+    assert not os.path.exists(stored_path(rejected_url))
+    assert not os.path.exists(stored_path(rejected_url.removesuffix(".jpg") + ".thumb.webp"))
+    assert ref_count(first["photo_url"]) == 3
+    assert os.path.exists(stored_path(first["photo_url"]))
+
+    # Адрес зависит только от содержимого, поэтому файл кэшируется навсегда
+    response = client.get(first["photo_url"].removeprefix("http://localhost:8000"))
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert "expires" in response.headers
+    assert "immutable" not in client.get("/static/avatars/default_avatar.png").headers.get("cache-control", "")
+
+    client.delete(f"/api/stamps/delete/{first['id']}", headers=headers)
+    assert ref_count(first["photo_url"]) == 2
+    assert os.path.exists(stored_path(first["photo_url"]))
+
+    # Обложка и оставшаяся марка удаляются вместе с коллекцией — последние ссылки на файл
+    assert client.delete(f"/api/collections/delete/{collection['id']}", headers=headers).status_code == 204
+    assert ref_count(first["photo_url"]) is None
+    assert not os.path.exists(stored_path(first["photo_url"]))
+    assert not os.path.exists(stored_path(first["photo_url"].removesuffix(".jpg") + ".thumb.webp"))
+
+    # Аватарку удалённого пользователя никто больше не использует
+    avatar = client.patch("/api/settings/avatar", files={"file": ("me.png", io.BytesIO(make_image("PNG", color="navy")), "image/png")},
+                          headers=headers).json()["avatar_url"]
+    assert ref_count(avatar) == 1
+    assert client.delete("/api/auth/delete", headers=headers).status_code == 200
+    assert ref_count(avatar) is None
+    assert not os.path.exists(stored_path(avatar))
+
+def test_static_files_serving(tmp_path):
+    import gzip
+    from starlette.responses import PlainTextResponse
+    from app.core.static_files import MediaStaticFiles
+    from app.middleware.static import StaticFilesMiddleware
+
+    # Файлы отдаются в обход middleware: без X-Request-ID и X-Cache
+    response = client.get("/static/avatars/default_avatar.png")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "no-cache"
+    assert "x-request-id" not in response.headers
+    etag = response.headers["etag"]
+    assert client.get("/static/avatars/default_avatar.png", headers={"If-None-Match": etag}).status_code == 304
+
+    response = client.get("/static/avatars/default_avatar.png", headers={"Range": "bytes=0-7"})
+    assert response.status_code == 206
+    assert response.content == b"\x89PNG\r\n\x1a\n"
+    assert response.headers["content-range"].startswith("bytes 0-7/")
+    assert client.get("/static/avatars/missing.png").status_code == 404
+    assert client.post("/static/avatars/default_avatar.png").status_code == 405
+
+    (tmp_path / "app.css").write_text("body { color: red; }" * 10)
+    (tmp_path / "app.css.gz").write_bytes(gzip.compress(b"gzipped"))
+    (tmp_path / "app.css.br").write_bytes(b"brotli")
+    (tmp_path / "photo.jpg").write_bytes(TEST_JPEG)
+    (tmp_path / "photo.jpg.gz").write_bytes(gzip.compress(TEST_JPEG))
+
+    def static_client(**options):
+        static_app = StaticFilesMiddleware(PlainTextResponse("app"), "/static", MediaStaticFiles(directory=tmp_path, **options))
+        return TestClient(static_app)
+
+    def raw_get(test_client, path, accept_encoding):
+        with test_client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+            return response.headers, b"".join(response.iter_raw())
+
+    files = static_client()
+    headers, body = raw_get(files, "/static/app.css", "gzip, br")
+    assert (headers["content-encoding"], body) == ("br", b"brotli")
+    assert headers["content-type"].startswith("text/css")
+    assert headers["vary"] == "Accept-Encoding"
+    headers, body = raw_get(files, "/static/app.css", "br;q=0, gzip")
+    assert (headers["content-encoding"], gzip.decompress(body)) == ("gzip", b"gzipped")
+    headers, body = raw_get(files, "/static/app.css", "identity")
+    assert "content-encoding" not in headers and body.startswith(b"body")
+    # Изображения уже сжаты: соседние копии не ищутся
+    headers, body = raw_get(files, "/static/photo.jpg", "gzip")
+    assert "content-encoding" not in headers and body == TEST_JPEG
+    assert files.get("/api/other").text == "app"
+
+    response = static_client(sendfile="x-accel-redirect", accel_prefix="/internal/").get("/static/app.css", headers={"Accept-Encoding": "identity"})
+    assert response.headers["x-accel-redirect"] == "/internal/app.css"
+    assert response.content == b""
+    response = static_client(sendfile="x-sendfile").get("/static/photo.jpg")
+    assert response.headers["x-sendfile"] == str(tmp_path / "photo.jpg")
+    assert response.headers["content-type"] == "image/jpeg"
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    """Локальный S3-совместимый сервер вместо MinIO: (клиент, адрес) с пустым бакетом media-test."""
+    boto3 = pytest.importorskip("boto3")
+    moto_server = pytest.importorskip("moto.server")
+
+    server = moto_server.ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    try:
+        host, port = server.get_host_and_port()
+        endpoint = f"http://{host}:{port}"
+        for name, value in {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test"}.items():
+            monkeypatch.setenv(name, value)
+        s3 = boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1")
+        s3.create_bucket(Bucket="media-test")
+        yield s3, endpoint
+    finally:
+        server.stop()
+
+def test_s3_storage_with_direct_uploads(test_db, s3_bucket, monkeypatch):
+    import base64
+    import hashlib
+    import io
+    import httpx
+    from app.core import storage
+    from app.models.media import MediaBlob
+
+    s3, endpoint = s3_bucket
+    backend = storage.S3Storage("media-test", endpoint, client=s3)
+    monkeypatch.setattr(storage, "media_storage", backend)
+    saved = []
+    original_save = backend.save
+    monkeypatch.setattr(backend, "save", lambda key, *args: (saved.append(key), original_save(key, *args)))
+    register_user("s3@example.com", "s3user", "s3password")
+    headers = {"Authorization": f"Bearer {login_user('s3user', 's3password')}"}
+    collection_id = client.post("/api/collections/create", data={"name": "S3", "description": "Test"}, headers=headers).json()["id"]
+
+    def presign(content_type="image/png", content=None):
+        body = {"content_type": content_type}
+        if content is not None:
+            body["sha256"] = base64.b64encode(hashlib.sha256(content).digest()).decode()
+        return client.post("/api/uploads/presign", json=body, headers=headers)
+
+    def direct_upload(content, content_type="image/png"):
+        form = presign(content_type, content).json()
+        # Сумма подписана в форме: S3 отклонит файл с другим содержимым
+        assert form["fields"]["x-amz-checksum-sha256"] == base64.b64encode(hashlib.sha256(content).digest()).decode()
+        response = httpx.post(form["url"], data=form["fields"], files={"file": ("photo", content, content_type)})
+        assert response.status_code == 204
+        return form["key"]
+
+    def keys():
+        return sorted(item["Key"] for item in s3.list_objects_v2(Bucket="media-test").get("Contents", []))
+
+    assert presign("text/plain").status_code == 400
+    # Байты изображения идут в бакет напрямую, API получает только ключ
+    image = make_image("PNG", color="olive")
+    key = direct_upload(image)
+    assert key.startswith("incoming/")
+    form = {
+        "name": "S3 stamp", "serial_number": "S3-1", "country": "Cloudland", "year": 2020, "circulation": 10,
+        "cost": 10.0, "perforation": "Type A", "topic": "Test Topic", "features": "Feature",
+        "collection_id": collection_id,
+    }
+    response = client.post("/api/stamps/create", data={**form, "image_key": key}, headers=headers)
+    assert response.status_code == 200
+    photo_url = response.json()["photo_url"]
+    digest = hashlib.sha256(image).hexdigest()
+    media = f"media/{digest[:2]}/{digest}"
+    assert photo_url == f"{endpoint}/media-test/{media}.png"
+    # Оригинал скопирован внутри бакета, варианты построены фоновой задачей после ответа
+    assert keys() == [f"{media}.large.webp", f"{media}.png", f"{media}.thumb.webp"]
+    assert f"{media}.png" not in saved
+    item = client.get("/api/stamps/", params={"country": "Cloudland"}).json()["items"][0]
+    assert item["thumbnail_url"] == f"{endpoint}/media-test/{media}.thumb.webp"
+    stored = s3.head_object(Bucket="media-test", Key=f"{media}.thumb.webp")
+    assert (stored["ContentType"], stored["CacheControl"]) == ("image/webp", "public, max-age=31536000, immutable")
+
+    # Обычная загрузка через API тоже попадает в бакет
+    response = client.patch("/api/settings/avatar", headers=headers,
+                            files={"file": ("me.jpg", io.BytesIO(make_image(color="maroon")), "image/jpeg")})
+    assert response.json()["avatar_url"].startswith(f"{endpoint}/media-test/media/")
+
+    # Чужой ключ, несуществующий файл и не изображение отклоняются; прямая загрузка удаляется
+    other_key = key.replace("incoming/", "incoming/0", 1)
+    assert client.post("/api/stamps/create", data={**form, "serial_number": "S3-2", "image_key": other_key}, headers=headers).status_code == 400
+    assert client.post("/api/stamps/create", data={**form, "serial_number": "S3-2", "image_key": key}, headers=headers).status_code == 400
+    bad_key = direct_upload(b"not an image", "image/png")
+    assert client.post("/api/stamps/create", data={**form, "serial_number": "S3-2", "image_key": bad_key}, headers=headers).status_code == 400
+    assert not any(name.startswith("incoming/") for name in keys())
+
+    # Запрос, отклонённый обработчиком, не оставляет файл в хранилище
+    orphan = make_image("PNG", color="purple")
+    orphan_key = direct_upload(orphan)
+    response = client.post("/api/stamps/create", data={**form, "serial_number": "S3-3", "collection_id": 999999, "image_key": orphan_key}, headers=headers)
+    assert response.status_code == 403
+    assert not any(hashlib.sha256(orphan).hexdigest() in name or name.startswith("incoming/") for name in keys())
+
+    assert client.delete(f"/api/stamps/delete/{item['id']}", headers=headers).status_code == 200
+    assert not any(name.startswith(media) for name in keys())
+    db = TestingSessionLocal()
+    try:
+        assert db.get(MediaBlob, digest) is None
+    finally:
+        db.close()
+
+def test_s3_storage_io_runs_outside_event_loop(test_db, s3_bucket, monkeypatch):
+    import asyncio
+    import hashlib
+    import io
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app.core import storage
+
+    s3, endpoint = s3_bucket
+    on_loop = []
+
+    class RecordingStorage(storage.S3Storage):
+        # С AsyncSession обработчик выполняется в run_sync прямо в потоке event loop
+        def record(self, operation):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            on_loop.append(operation)
+
+        def size(self, key):
+            self.record("size")
+            return super().size(key)
+
+        def save(self, key, source_path, content_type):
+            self.record("save")
+            super().save(key, source_path, content_type)
+
+        def delete(self, key):
+            self.record("delete")
+            super().delete(key)
+
+    monkeypatch.setattr(storage, "media_storage", RecordingStorage("media-test", endpoint, client=s3))
+    async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+    AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False)
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    def keys():
+        return sorted(item["Key"] for item in s3.list_objects_v2(Bucket="media-test").get("Contents", []))
+
+    app.dependency_overrides[get_db] = override_get_async_db
+    try:
+        register_user("asyncs3@example.com", "asyncs3user", "asyncs3pass")
+        headers = {"Authorization": f"Bearer {login_user('asyncs3user', 'asyncs3pass')}"}
+        collection_id = client.post("/api/collections/create", data={"name": "Async S3", "description": "Test"}, headers=headers).json()["id"]
+        first, second = make_image(color="teal"), make_image(color="navy")
+        stamp = create_stamp(headers, collection_id, "ASYNC-S3-1", image=first)
+        digest = hashlib.sha256(first).hexdigest()
+        first_media = f"media/{digest[:2]}/{digest}"
+        assert stamp["photo_url"] == f"{endpoint}/media-test/{first_media}.jpg"
+        assert f"{first_media}.jpg" in keys()
+
+        # Замена фото: новый файл кладётся до транзакции, старый удаляется после commit
+        response = client.patch(f"/api/stamps/update/{stamp['id']}", headers=headers, data={
+            "name": "Async S3", "serial_number": "ASYNC-S3-1", "country": "Testland", "year": 2020,
+            "circulation": 10, "cost": 10.0, "perforation": "Type A", "topic": "Test Topic", "features": "Feature",
+        }, files={"image": ("new.jpg", io.BytesIO(second), "image/jpeg")})
+        assert response.status_code == 200
+        assert not any(name.startswith(first_media) for name in keys())
+        second_media = response.json()["photo_url"].removeprefix(f"{endpoint}/media-test/").removesuffix(".jpg")
+        assert f"{second_media}.thumb.webp" in keys()
+
+        assert client.delete(f"/api/stamps/delete/{stamp['id']}", headers=headers).status_code == 200
+        assert not any(name.startswith(second_media) for name in keys())
+        assert on_loop == []
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+        asyncio.run(async_engine.dispose())
+
+def test_presign_requires_object_storage(test_db):
+    register_user("presign@example.com", "presignuser", "presignpass")
+    headers = {"Authorization": f"Bearer {login_user('presignuser', 'presignpass')}"}
+    response = client.post("/api/uploads/presign", json={"content_type": "image/jpeg"}, headers=headers)
+    assert response.status_code == 501
@@ -3,6 +3,7 @@ import { ref, computed } from 'vue'
 import type { Collection, Stamp } from '../types'
 import { useStampStore } from './stampStore'
 import { fetchWithTokenCheck } from '../utils/http'
+import { appendImage } from '../utils/upload'
 
 export const useCollectionStore = defineStore('collections', () => {
   const collections = ref<Collection[]>([])
@@ -32,7 +33,7 @@ export const useCollectionStore = defineStore('collections', () => {
     formData.append('name', collectionData.name)
     formData.append('description', collectionData.description)
     if (collectionData.imageFile) {
-      formData.append('image', collectionData.imageFile)
+      await appendImage(formData, 'image', collectionData.imageFile)
     }
 
     const token = localStorage.getItem('access_token')
@@ -79,7 +80,7 @@ export const useCollectionStore = defineStore('collections', () => {
     formData.append('name', collectionData.name)
     formData.append('description', collectionData.description)
     if (collectionData.imageFile) {
-      formData.append('image', collectionData.imageFile)
+      await appendImage(formData, 'image', collectionData.imageFile)
     }
 
     const token = localStorage.getItem('access_token')
@@ -1,57 +1,44 @@
 import { defineStore } from 'pinia'
-import { ref, computed } from 'vue'
+import { ref } from 'vue'
 import { fetchWithTokenCheck } from '../utils/http'
+import { appendImage } from '../utils/upload'
 import type { Stamp, StampFilter } from '../types'
 
 export const useStampStore = defineStore('stamps', () => {
   const stamps = ref<Stamp[]>([])
+  const nextCursor = ref<number | null>(null)
 
   const topExpensiveStamps = ref<Stamp[]>([])
 
   const loading = ref(false)
-  const filters = ref<StampFilter>({
-    search: '',
-    country: '',
-    yearFrom: null,
-    yearTo: null,
-    themes: [],
-    rarity: ''
-  })
+  // Фильтры применяет сервер (GET /api/stamps/): в браузере лежат только загруженные страницы
+  const filters = ref<StampFilter>(emptyFilters())
 
-  const filteredStamps = computed(() => {
-    return stamps.value.filter(stamp => {
-      // Search filter
-      if (filters.value.search && !stamp.name.toLowerCase().includes(filters.value.search.toLowerCase()) && 
-          !(stamp.features?.toLowerCase().includes(filters.value.search.toLowerCase()) || stamp.topic?.toLowerCase().includes(filters.value.search.toLowerCase()))) {
-        return false
-      }
-      
-      // Country filter
-      if (filters.value.country && stamp.country !== filters.value.country) {
-        return false
-      }
-      
-      // Year range filter
-      if (filters.value.yearFrom && stamp.year < filters.value.yearFrom) {
-        return false
-      }
-      if (filters.value.yearTo && stamp.year > filters.value.yearTo) {
-        return false
-      }
-      
-      // Themes filter
-      if (filters.value.themes.length > 0 && !filters.value.themes.some((theme: string) => stamp.topic?.includes(theme))) {
-        return false
-      }
-      
-      // Rarity filter
-      if (filters.value.rarity && stamp.rarity !== filters.value.rarity) {
-        return false
-      }
-      
-      return true
-    })
-  })
+  function emptyFilters(): StampFilter {
+    return {
+      country: '',
+      yearFrom: null,
+      yearTo: null,
+      topic: '',
+      costFrom: null,
+      costTo: null,
+      rarity: ''
+    }
+  }
+
+  function filterParams(cursor: number | null) {
+    const params = new URLSearchParams()
+    const { country, yearFrom, yearTo, topic, costFrom, costTo, rarity } = filters.value
+    if (cursor !== null) params.set('cursor', cursor.toString())
+    if (country) params.set('country', country)
+    if (yearFrom !== null) params.set('year_from', yearFrom.toString())
+    if (yearTo !== null) params.set('year_to', yearTo.toString())
+    if (topic) params.set('topic', topic)
+    if (costFrom !== null) params.set('cost_from', costFrom.toString())
+    if (costTo !== null) params.set('cost_to', costTo.toString())
+    if (rarity) params.set('rarity', rarity)
+    return params
+  }
 
   async function fetchStampById(id: string) {
     loading.value = true
@@ -109,30 +96,41 @@ export const useStampStore = defineStore('stamps', () => {
     }
   }
 
-  async function fetchStamps() {
+  async function fetchStamps(cursor: number | null = null) {
     loading.value = true
     try {
-      const response = await fetchWithTokenCheck('http://localhost:8000/api/stamps')
+      const params = filterParams(cursor).toString()
+      const response = await fetchWithTokenCheck(`http://localhost:8000/api/stamps/${params ? `?${params}` : ''}`)
       if (!response.ok) {
         throw new Error('Failed to fetch stamps')
       }
       const data = await response.json()
-      stamps.value = data
+      // Сервер отдаёт страницу и курсор следующей страницы
+      stamps.value = cursor !== null ? [...stamps.value, ...data.items] : data.items
+      nextCursor.value = data.next_cursor
     } finally {
       loading.value = false
     }
   }
 
+  // Следующая страница с теми же фильтрами; null в nextCursor — страниц больше нет
+  async function fetchMoreStamps() {
+    if (nextCursor.value === null) return
+    await fetchStamps(nextCursor.value)
+  }
+
   async function fetchStampsBySearch(query: string) {
     loading.value = true
     try {
-      const response = await fetchWithTokenCheck(`http://localhost:8000/search/search?q=${encodeURIComponent(query)}`)
+      const response = await fetchWithTokenCheck(`http://localhost:8000/api/search/?q=${encodeURIComponent(query)}`)
       if (!response.ok) {
         throw new Error('Failed to fetch stamps by search')
       }
       const data = await response.json()
-      // Update stamps with the stamps from search results
+      // Сервер отдаёт марки, отсортированные по релевантности (первая страница)
       stamps.value = data.stamps
+      // Курсор каталога к результатам поиска не относится
+      nextCursor.value = null
     } finally {
       loading.value = false
     }
@@ -174,14 +172,7 @@ export const useStampStore = defineStore('stamps', () => {
   }
 
   function resetFilters() {
-    filters.value = {
-      search: '',
-      country: '',
-      yearFrom: null,
-      yearTo: null,
-      themes: [],
-      rarity: ''
-    }
+    filters.value = emptyFilters()
   }
 
   async function createStamp(collectionId: string, stampData: any, imageFile: File) {
@@ -201,7 +192,7 @@ export const useStampStore = defineStore('stamps', () => {
       formData.append('perforation', stampData.perforation || '')
       formData.append('topic', stampData.topic || '')
       formData.append('features', stampData.features || '')
-      formData.append('image', imageFile)
+      await appendImage(formData, 'image', imageFile)
       formData.append('collection_id', collectionId)
 
       const token = localStorage.getItem('access_token')
@@ -237,7 +228,7 @@ export const useStampStore = defineStore('stamps', () => {
     formData.append('topic', stampData.topic)
     formData.append('features', stampData.features)
     if (stampData.imageFile) {
-      formData.append('image', stampData.imageFile)
+      await appendImage(formData, 'image', stampData.imageFile)
     }
 
     const token = localStorage.getItem('access_token')
@@ -270,16 +261,17 @@ export const useStampStore = defineStore('stamps', () => {
 
   return { 
     stamps, 
+    nextCursor,
     topExpensiveStamps,
     loading, 
     filters,
-    filteredStamps,
     getStampById,
     getRelatedStamps,
     setFilter,
     resetFilters,
     fetchStampById,
     fetchStamps,
+    fetchMoreStamps,
     fetchStampsBySearch,
     fetchGroupedRareStamps,
     fetchTopExpensiveStamps,
@@ -13,6 +13,7 @@ export interface Profile {
   id: number
   username: string
   avatar_url: string
+  avatar_thumbnail_url?: string | null
   country: string
   first_name: string
   last_name: string
@@ -32,18 +33,22 @@ export interface Stamp {
   topic?: string
   features?: string
   photo_url: string
+  thumbnail_url?: string | null  // уменьшенная копия для карточек; null — показывать оригинал
+  large_url?: string | null  // копия для детальной страницы
   rarity: string
   collection_id: number
   collector_id: number
 }
 
+// Параметры фильтрации GET /api/stamps/
 export interface StampFilter {
-  search: string
   country: string
   yearFrom: number | null
   yearTo: number | null
-  themes: string[]
-  rarity: string
+  topic: string
+  costFrom: number | null
+  costTo: number | null
+  rarity: string  // 'Редкая' | 'Обычная' | '' — любая
 }
 
 export interface Collection {
@@ -51,6 +56,8 @@ export interface Collection {
   name: string
   description: string
   photo_url: string
+  thumbnail_url?: string | null
+  large_url?: string | null
   stamps: Stamp[]  // 👈 обязательно
   featured?: boolean
   collector_id: number
@@ -60,6 +67,7 @@ export interface Collector {
   id: string
   username: string
   avatar_url: string
+  avatar_thumbnail_url?: string | null
   country: string 
   phone_number: string
   first_name: string
@@ -0,0 +1,8 @@
+// Обработчик @error для <img> с уменьшенной копией: если копии нет (старая загрузка)
+// или она ещё строится (прямая загрузка в хранилище), показывается оригинал
+export function showOriginal(event: Event, original: string | null | undefined) {
+  const image = event.target as HTMLImageElement
+  if (original && image.src !== original) {
+    image.src = original
+  }
+}
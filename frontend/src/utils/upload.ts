@@ -0,0 +1,43 @@
+import { fetchWithTokenCheck } from './http'
+
+// null — ещё неизвестно, поддерживает ли backend прямую загрузку (STORAGE_BACKEND=s3)
+let directUploads: boolean | null = null
+
+// SHA-256 файла в base64: хранилище сверяет с ним загруженное содержимое
+async function sha256Base64(file: File) {
+  const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', await file.arrayBuffer()))
+  return btoa(String.fromCharCode(...digest))
+}
+
+// Добавляет изображение в форму: при S3 файл загружается прямо в хранилище и в форму попадает
+// только ключ ({field}_key), иначе файл отправляется в форме как раньше
+export async function appendImage(formData: FormData, field: string, file: File) {
+  if (directUploads !== false) {
+    const token = localStorage.getItem('access_token')
+    const response = await fetchWithTokenCheck('http://127.0.0.1:8000/api/uploads/presign', {
+      method: 'POST',
+      body: JSON.stringify({ content_type: file.type, sha256: await sha256Base64(file) }),
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${token}`
+      },
+      credentials: 'include'
+    })
+    if (response.status === 501) {
+      directUploads = false
+    } else if (response.ok) {
+      directUploads = true
+      const { key, url, fields } = await response.json()
+      const upload = new FormData()
+      Object.entries(fields as Record<string, string>).forEach(([name, value]) => upload.append(name, value))
+      upload.append('file', file)
+      const stored = await fetch(url, { method: 'POST', body: upload })
+      if (!stored.ok) {
+        throw new Error('Failed to upload image')
+      }
+      formData.append(`${field}_key`, key)
+      return
+    }
+  }
+  formData.append(field, file)
+}